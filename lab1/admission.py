@@ -0,0 +1,69 @@
+# ограничение одновременных запросов (admission control)
+#
+# если запросов больше чем цикл событий успевает обработать, каждый новый
+# только удлиняет очередь и все ответы становятся медленными. поэтому
+# сверх max_concurrent запросов сразу отвечаем 503 с Retry-After, ничего не
+# делая: клиент повторит позже, а те кто уже внутри досчитаются быстро
+#
+# счётчик - обычное число: middleware работает в цикле событий процесса
+# (у каждого воркера свой лимит). долгие соединения (поток изменений,
+# метрики, профиль воркера) в лимит не входят, как и long-poll ленты
+# изменений (GET /books/changes?wait=N): до минуты он просто ждёт событий
+# и занимал бы место тех, кто реально считает
+
+from urllib.parse import parse_qsl
+
+from metrics import registry
+
+EXEMPT_PATHS = frozenset({"/metrics", "/books/changes/stream", "/admin/profile"})
+# пути где запрос с параметром wait > 0 - это long-poll
+LONG_POLL_PATHS = frozenset({"/books/changes"})
+
+registry.describe("http_requests_shed_total", "Запросы отклонённые с 503 из-за перегрузки")
+
+
+def _long_poll(scope):
+    for name, value in parse_qsl(scope["query_string"].decode("latin-1")):
+        if name == "wait":
+            try:
+                return float(value) > 0
+            except ValueError:
+                return False
+    return False
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, max_concurrent, retry_after=1, exempt=EXEMPT_PATHS, long_poll=LONG_POLL_PATHS):
+        self.app = app
+        self.max_concurrent = max_concurrent
+        self.retry_after = str(retry_after).encode()
+        self.exempt = exempt
+        self.long_poll = long_poll
+        self.in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http" or not self.max_concurrent or scope["path"] in self.exempt
+            or (scope["path"] in self.long_poll and _long_poll(scope))
+        ):
+            return await self.app(scope, receive, send)
+        if self.in_flight >= self.max_concurrent:
+            registry.inc("http_requests_shed_total")
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", self.retry_after),
+                ],
+            })
+            await send({
+                "type": "http.response.body",
+                "body": '{"detail":"Сервер перегружен, повторите позже"}'.encode(),
+            })
+            return
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
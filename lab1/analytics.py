@@ -0,0 +1,238 @@
+# колоночный движок для отчётов: GET /books/query и GET /books/stats
+#
+# отчёты (сколько книжек у каждого автора, доля прочитанных, выборка по
+# длинному списку авторов) раньше шли циклом по всем книжкам. тут рядом с
+# записями хранилища лежат колонки:
+#   ids       - айдишники (array "q")
+#   authors   - номер автора в словаре авторов (array "l")
+#   completed - 1 / 0 / -1 если поля нет (array "b")
+#   alive     - 1 если книжка не удалена (bytearray)
+# колонки обновляются при каждой записи как индексы из indexes.py (у
+# удалённой книжки только сбрасывается alive, строки чистятся пачкой).
+#
+# если установлен numpy, условия считаются масками над всеми строками
+# сразу, а группировка по авторам - через bincount, без цикла по книжкам
+# в питоне. numpy-копии колонок пересобираются только после записей.
+# без numpy - тот же результат обычным циклом по колонкам. сам numpy
+# импортируется на первом отчёте, а не при старте (это ~40 мс импорта)
+#
+# условия: authors (точное совпадение с любым из списка), completed,
+# id_min / id_max (включительно). у книжек без поля completed условие
+# completed не выполняется, как в filter
+
+import importlib.util
+from array import array
+from bisect import bisect_right
+
+HAVE_NUMPY = importlib.util.find_spec("numpy") is not None
+np = None
+
+
+def _numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+
+class ColumnIndex:
+    # индекс по всей записи: хранилище трогает его при любом изменении
+    field = None
+
+    def __init__(self, vectorized=None):
+        # None - numpy если он установлен
+        self.vectorized = HAVE_NUMPY if vectorized is None else vectorized
+        if self.vectorized and not HAVE_NUMPY:
+            raise RuntimeError("Для колоночного движка нужен numpy")
+        self._ids = array("q")
+        self._authors = array("l")
+        self._completed = array("b")
+        self._alive = bytearray()
+        # айдишник -> номер строки
+        self._rows = {}
+        self._dead = 0
+        # словарь авторов: номер -> имя и имя -> номер
+        self._names = []
+        self._codes = {}
+        # растёт при каждой записи, по нему пересобираем numpy-колонки
+        self._generation = 0
+        self._cache = None
+
+    def add(self, record):
+        code = self._codes.get(record.author)
+        if code is None:
+            code = self._codes[record.author] = len(self._names)
+            self._names.append(record.author)
+        completed = -1 if record.completed is None else int(record.completed)
+        row = self._rows.get(record.id)
+        if row is None:
+            self._rows[record.id] = len(self._ids)
+            self._ids.append(record.id)
+            self._authors.append(code)
+            self._completed.append(completed)
+            self._alive.append(1)
+        else:
+            self._authors[row] = code
+            self._completed[row] = completed
+            if not self._alive[row]:
+                self._alive[row] = 1
+                self._dead -= 1
+        self._generation += 1
+
+    def remove(self, record):
+        row = self._rows.get(record.id)
+        if row is None or not self._alive[row]:
+            return
+        self._alive[row] = 0
+        self._dead += 1
+        self._generation += 1
+        if self._dead > len(self._rows) - self._dead:
+            self._compact()
+
+    # выкидываем удалённые строки и авторов без книжек
+    def _compact(self):
+        rows = [row for row in range(len(self._ids)) if self._alive[row]]
+        names = []
+        codes = {}
+        authors = array("l")
+        for row in rows:
+            name = self._names[self._authors[row]]
+            code = codes.get(name)
+            if code is None:
+                code = codes[name] = len(names)
+                names.append(name)
+            authors.append(code)
+        self._ids = array("q", (self._ids[row] for row in rows))
+        self._completed = array("b", (self._completed[row] for row in rows))
+        self._authors = authors
+        self._alive = bytearray(b"\x01" * len(rows))
+        self._rows = {book_id: row for row, book_id in enumerate(self._ids)}
+        self._names = names
+        self._codes = codes
+        self._dead = 0
+
+    # numpy-копии колонок (и порядок авторов по имени) для этой версии
+    def _columns(self):
+        _numpy()
+        if self._cache is None or self._cache[0] != self._generation:
+            order = sorted(range(len(self._names)), key=self._names.__getitem__)
+            ranks = np.empty(len(order), dtype=np.int64)
+            ranks[order] = np.arange(len(order))
+            self._cache = (
+                self._generation,
+                np.frombuffer(self._ids, dtype=np.int64).copy(),
+                np.frombuffer(self._authors, dtype=np.dtype(f"i{self._authors.itemsize}")).copy(),
+                np.frombuffer(self._completed, dtype=np.int8).copy(),
+                np.frombuffer(self._alive, dtype=np.bool_).copy(),
+                ranks,
+            )
+        return self._cache[1:]
+
+    def _mask(self, authors, completed, id_min, id_max):
+        ids, codes, done, alive, _ = self._columns()
+        mask = alive.copy()
+        if authors:
+            wanted = [self._codes[a] for a in set(authors) if a in self._codes]
+            mask &= np.isin(codes, wanted)
+        if completed is not None:
+            mask &= done == int(completed)
+        if id_min is not None:
+            mask &= ids >= id_min
+        if id_max is not None:
+            mask &= ids <= id_max
+        return mask
+
+    # номера подходящих строк без numpy
+    def _matching_rows(self, authors, completed, id_min, id_max):
+        wanted = None
+        if authors:
+            wanted = {self._codes[a] for a in authors if a in self._codes}
+        completed = None if completed is None else int(completed)
+        ids, codes, done, alive = self._ids, self._authors, self._completed, self._alive
+        for row in range(len(ids)):
+            if not alive[row]:
+                continue
+            if wanted is not None and codes[row] not in wanted:
+                continue
+            if completed is not None and done[row] != completed:
+                continue
+            if id_min is not None and ids[row] < id_min:
+                continue
+            if id_max is not None and ids[row] > id_max:
+                continue
+            yield row
+
+    # айдишники подходящих книжек по возрастанию, after/offset/limit как
+    # в BookStore.page
+    def select(self, authors=None, completed=None, id_min=None, id_max=None,
+               after=None, offset=0, limit=None):
+        if self.vectorized:
+            ids = self._columns()[0]
+            found = np.sort(ids[self._mask(authors, completed, id_min, id_max)])
+            start = 0 if after is None else int(np.searchsorted(found, after, side="right"))
+            ids = found[start + offset:None if limit is None else start + offset + limit].tolist()
+        else:
+            found = sorted(self._ids[row] for row in self._matching_rows(authors, completed, id_min, id_max))
+            start = 0 if after is None else bisect_right(found, after)
+            ids = found[start + offset:None if limit is None else start + offset + limit]
+        return ids
+
+    # сводка по подходящим книжкам: всего, прочитано / нет / без поля и
+    # авторы по убыванию числа книжек (при равенстве - по имени), top
+    # первых авторов (None - все)
+    def stats(self, authors=None, completed=None, id_min=None, id_max=None, top=None):
+        if self.vectorized:
+            _, codes, done, _, ranks = self._columns()
+            mask = self._mask(authors, completed, id_min, id_max)
+            codes = codes[mask]
+            done = done[mask]
+            total = len(codes)
+            finished = int(np.count_nonzero(done == 1))
+            unfinished = int(np.count_nonzero(done == 0))
+            counts = np.bincount(codes, minlength=len(self._names))
+            completed_counts = np.bincount(codes[done == 1], minlength=len(self._names))
+            present = np.flatnonzero(counts)
+            order = present[np.lexsort((ranks[present], -counts[present]))]
+            groups = [
+                (self._names[code], int(counts[code]), int(completed_counts[code]))
+                for code in order[:top].tolist()
+            ]
+            author_count = len(present)
+        else:
+            total = finished = unfinished = 0
+            counts = {}
+            completed_counts = {}
+            for row in self._matching_rows(authors, completed, id_min, id_max):
+                code = self._authors[row]
+                total += 1
+                counts[code] = counts.get(code, 0) + 1
+                if self._completed[row] == 1:
+                    finished += 1
+                    completed_counts[code] = completed_counts.get(code, 0) + 1
+                elif self._completed[row] == 0:
+                    unfinished += 1
+            order = sorted(counts, key=lambda code: (-counts[code], self._names[code]))
+            groups = [
+                (self._names[code], counts[code], completed_counts.get(code, 0))
+                for code in order[:top]
+            ]
+            author_count = len(counts)
+        return stats_result(total, finished, unfinished, author_count, groups)
+
+
+# ответ GET /books/stats (один и тот же для всех хранилищ)
+# groups - (автор, книжек, прочитано) в нужном порядке
+def stats_result(total, finished, unfinished, author_count, groups):
+    return {
+        "count": total,
+        "completed": finished,
+        "not_completed": unfinished,
+        "unknown": total - finished - unfinished,
+        "completed_ratio": finished / total if total else None,
+        "author_count": author_count,
+        "authors": [
+            {"author": name, "count": count, "completed": done, "completed_ratio": done / count}
+            for name, count, done in groups
+        ],
+    }
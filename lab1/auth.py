@@ -1,5 +1,12 @@
-from fastapi import Depends, HTTPException, status, Security
+import math
+import time
+from fastapi import Depends, HTTPException, Request, status, Security
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from metrics import add_phase
+from ratelimit import make_limiter
+from settings import Settings
+from tokens import make_token_backend
 
 # экземпляр схме аутентификации
 bearer_scheme = HTTPBearer()
@@ -10,35 +17,100 @@ users_db = {
     "user_token": {"username": "user", "is_admin": False}
 }
 
+# настройки, токены и лимиты; create_app (main.py) может задать другие
+settings = None
+token_backend = None
+read_limiter = None
+admin_limiter = None
+
+
+def configure(new_settings):
+    global settings, token_backend, read_limiter, admin_limiter
+    settings = new_settings
+    # чем выдаём и проверяем токены (см. tokens.py)
+    token_backend = make_token_backend(settings, users_db)
+    # ограничение частоты запросов на пользователя: отдельно чтение и запись
+    # админа (см. ratelimit.py), None - без ограничения
+    read_limiter = make_limiter(
+        settings.rate_limit_backend, settings.rate_limit_read, settings.rate_limit_read_burst,
+        settings.rate_limit_max_keys, settings.rate_limit_db_path, "read_buckets",
+    )
+    admin_limiter = make_limiter(
+        settings.rate_limit_backend, settings.rate_limit_admin, settings.rate_limit_admin_burst,
+        settings.rate_limit_max_keys, settings.rate_limit_db_path, "admin_buckets",
+    )
+
+
+configure(Settings.from_env())
+
+
+# забираем жетон у пользователя, 429 если их нет
+async def check_rate(limiter, user):
+    if limiter is None:
+        return
+    if limiter.blocking:
+        wait = await run_in_threadpool(limiter.acquire, user["username"])
+    else:
+        wait = limiter.acquire(user["username"])
+    if wait > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Слишком много запросов",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
 
 # проверка на юзера
-def get_current_user(
+# fastapi вызывает её один раз за запрос, даже если от неё зависят и
+# is_authenticated и is_admin_user, а результат кладём в request.state.user
+# зависимости async: проверка токена быстрая, а синхронные fastapi гонял
+# бы через пул потоков на каждый запрос
+async def get_current_user(
+    request: Request,
     # получаем данные пользователя
     credentials: HTTPAuthorizationCredentials = Security(bearer_scheme)
 ):
+    # время проверки идёт в фазу auth метрик (см. metrics.py)
+    start = time.perf_counter()
     # достаем токен
     token = credentials.credentials
-    # если есть такой токен получаем данные пользователя
-    user = users_db.get(token)
+    # если токен верный получаем данные пользователя
+    user = token_backend.verify(token)
+    add_phase("auth", time.perf_counter() - start)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный токен"
         )
+    request.state.user = user
     return user
 
 
-# проверка на авторизованность
-def is_authenticated(user: dict = Depends(get_current_user)):
+# проверка на авторизованность (и лимит на чтение)
+async def is_authenticated(user: dict = Depends(get_current_user)):
+    await check_rate(read_limiter, user)
     return user
 
 
-# проверка на админа
-def is_admin_user(user: dict = Depends(get_current_user)):
+# проверка на админа (и лимит на запись)
+async def is_admin_user(user: dict = Depends(get_current_user)):
     # если не админ - доступ запрещен
     if not user.get("is_admin"):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Требуется доступ администратора"
         )
+    await check_rate(admin_limiter, user)
     return user
+
+
+# токен админа в значении заголовка Authorization (для middleware, где
+# зависимостей fastapi нет, см. profiler.py)
+def is_admin_token(authorization):
+    if not authorization:
+        return False
+    scheme, _, token = authorization.decode("latin-1").partition(" ")
+    if scheme.lower() != "bearer":
+        return False
+    user = token_backend.verify(token.strip())
+    return bool(user and user.get("is_admin"))
@@ -0,0 +1,86 @@
+# бенчмарк отчётов (GET /books/query и /books/stats) на уровне хранилища
+# запуск из папки lab1:  python -m benchmarks.bench_analytics
+#
+# сравниваем перебор словарей книжек (как раньше считали отчёты) с
+# колонками analytics.py: циклом в питоне и масками numpy (если он
+# установлен). отдельно - первый запрос после записи, когда numpy-копии
+# колонок пересобираются. без limit выборка упирается в сборку словарей
+# для ответа, а не в сам отбор
+
+import random
+import time
+
+from analytics import HAVE_NUMPY
+from store import BookStore
+from tests.test_analytics import reference_query, reference_stats
+
+SIZES = [100_000, 1_000_000]
+AUTHORS = 5_000
+
+
+def make_books(n):
+    rng = random.Random(0)
+    return [
+        {
+            "id": i,
+            "title": f"Книга {i}",
+            "author": f"Автор {rng.randint(1, AUTHORS)}",
+            "completed": rng.random() < 0.4,
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def best(fn, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    rng = random.Random(1)
+    many = [f"Автор {rng.randint(1, AUTHORS)}" for _ in range(500)]
+    cases = [
+        ("stats", "весь каталог", {}),
+        ("stats", "completed, id 1/4..3/4", {"completed": True}),
+        ("query", "500 авторов", {"authors": many}),
+        ("query", "500 авторов, completed", {"authors": many, "completed": True}),
+        ("query", "500 авторов, страница 50", {"authors": many, "limit": 50}),
+    ]
+    engines = ["python"] + (["numpy"] if HAVE_NUMPY else [])
+    for n in SIZES:
+        books = make_books(n)
+        stores = {engine: BookStore(books, vectorized=engine == "numpy") for engine in engines}
+        records = stores["python"].all()
+        print(f"книг {n}")
+        print(f"  {'запрос':<32} {'перебор, мс':>12}" + "".join(f" {e + ', мс':>12}" for e in engines))
+        for kind, name, query in cases:
+            if "id 1/4" in name:
+                query = {**query, "id_min": n // 4, "id_max": 3 * n // 4}
+            if kind == "stats":
+                reference = reference_stats
+            else:
+                # перебор не умеет страницы: отбираем всё и режем
+                def reference(records, limit=None, **query):
+                    return reference_query(records, **query)[:limit]
+            row = best(lambda: reference(records, **query))
+            line = f"  {kind + ' ' + name:<32} {row * 1e3:>12.1f}"
+            for engine, store in stores.items():
+                method = getattr(store, kind)
+                assert method(**query) == reference(records, **query)
+                line += f" {best(lambda: method(**query)) * 1e3:>12.1f}"
+            print(line, flush=True)
+        if HAVE_NUMPY:
+            store = stores["numpy"]
+            store.update(1, completed=False)
+            start = time.perf_counter()
+            store.stats()
+            print(f"  первый stats после записи (numpy): {(time.perf_counter() - start) * 1e3:.1f} мс")
+        del stores, records, books
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# бенчмарк стоимости проверки токена на запрос
+# запуск из папки lab1:  python -m benchmarks.bench_auth
+#
+# сравниваем статические токены, hmac без кэша (каждый раз подпись и json)
+# и hmac с кэшем проверенных токенов, плюс полный запрос через ASGI
+
+import asyncio
+import timeit
+
+from httpx import ASGITransport, AsyncClient
+
+from tokens import HMACTokenBackend, StaticTokenBackend
+
+N = 100_000
+USER = {"username": "admin", "is_admin": True}
+
+
+def per_call(fn):
+    return timeit.timeit(fn, number=N) / N * 1e6
+
+
+async def per_request(app, headers, n=2_000):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+        start = asyncio.get_running_loop().time()
+        for _ in range(n):
+            await client.get("/books/1", headers=headers)
+        return (asyncio.get_running_loop().time() - start) / n * 1e6
+
+
+def main():
+    static = StaticTokenBackend({"admin_token": USER})
+    cached = HMACTokenBackend("secret")
+    token = cached.issue(USER)
+    uncached = HMACTokenBackend("secret", cache_size=0)
+    print(f"static:           {per_call(lambda: static.verify('admin_token')):8.2f} мкс")
+    print(f"hmac без кэша:    {per_call(lambda: uncached.verify(token)):8.2f} мкс")
+    print(f"hmac с кэшем:     {per_call(lambda: cached.verify(token)):8.2f} мкс")
+
+    import auth
+    from main import app
+    print(f"GET /books/1 (static): {asyncio.run(per_request(app, {'Authorization': 'Bearer admin_token'})):8.1f} мкс")
+    auth.token_backend = cached
+    print(f"GET /books/1 (hmac):   {asyncio.run(per_request(app, {'Authorization': f'Bearer {token}'})):8.1f} мкс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+# бенчмарк загрузки книжек: по одной через POST /books против POST /books/bulk
+# запуск из папки lab1:  python -m benchmarks.bench_bulk
+#
+# запросы идут через тот же ASGITransport что и в тестах, без сети
+
+import asyncio
+import time
+
+from httpx import ASGITransport, AsyncClient
+
+from main import app
+
+N = 5_000
+BATCH = 1_000
+
+
+async def main():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+        res = await client.post("/token", data={"username": "admin", "password": "admin"})
+        headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+        payload = [{"title": f"Книга {i}", "author": f"Автор {i % 100}"} for i in range(N)]
+
+        start = time.perf_counter()
+        for book in payload:
+            await client.post("/books", json=book, headers=headers)
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(0, N, BATCH):
+            await client.post("/books/bulk", json=payload[i:i + BATCH], headers=headers)
+        bulk = time.perf_counter() - start
+
+    print(f"по одной:        {N / single:>10.0f} книг/с")
+    print(f"пакетами по {BATCH}: {N / bulk:>10.0f} книг/с  (x{single / bulk:.1f})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+# бенчмарк сжатия ответов (compression.py): байты на проводе и CPU на запрос
+# запуск из папки lab1:  python -m benchmarks.bench_compression
+#
+# GET /books (весь каталог) и GET /books/filter по одному автору (десятая
+# часть каталога) для каждой кодировки: identity, gzip и zstd / br если
+# установлены zstandard и brotli. CPU - process_time на запрос (приложение
+# и клиент в одном процессе, клиент тело не распаковывает):
+#   без кэша - кэш ответов выключен, каждое тело кодируется и сжимается заново
+#   с кэшем  - сжатый вариант берётся из записи кэша
+# отдельно - сколько миллисекунд сжимается само тело (столько цикл событий
+# стоял бы без пула потоков)
+
+import asyncio
+import time
+
+from httpx import ASGITransport, AsyncClient
+
+import main
+from compression import AVAILABLE, compress
+from store import BookStore
+
+SIZES = [1_000, 10_000, 100_000]
+REQUESTS = 20
+AUTH = {"Authorization": "Bearer user_token"}
+
+
+def make_books(n):
+    return [
+        {"id": i, "title": f"Книга номер {i}", "author": f"Автор {i % 10}", "completed": i % 2 == 0}
+        for i in range(1, n + 1)
+    ]
+
+
+# байты тела как они пришли, без распаковки на клиенте
+async def fetch(client, path, params, encoding):
+    headers = {**AUTH, "Accept-Encoding": encoding}
+    async with client.stream("GET", path, params=params, headers=headers) as res:
+        assert res.status_code == 200
+        assert res.headers.get("content-encoding", "identity") == encoding
+        return b"".join([chunk async for chunk in res.aiter_raw()])
+
+
+async def measure(client, path, params, encoding):
+    wire = len(await fetch(client, path, params, encoding))
+    start = time.process_time()
+    for _ in range(REQUESTS):
+        await fetch(client, path, params, encoding)
+    return wire, (time.process_time() - start) / REQUESTS
+
+
+async def bench():
+    main.start()
+    encodings = ("identity",) + AVAILABLE
+    print(f"кодировки: {', '.join(encodings)}")
+    transport = ASGITransport(app=main.app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+        for n in SIZES:
+            main.books = BookStore(make_books(n))
+            print(f"книг {n}")
+            print(f"  {'запрос':<14} {'кодировка':<10} {'байт':>10} {'сжатие, мс':>11}"
+                  f" {'CPU без кэша, мс':>17} {'CPU с кэшем, мс':>16}")
+            for name, path, params in (("/books", "/books", {}), ("/books/filter", "/books/filter", {"author": "Автор 1"})):
+                for encoding in encodings:
+                    main.response_cache.clear()
+                    max_bytes = main.response_cache.max_bytes
+                    main.response_cache.max_bytes = 0
+                    wire, uncached = await measure(client, path, params, encoding)
+                    main.response_cache.max_bytes = max_bytes
+                    _, cached = await measure(client, path, params, encoding)
+                    body = await fetch(client, path, params, "identity")
+                    if encoding == "identity":
+                        alone = 0.0
+                    else:
+                        start = time.perf_counter()
+                        compress(body, encoding)
+                        alone = time.perf_counter() - start
+                    print(f"  {name:<14} {encoding:<10} {wire:>10} {alone * 1e3:>11.2f}"
+                          f" {uncached * 1e3:>17.2f} {cached * 1e3:>16.2f}", flush=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(bench())
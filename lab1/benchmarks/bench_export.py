@@ -0,0 +1,54 @@
+# бенчмарк памяти при выгрузке всего каталога
+# запуск из папки lab1:  python -m benchmarks.bench_export
+#
+# старый путь собирает весь список и кодирует его одной строкой, потоковый
+# (export.iter_export) держит в памяти только одну пачку. пиковая память
+# потокового варианта не должна зависеть от размера каталога
+
+import json
+import tracemalloc
+
+from export import iter_export
+from store import BookStore
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+
+def make_store(n):
+    return BookStore(
+        {"id": i, "title": f"Книга номер {i}", "author": f"Автор {i % 1000}", "completed": i % 2 == 0}
+        for i in range(1, n + 1)
+    )
+
+
+# пиковая память сверх уже занятой хранилищем
+def peak(fn):
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    fn()
+    return tracemalloc.get_traced_memory()[1] - base
+
+
+def whole_list(store):
+    json.dumps(store.all(), ensure_ascii=False).encode()
+
+
+def streamed(store, fmt):
+    for _ in iter_export(store, fmt):
+        pass
+
+
+def main():
+    tracemalloc.start()
+    print(f"{'книг':>10} {'весь список, МБ':>16} {'ndjson, МБ':>11} {'json, МБ':>9}")
+    for n in SIZES:
+        store = make_store(n)
+        old = peak(lambda: whole_list(store))
+        ndjson = peak(lambda: streamed(store, "ndjson"))
+        array = peak(lambda: streamed(store, "json"))
+        print(f"{n:>10} {old / 2**20:>16.2f} {ndjson / 2**20:>11.2f} {array / 2**20:>9.2f}")
+        del store
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# бенчмарк GET /books/filter на уровне хранилища
+# запуск из папки lab1:  python -m benchmarks.bench_filter
+#
+# сравниваем старый фильтр списковыми включениями с индексами BookStore
+
+import random
+import timeit
+
+from store import BookStore
+from tests.test_indexes import reference_filter
+
+SIZES = [1_000, 100_000, 300_000]
+QUERIES = [
+    {"title": "python"},
+    {"author": "автор 4"},
+    {"title": "книга 123", "completed": True},
+    {"title": "py", "author": "7"},
+]
+
+
+def make_books(n):
+    rng = random.Random(0)
+    topics = ["Python", "Go", "Rust", "Backend", "Асинхронность", "Базы данных"]
+    return [
+        {
+            "id": i,
+            "title": f"{rng.choice(topics)}: книга {i}",
+            "author": f"Автор {rng.randint(1, 5000)}",
+            "completed": i % 2 == 0,
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def main():
+    print(f"{'книг':>8}  {'запрос':<40} {'список, мс':>11} {'индекс, мс':>11}")
+    for n in SIZES:
+        books = make_books(n)
+        store = BookStore(books)
+        for query in QUERIES:
+            assert store.filter(**query) == reference_filter(books, **query)
+            old = timeit.timeit(lambda: reference_filter(books, **query), number=3) / 3
+            new = timeit.timeit(lambda: store.filter(**query), number=3) / 3
+            print(f"{n:>8}  {str(query):<40} {old * 1e3:>11.2f} {new * 1e3:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
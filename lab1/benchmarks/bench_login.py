@@ -0,0 +1,99 @@
+# нагрузочный тест: задержка чтения книжек во время шквала входов
+# запуск из папки lab1:  python -m benchmarks.bench_login
+#
+# параллельно идут GET /books/1 и пачка POST /token. сравниваем проверку
+# пароля в пуле потоков (как в main.py) с проверкой прямо в цикле событий:
+# во втором случае каждый scrypt останавливает все остальные запросы
+#
+# нагрузка открытая: чтения стартуют по расписанию (раз в READ_PERIOD), и
+# задержка считается от запланированного старта. если цикл событий стоит
+# на scrypt, запрос начнётся позже и это войдёт в его задержку (при
+# замкнутом цикле "запрос - sleep - запрос" остановка пряталась бы в
+# sleep клиента). отдельно меряем лаг цикла событий: насколько позже
+# положенного просыпается asyncio.sleep
+
+import asyncio
+import statistics
+
+from httpx import ASGITransport, AsyncClient
+
+import main
+from main import app
+from users import verify_password
+
+READS = 300
+LOGINS = 40
+# чтения стартуют раз в READ_PERIOD секунд, лаг цикла меряем раз в PROBE_PERIOD
+READ_PERIOD = 0.005
+PROBE_PERIOD = 0.001
+
+
+# проверка пароля прямо в цикле событий (как было бы без пула)
+class InlineVerifier:
+    def __init__(self, verifier):
+        self._verifier = verifier
+
+    def retry_after(self, username):
+        return 0
+
+    async def authenticate(self, username, password):
+        user = self._verifier.users.get(username)
+        if user is None or not verify_password(password, user["password_hash"]):
+            return None
+        return {"username": user["username"], "is_admin": user["is_admin"]}
+
+
+async def run(client, headers, logins=LOGINS):
+    loop = asyncio.get_running_loop()
+    latencies = []
+    lags = []
+    start = loop.time()
+
+    async def read(i):
+        scheduled = start + i * READ_PERIOD
+        await asyncio.sleep(max(0.0, scheduled - loop.time()))
+        await client.get("/books/1", headers=headers)
+        latencies.append(loop.time() - scheduled)
+
+    async def login(i):
+        # входы растянуты по времени чтения
+        await asyncio.sleep(i * 0.01)
+        await client.post("/token", data={"username": "admin", "password": "admin"})
+
+    async def probe():
+        while True:
+            before = loop.time()
+            await asyncio.sleep(PROBE_PERIOD)
+            lags.append(loop.time() - before - PROBE_PERIOD)
+
+    probing = asyncio.ensure_future(probe())
+    try:
+        await asyncio.gather(*(read(i) for i in range(READS)), *(login(i) for i in range(logins)))
+    finally:
+        probing.cancel()
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99)], latencies[-1], max(lags)
+
+
+def report(name, p50, p99, worst, lag):
+    print(f"{name:<22} p50 {p50 * 1e3:7.2f} мс   p99 {p99 * 1e3:7.2f} мс   "
+          f"max {worst * 1e3:7.2f} мс   лаг цикла {lag * 1e3:7.2f} мс")
+
+
+async def bench():
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+        res = await client.post("/token", data={"username": "user", "password": "user"})
+        headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+        main_verifier = main.password_verifier
+        report("без входов", *await run(client, headers, logins=0))
+        report("входы в пуле потоков", *await run(client, headers))
+        main.password_verifier = InlineVerifier(main_verifier)
+        try:
+            report("входы в цикле событий", *await run(client, headers))
+        finally:
+            main.password_verifier = main_verifier
+
+
+if __name__ == "__main__":
+    asyncio.run(bench())
@@ -0,0 +1,48 @@
+# бенчмарк памяти на книжку: словари против Book со __slots__
+# запуск из папки lab1:  python -m benchmarks.bench_memory
+#
+# tracemalloc считает всё что выделено при построении каталога, включая
+# строки. "записи" - только сами книжки, "хранилище" - BookStore целиком
+# (с индексами для фильтрации)
+
+import sys
+import tracemalloc
+
+from records import Book
+from store import BookStore
+
+N = 200_000
+
+
+def source(n):
+    for i in range(1, n + 1):
+        yield {
+            "id": i,
+            "title": f"Книга номер {i}",
+            "author": f"Автор {i % 1000}",
+            "completed": i % 2 == 0,
+        }
+
+
+def measure(build):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    data = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del data
+    return used / N
+
+
+def main():
+    print(f"книг: {N}")
+    print(f"словари:               {measure(lambda: list(source(N))):8.1f} байт/книга")
+    interned = measure(lambda: [{**b, "author": sys.intern(b["author"])} for b in source(N)])
+    print(f"словари + intern автор: {interned:7.1f} байт/книга")
+    print(f"Book со __slots__:     {measure(lambda: [Book.from_dict(b) for b in source(N)]):8.1f} байт/книга")
+    print(f"BookStore целиком:     {measure(lambda: BookStore(source(N))):8.1f} байт/книга")
+
+
+if __name__ == "__main__":
+    main()
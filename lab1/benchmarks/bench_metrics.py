@@ -0,0 +1,61 @@
+# бенчмарк накладных расходов метрик на запрос
+# запуск из папки lab1:  python -m benchmarks.bench_metrics
+#
+# пустое ASGI приложение с MetricsMiddleware и без, плюс стоимость
+# отдельных операций (счётчик, гистограмма, сборка /metrics)
+
+import asyncio
+import time
+
+from metrics import Histogram, MetricsMiddleware, Registry
+
+N = 100_000
+
+
+class Route:
+    path = "/books/{book_id}"
+
+
+async def bare(scope, receive, send):
+    scope["route"] = Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def run(app):
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(N):
+        await app({"type": "http", "method": "GET", "path": "/books/1"}, receive, send)
+    return (time.perf_counter() - start) / N
+
+
+def per_call(fn):
+    start = time.perf_counter()
+    for _ in range(N):
+        fn()
+    return (time.perf_counter() - start) / N
+
+
+def main():
+    registry = Registry()
+    plain = asyncio.run(run(bare))
+    wrapped = asyncio.run(run(MetricsMiddleware(bare, registry)))
+    print(f"запрос без метрик:  {plain * 1e6:6.2f} мкс")
+    print(f"запрос с метриками: {wrapped * 1e6:6.2f} мкс (+{(wrapped - plain) * 1e6:.2f})")
+    labels = (("op", "get"),)
+    print(f"счётчик:            {per_call(lambda: registry.inc('calls_total', labels)) * 1e6:6.2f} мкс")
+    histogram = Histogram()
+    print(f"гистограмма:        {per_call(lambda: histogram.record(0.00123)) * 1e6:6.2f} мкс")
+    start = time.perf_counter()
+    registry.render()
+    print(f"сборка /metrics:    {(time.perf_counter() - start) * 1e3:6.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# бенчмарк записи с журналом: always / interval / never
+# запуск из папки lab1:  python -m benchmarks.bench_oplog
+#
+# WRITERS задач одновременно добавляют книжки и ждут commit, как
+# обработчики записи в main.py. для always отдельно - один писатель,
+# чтобы видеть что даёт group commit (один fsync на пачку запросов).
+# последняя строка - переписывать весь снимок на каждую запись
+
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from oplog import OpLog
+from store import BookStore
+
+WRITES = 2000
+WRITERS = 64
+CATALOGUE = 10_000
+
+
+async def run(tmp, policy, writers):
+    store = BookStore({"id": i, "title": f"Книга {i}", "author": "Автор"} for i in range(1, CATALOGUE + 1))
+    oplog = OpLog(os.path.join(tmp, f"{policy}-{writers}.log"), os.path.join(tmp, "books.snap"),
+                  fsync=policy)
+    latencies = []
+
+    async def writer(n):
+        for _ in range(n):
+            start = time.perf_counter()
+            book = store.add(title="Новая", author="Автор")
+            oplog.append(book["id"], book, 1)
+            await oplog.commit()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(writer(WRITES // writers) for _ in range(writers)))
+    elapsed = time.perf_counter() - start
+    oplog.close()
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(f"{policy:>8} x{writers:<3} {len(latencies) / elapsed:9.0f} записей/с  "
+          f"медиана {statistics.median(latencies) * 1e3:7.3f} мс  p99 {p99 * 1e3:7.3f} мс  "
+          f"fsync: {oplog.syncs}")
+
+
+def full_rewrite(tmp):
+    store = BookStore({"id": i, "title": f"Книга {i}", "author": "Автор"} for i in range(1, CATALOGUE + 1))
+    path = os.path.join(tmp, "rewrite.snap")
+    n = 50
+    start = time.perf_counter()
+    for _ in range(n):
+        store.add(title="Новая", author="Автор")
+        store.save_snapshot(path)
+    print(f"{'снимок':>8} x1   {n / (time.perf_counter() - start):9.0f} записей/с  (весь каталог на каждую запись)")
+
+
+async def main():
+    print(f"записей: {WRITES}, каталог: {CATALOGUE}")
+    with tempfile.TemporaryDirectory() as tmp:
+        await run(tmp, "always", 1)
+        for policy in ("always", "interval", "never"):
+            await run(tmp, policy, WRITERS)
+        full_rewrite(tmp)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
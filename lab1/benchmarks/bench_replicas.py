@@ -0,0 +1,96 @@
+# бенчмарк чтения в несколько процессов (serve.py): 1, 2, 4 читателя
+# запуск из папки lab1:  python -m benchmarks.bench_replicas
+#
+# для каждого числа читателей запускаем serve.py, добавляем CATALOGUE
+# книжек через писателя и CLIENTS процессами-клиентами SECONDS секунд
+# читаем GET /books/{id} и GET /books?limit=50. клиенты - отдельные
+# процессы, иначе упрёмся в сам клиент, а не в сервер
+#
+# рост пропускной способности с числом читателей видно только если ядер
+# хватает и на читателей, и на клиентов: на одном ядре все цифры одинаковые
+
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+CATALOGUE = 10_000
+CLIENTS = 4
+SECONDS = 5
+PORT = 8200
+WRITER_PORT = 8201
+USER = {"Authorization": "Bearer user_token"}
+ADMIN = {"Authorization": "Bearer admin_token"}
+
+
+def wait_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, headers=USER).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise SystemExit(f"{url} не отвечает")
+
+
+def client(seed, deadline, results):
+    rng = random.Random(seed)
+    done = 0
+    with httpx.Client(base_url=f"http://127.0.0.1:{PORT}", headers=USER) as http:
+        while time.time() < deadline:
+            if rng.random() < 0.8:
+                http.get(f"/books/{rng.randint(1, CATALOGUE)}")
+            else:
+                http.get("/books", params={"limit": 50})
+            done += 1
+    results.put(done)
+
+
+def run(workers):
+    data_dir = tempfile.mkdtemp()
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--port", str(PORT),
+         "--writer-port", str(WRITER_PORT), "--data-dir", data_dir],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(f"http://127.0.0.1:{PORT}/books")
+        books = [{"title": f"Книга {i}", "author": f"Автор {i % 100}"} for i in range(CATALOGUE)]
+        httpx.post(f"http://127.0.0.1:{WRITER_PORT}/books/bulk", json=books, headers=ADMIN,
+                   timeout=60).raise_for_status()
+        # ждём пока читатели увидят опубликованный каталог
+        while httpx.get(f"http://127.0.0.1:{PORT}/books/{CATALOGUE}", headers=USER).status_code != 200:
+            time.sleep(0.05)
+        ctx = multiprocessing.get_context("spawn")
+        results = ctx.Queue()
+        deadline = time.time() + SECONDS
+        clients = [ctx.Process(target=client, args=(i, deadline, results)) for i in range(CLIENTS)]
+        for process in clients:
+            process.start()
+        total = sum(results.get() for _ in clients)
+        for process in clients:
+            process.join()
+        return total / SECONDS
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    print(f"ядер: {os.cpu_count()}, клиентов: {CLIENTS}, книжек: {CATALOGUE}")
+    base = None
+    for workers in (1, 2, 4):
+        rate = run(workers)
+        base = base or rate
+        print(f"читателей {workers}:  {rate:8.0f} req/s  (x{rate / base:.2f})", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# бенчмарк поиска GET /books/search на уровне хранилища
+# запуск из папки lab1:  python -m benchmarks.bench_search
+#
+# сравниваем search (BM25, лучшие K) с filter по подстроке, который отдаёт
+# все совпадения: время запроса и сколько книжек уходит в ответ. в
+# названиях - слова из словаря на VOCABULARY слов и пара популярных тем,
+# у авторов общее слово "автор", то есть оно есть в каждой книжке
+
+import random
+import time
+
+from store import BookStore
+
+SIZES = [100_000, 1_000_000]
+VOCABULARY = 5_000
+K = 10
+QUERIES = ["python", "rust асинхронность", "слово17 слово4242", "автор"]
+
+
+def make_books(n):
+    rng = random.Random(0)
+    topics = ["Python", "Go", "Rust", "Backend", "Асинхронность", "Базы данных"]
+    words = [f"слово{i}" for i in range(VOCABULARY)]
+    return [
+        {
+            "id": i,
+            "title": " ".join([rng.choice(topics), *rng.choices(words, k=rng.randint(1, 4))]),
+            "author": f"Автор {rng.randint(1, 5000)}",
+            "completed": i % 2 == 0,
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def timed(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    for n in SIZES:
+        books = make_books(n)
+        start = time.perf_counter()
+        store = BookStore(books)
+        build = time.perf_counter() - start
+        # пар (слово, книжка) во всех индексах поиска
+        postings = sum(len(ids) for index in store._search for ids in index._postings.values())
+        print(f"книг {n}: хранилище со всеми индексами за {build:.1f} с, пар слово-книжка {postings}")
+        print(f"  {'запрос':<24} {'search, мс':>11} {'filter, мс':>11} {'filter книг':>12}")
+        for query in QUERIES:
+            search_time, hits = timed(lambda: store.search(query, limit=K))
+            assert len(hits) <= K
+            # filter понимает только одну подстроку, берём первое слово
+            word = query.split()[0]
+            field = "author" if word == "автор" else "title"
+            filter_time, found = timed(lambda: store.filter(**{field: word}), repeat=1)
+            print(f"  {query:<24} {search_time * 1e3:>11.1f} {filter_time * 1e3:>11.1f} {len(found):>12}")
+        del store, books
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# бенчмарк GET /books: стандартная сериализация fastapi против склейки
+# готовых байтов книжек (serialization.py)
+# запуск из папки lab1:  python -m benchmarks.bench_serialization
+#
+# "до" - отдельное приложение с обработчиком как раньше (return список),
+# "после" - main.app с выключенным кэшем ответов, чтобы мерить именно
+# сериализацию, и с включённым кэшем для сравнения
+
+import asyncio
+import time
+
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+import main
+from serialization import orjson
+from store import BookStore
+
+SIZES = [10_000, 100_000]
+HEADERS = {"Authorization": "Bearer user_token"}
+
+
+def make_books(n):
+    return [
+        {"id": i, "title": f"Книга номер {i}", "author": f"Автор {i % 1000}", "completed": i % 2 == 0}
+        for i in range(1, n + 1)
+    ]
+
+
+def old_app(books):
+    app = FastAPI()
+
+    @app.get("/books")
+    async def read_books():
+        return books
+
+    return app
+
+
+async def rps(app, seconds=3.0):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+        done = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            res = await client.get("/books", headers=HEADERS)
+            assert res.status_code == 200
+            done += 1
+        return done / (time.perf_counter() - start)
+
+
+async def bench():
+    # компоненты main.py поднимаем сразу, дальше подменяем их своими
+    main.start()
+    print(f"кодировщик: {'orjson' if orjson else 'json'}")
+    print(f"{'книг':>8} {'до, req/s':>10} {'после, req/s':>13} {'с кэшем, req/s':>15}")
+    for n in SIZES:
+        books = make_books(n)
+        main.books = BookStore(books)
+        main.response_cache.clear()
+        before = await rps(old_app(books))
+        max_bytes = main.response_cache.max_bytes
+        main.response_cache.max_bytes = 0
+        after = await rps(main.app)
+        main.response_cache.max_bytes = max_bytes
+        cached = await rps(main.app)
+        print(f"{n:>8} {before:>10.1f} {after:>13.1f} {cached:>15.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(bench())
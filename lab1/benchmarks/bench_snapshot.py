@@ -0,0 +1,68 @@
+# бенчмарк холодного старта: json против бинарного снимка через mmap
+# запуск из папки lab1:  python -m benchmarks.bench_snapshot
+#
+# "готов" - хранилище создано и может отвечать на GET /books/{id};
+# "первый запрос" - плюс одна книжка по айдишнику. для снимка отдельно
+# считаем полный перенос в память (как при первой записи)
+
+import json
+import os
+import tempfile
+import time
+
+from snapshot import MappedSnapshot
+from store import BookStore
+
+N = 1_000_000
+
+
+def source(n):
+    for i in range(1, n + 1):
+        yield {
+            "id": i,
+            "title": f"Книга номер {i}",
+            "author": f"Автор {i % 1000}",
+            "completed": i % 2 == 0,
+        }
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "books.json")
+        snap_path = os.path.join(tmp, "books.snap")
+        store = BookStore(source(N))
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(store.all(), f, ensure_ascii=False)
+        _, saved = timed(lambda: store.save_snapshot(snap_path))
+        del store
+        print(f"книг: {N}")
+        print(f"размер: json {os.path.getsize(json_path) / 2**20:.1f} МБ, "
+              f"снимок {os.path.getsize(snap_path) / 2**20:.1f} МБ (запись {saved:.2f} с)")
+
+        def from_json():
+            with open(json_path, encoding="utf-8") as f:
+                return BookStore(json.load(f))
+
+        loaded, t = timed(from_json)
+        _, first = timed(lambda: loaded.get(N // 2))
+        print(f"json:            готов {t:7.3f} с, первый запрос {first * 1e6:7.1f} мкс")
+        del loaded
+
+        mapped, t = timed(lambda: BookStore(snapshot=MappedSnapshot(snap_path)))
+        _, first = timed(lambda: mapped.get(N // 2))
+        print(f"снимок:          готов {t:7.3f} с, первый запрос {first * 1e6:7.1f} мкс")
+        _, t = timed(mapped.load)
+        print(f"снимок -> память: {t:6.3f} с")
+
+        mapped, t = timed(lambda: BookStore(snapshot=MappedSnapshot(snap_path, verify=False)))
+        print(f"снимок без crc:  готов {t:7.3f} с")
+
+
+if __name__ == "__main__":
+    main()
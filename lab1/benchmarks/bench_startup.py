@@ -0,0 +1,96 @@
+# бенчмарк старта воркера: импорт main.py и время до первого ответа
+# запуск из папки lab1:  python -m benchmarks.bench_startup
+#
+# импорт - python -X importtime -c "import main" (самые тяжёлые модули и
+# весь main). первый ответ - от запуска uvicorn до первого 200 на
+# GET /books/1: с маленьким каталогом и со снимком на CATALOGUE книжек
+# (BOOKS_SNAPSHOT). функции ниже использует и tests/test_startup.py
+
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+CATALOGUE = 1_000_000
+REPEAT = 3
+HEADERS = {"Authorization": "Bearer user_token"}
+LAB = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# модули по собственному и полному времени импорта (мкс) для import main
+def import_times():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=LAB, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        own, total, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(own), int(total))
+    return modules, result.stdout
+
+
+# секунды от запуска uvicorn до первого 200 на GET /books/1. сокет на
+# свободном порту открываем здесь и передаём uvicorn (--fd): порт не
+# занят другим тестом и не надо ждать пока uvicorn его откроет
+def first_response(env=None, timeout=60.0):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(128)
+    port = sock.getsockname()[1]
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--fd", str(sock.fileno()), "--log-level", "warning"],
+        cwd=LAB, env={**os.environ, **(env or {})}, pass_fds=(sock.fileno(),),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                res = httpx.get(f"http://127.0.0.1:{port}/books/1", headers=HEADERS, timeout=timeout)
+                if res.status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.TransportError:
+                pass
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn завершился с кодом {server.returncode}")
+            time.sleep(0.01)
+        raise TimeoutError(f"нет ответа за {timeout} с")
+    finally:
+        server.terminate()
+        server.wait()
+        sock.close()
+
+
+def make_snapshot(path, n):
+    from snapshot import write_snapshot
+
+    rows = [(i, f"Книга {i}", f"Автор {i % 1000}", i % 2 == 0, 1) for i in range(1, n + 1)]
+    write_snapshot(path, rows, n + 1)
+
+
+def main():
+    times = [import_times()[0]["main"][1] for _ in range(REPEAT)]
+    modules = import_times()[0]
+    print(f"import main: {min(times) / 1e3:.0f} мс (лучший из {REPEAT})")
+    heavy = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)
+    top = [(name, total) for name, (_, total) in heavy if name != "main" and "." not in name][:8]
+    print("  тяжёлые пакеты: " + ", ".join(f"{name} {total / 1e3:.0f} мс" for name, total in top))
+    print(f"  numpy при импорте: {'да' if 'numpy' in modules else 'нет'}")
+
+    print(f"первый ответ, маленький каталог: {first_response() * 1e3:.0f} мс")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "books.snap")
+        make_snapshot(path, CATALOGUE)
+        rate = first_response({"BOOKS_SNAPSHOT": path})
+        print(f"первый ответ, снимок на {CATALOGUE} книжек: {rate * 1e3:.0f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# бенчмарк поиска книжки по айдишнику
+# запуск из папки lab1:  python -m benchmarks.bench_store
+#
+# сравниваем старый линейный поиск по списку с BookStore при росте каталога
+# от 10 до 1_000_000 книжек. у хранилища время поиска не должно расти
+
+import random
+import timeit
+
+from store import BookStore
+
+SIZES = [10, 1_000, 100_000, 1_000_000]
+LOOKUPS = 1_000
+
+
+def make_books(n):
+    return [
+        {"id": i, "title": f"Книга {i}", "author": f"Автор {i % 100}", "completed": i % 2 == 0}
+        for i in range(1, n + 1)
+    ]
+
+
+# старый вариант из main.py
+def linear_get(books, book_id):
+    for b in books:
+        if b["id"] == book_id:
+            return b
+    return None
+
+
+def main():
+    rng = random.Random(0)
+    print(f"{'книг':>10} {'список, мкс':>14} {'BookStore, мкс':>16}")
+    for n in SIZES:
+        books = make_books(n)
+        store = BookStore(books)
+        ids = [rng.randint(1, n) for _ in range(LOOKUPS)]
+        # линейный поиск на миллионе слишком долгий, берём поменьше запросов
+        linear_ids = ids[:max(1, LOOKUPS * 1_000 // n)]
+        linear = timeit.timeit(lambda: [linear_get(books, i) for i in linear_ids], number=1)
+        indexed = timeit.timeit(lambda: [store.get(i) for i in ids], number=1)
+        print(f"{n:>10} {linear / len(linear_ids) * 1e6:>14.2f} {indexed / len(ids) * 1e6:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# бенчмарк одиночных записей: сразу (как раньше) против очереди writer.py
+# запуск из папки lab1:  python -m benchmarks.bench_writes
+#
+# WRITERS клиентов одновременно шлют PATCH /books/{id} через ASGITransport.
+# "сразу" - каждая запись сама сбрасывает кэш и ждёт свой commit журнала,
+# "очередь" - записи применяются пачками. с журналом (fsync=always) и без.
+# "без http" - то же через main.write_books напрямую: видно сколько стоит
+# сама запись без разбора запроса fastapi
+
+import asyncio
+import os
+import tempfile
+import time
+
+from httpx import ASGITransport, AsyncClient
+
+import main
+from oplog import OpLog
+from store import BookStore
+from writer import WriteQueue
+
+CATALOGUE = 10_000
+WRITES = 2_000
+WRITERS = 64
+HEADERS = {"Authorization": "Bearer admin_token"}
+
+
+async def run(client):
+    next_write = 0
+
+    async def writer():
+        nonlocal next_write
+        while next_write < WRITES:
+            i = next_write
+            next_write += 1
+            book_id = i % CATALOGUE + 1
+            if client is None:
+                assert await main.write_books(main.books.update, [book_id], book_id, title=f"Книга {i}")
+                continue
+            res = await client.patch(f"/books/{book_id}", params={"title": f"Книга {i}"}, headers=HEADERS)
+            assert res.status_code == 200, res.text
+
+    start = time.perf_counter()
+    await asyncio.gather(*(writer() for _ in range(WRITERS)))
+    return WRITES / (time.perf_counter() - start)
+
+
+async def bench():
+    # компоненты main.py поднимаем сразу, дальше подменяем их своими
+    main.start()
+    queue = WriteQueue(main.books_changed, max_batch=256)
+    transport = ASGITransport(app=main.app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+        with tempfile.TemporaryDirectory() as tmp:
+            for log, http in ((False, True), (True, True), (False, False), (True, False)):
+                for name, writes in (("сразу", None), ("очередь", queue)):
+                    main.books = BookStore(
+                        {"id": i, "title": f"Книга {i}", "author": "Автор"} for i in range(1, CATALOGUE + 1)
+                    )
+                    main.response_cache.clear()
+                    main.writes = writes
+                    main.oplog = OpLog(os.path.join(tmp, f"{name}-{log}.log"), os.path.join(tmp, "snap")) if log else None
+                    batches = queue.batches
+                    rate = await run(client if http else None)
+                    extra = f", пачек: {queue.batches - batches}" if writes else ""
+                    journal = ("http, " if http else "без http, ") + ("журнал always" if log else "без журнала")
+                    print(f"{journal:>24} {name:>8}: {rate:7.0f} записей/с{extra}")
+                    if main.oplog:
+                        main.oplog.close()
+
+
+if __name__ == "__main__":
+    print(f"записей: {WRITES}, клиентов: {WRITERS}")
+    asyncio.run(bench())
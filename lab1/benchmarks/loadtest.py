@@ -0,0 +1,257 @@
+# нагрузочный тест API книжек со сравнением с базовым прогоном
+# запуск из папки lab1:
+#   python -m benchmarks.loadtest                               # в процессе, через ASGITransport
+#   python -m benchmarks.loadtest --url http://127.0.0.1:8000   # против запущенного uvicorn
+#   python -m benchmarks.loadtest --output report.json --save-baseline benchmarks/baseline.json
+#   python -m benchmarks.loadtest --baseline benchmarks/baseline.json   # код 1 при регрессии
+#
+# для каждого размера каталога и уровня конкурентности concurrency задач
+# делают requests запросов вперемешку (доли - --mix):
+#   read   GET /books/{id}
+#   list   GET /books?limit=50 (со следующей страницей по X-Next-Cursor)
+#   filter GET /books/filter?title=...
+#   write  PATCH /books/{id}?title=...
+# случайность с фиксированным seed, поэтому последовательность запросов
+# одна и та же от прогона к прогону
+#
+# в процессе каталог подменяется на BookStore нужного размера (как в
+# bench_serialization), против uvicorn книжки добавляются через
+# POST /books/bulk, а перед следующим размером книжки прошлого размера
+# удаляются через DELETE /books/bulk. книжки которые были на сервере до
+# теста остаются, поэтому в отчёте рядом с size есть books - сколько книжек
+# было в каталоге на самом деле. память - пиковый RSS процесса (только в
+# процессе)
+#
+# базовый прогон зависит от машины: его сохраняют (--save-baseline) на той
+# же машине, где потом сравнивают. регрессия - пропускная способность ниже
+# базовой или p99 выше базового больше чем на --tolerance
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import resource
+import sys
+import time
+
+from httpx import ASGITransport, AsyncClient
+
+OPS = ("read", "list", "filter", "write")
+WORDS = ["Книга", "номер", "Python", "Backend", "разработка", "Асинхронность"]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        op, _, weight = part.partition("=")
+        if op not in OPS:
+            raise SystemExit(f"неизвестная операция в --mix: {op}")
+        mix[op] = float(weight)
+    return mix
+
+
+def make_books(n, rng):
+    return [
+        {
+            "id": i,
+            "title": f"{rng.choice(WORDS)} номер {i}",
+            "author": f"Автор {i % 1000}",
+            "completed": i % 2 == 0,
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def peak_rss_mb():
+    # ru_maxrss в килобайтах на linux и в байтах на macos
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+async def login(client, username, password):
+    res = await client.post("/token", data={"username": username, "password": password})
+    res.raise_for_status()
+    return {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+
+# каталог нужного размера, возвращаем айдишники книжек. previous -
+# книжки добавленные для прошлого размера (против uvicorn их удаляем)
+async def seed(client, size, rng, admin, url, previous=()):
+    books = make_books(size, rng)
+    if url is None:
+        import main
+        from store import BookStore
+
+        main.books = BookStore(books)
+        main.response_cache.clear()
+        return [b["id"] for b in books]
+    previous = list(previous)
+    for start in range(0, len(previous), 10_000):
+        res = await client.request("DELETE", "/books/bulk", json=previous[start:start + 10_000], headers=admin)
+        res.raise_for_status()
+    ids = []
+    for start in range(0, size, 10_000):
+        chunk = [{"title": b["title"], "author": b["author"]} for b in books[start:start + 10_000]]
+        res = await client.post("/books/bulk", json=chunk, headers=admin)
+        res.raise_for_status()
+        ids += [item["id"] for item in res.json()["results"]]
+    return ids
+
+
+async def scenario(client, ids, concurrency, requests, mix, rng, user, admin):
+    ops = rng.choices(list(mix), weights=list(mix.values()), k=requests)
+    targets = [rng.choice(ids) for _ in range(requests)]
+    words = [rng.choice(WORDS).lower()[:rng.randint(3, 6)] for _ in range(requests)]
+    latencies = {op: [] for op in mix}
+    errors = {op: 0 for op in mix}
+    next_index = 0
+    cursor = None
+
+    async def worker():
+        nonlocal next_index, cursor
+        while next_index < requests:
+            i = next_index
+            next_index += 1
+            op = ops[i]
+            start = time.perf_counter()
+            if op == "read":
+                res = await client.get(f"/books/{targets[i]}", headers=user)
+            elif op == "list":
+                params = {"limit": 50}
+                if cursor:
+                    params["cursor"] = cursor
+                res = await client.get("/books", params=params, headers=user)
+                cursor = res.headers.get("X-Next-Cursor")
+            elif op == "filter":
+                res = await client.get("/books/filter", params={"title": words[i], "limit": 50}, headers=user)
+            else:
+                res = await client.patch(f"/books/{targets[i]}", params={"title": f"Книга {i}"}, headers=admin)
+            latencies[op].append(time.perf_counter() - start)
+            if res.status_code >= 400:
+                errors[op] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    result = {"throughput": requests / elapsed, "ops": {}}
+    for op, values in latencies.items():
+        values.sort()
+        result["ops"][op] = {
+            "count": len(values),
+            "errors": errors[op],
+            "p50": percentile(values, 0.5),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+        }
+    every = sorted(v for values in latencies.values() for v in values)
+    result["p50"] = percentile(every, 0.5)
+    result["p99"] = percentile(every, 0.99)
+    return result
+
+
+async def run(args):
+    mix = parse_mix(args.mix)
+    if args.url is None:
+        import main
+
+        transport = ASGITransport(app=main.app)
+        base_url = "http://testserver"
+    else:
+        transport = None
+        base_url = args.url
+    report = {
+        "meta": {
+            "mode": "asgi" if args.url is None else args.url,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "requests": args.requests,
+            "mix": mix,
+        },
+        "results": [],
+    }
+    async with AsyncClient(transport=transport, base_url=base_url, timeout=60) as client:
+        user = await login(client, args.user, args.user_password)
+        admin = await login(client, args.admin, args.admin_password)
+        ids = []
+        for size in args.sizes:
+            rng = random.Random(args.seed)
+            ids = await seed(client, size, rng, admin, args.url, ids)
+            books = size
+            if args.url is not None:
+                res = await client.get("/books/stats", params={"top": 1}, headers=user)
+                res.raise_for_status()
+                books = res.json()["count"]
+            for concurrency in args.concurrency:
+                result = await scenario(client, ids, concurrency, args.requests, mix, rng, user, admin)
+                result.update(size=size, books=books, concurrency=concurrency)
+                result["peak_rss_mb"] = peak_rss_mb() if args.url is None else None
+                report["results"].append(result)
+                print(f"книг {books:>8}  x{concurrency:<4} {result['throughput']:9.0f} req/s  "
+                      f"p50 {result['p50'] * 1e3:7.2f} мс  p99 {result['p99'] * 1e3:7.2f} мс", flush=True)
+    return report
+
+
+# сравнение с базовым прогоном: список найденных регрессий
+def compare(report, baseline, tolerance):
+    base = {(r["size"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        key = (result["size"], result["concurrency"])
+        old = base.get(key)
+        if old is None:
+            continue
+        name = f"книг {key[0]} x{key[1]}"
+        if result["throughput"] < old["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['throughput']:.0f} req/s против {old['throughput']:.0f}")
+        for op, stats in result["ops"].items():
+            before = old["ops"].get(op, {}).get("p99")
+            if before and stats["p99"] and stats["p99"] > before * (1 + tolerance):
+                regressions.append(f"{name} {op}: p99 {stats['p99'] * 1e3:.2f} мс против {before * 1e3:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API книжек")
+    parser.add_argument("--url", help="адрес запущенного сервера (по умолчанию - в процессе)")
+    parser.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",")], default=[1_000, 100_000])
+    parser.add_argument("--concurrency", type=lambda s: [int(x) for x in s.split(",")], default=[1, 16, 64])
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--mix", default="read=60,list=15,filter=15,write=10")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--user", default="user")
+    parser.add_argument("--user-password", default="user")
+    parser.add_argument("--admin", default="admin")
+    parser.add_argument("--admin-password", default="admin")
+    parser.add_argument("--output", help="куда записать отчёт (JSON)")
+    parser.add_argument("--baseline", help="базовый прогон для сравнения")
+    parser.add_argument("--save-baseline", help="сохранить этот прогон как базовый")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+    if args.output is None:
+        print(text)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("регрессии:", *regressions, sep="\n  ")
+            sys.exit(1)
+        print("регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
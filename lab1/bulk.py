@@ -0,0 +1,78 @@
+# пакетные операции над книжками (POST/PATCH/DELETE /books/bulk)
+#
+# тело - JSON массив или NDJSON (по объекту на строку). весь пакет
+# проверяется за один проход, и если хоть один элемент плохой - ничего не
+# применяется, а в ответе ошибки по каждому элементу
+
+import json
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+
+# больше элементов в одном пакете не принимаем
+MAX_BULK_ITEMS = 100_000
+
+
+# модель для частичного обновления книжки в пакете
+class BookPatch(BaseModel):
+    id: int
+    title: str | None = None
+    author: str | None = None
+
+
+# читаем элементы пакета из тела запроса
+async def read_items(request):
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Тело пакета не разбирается")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Ожидается массив")
+    if len(items) > MAX_BULK_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Слишком много элементов (максимум {MAX_BULK_ITEMS})"
+        )
+    return items
+
+
+# проверяем все элементы моделью, 422 с ошибками по элементам если есть плохие
+def validate_items(items, model):
+    valid = []
+    errors = []
+    for i, item in enumerate(items):
+        try:
+            valid.append(model.model_validate(item))
+        except ValidationError as e:
+            errors.append({"index": i, "errors": e.errors(include_url=False)})
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+    return valid
+
+
+# айдишники в пакете не должны повторяться (422, как и ошибки элементов)
+def check_duplicates(ids):
+    seen = set()
+    errors = []
+    for i, book_id in enumerate(ids):
+        if book_id in seen:
+            errors.append({"index": i, "id": book_id, "error": "Повторяющийся айдишник"})
+        seen.add(book_id)
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+
+
+# ошибка по элементам пакета которые ссылаются на несуществующие книжки
+def missing_error(ids, missing):
+    missing = set(missing)
+    return HTTPException(
+        status_code=404,
+        detail=[
+            {"index": i, "id": book_id, "error": "Книга не найдена"}
+            for i, book_id in enumerate(ids) if book_id in missing
+        ]
+    )
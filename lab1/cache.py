@@ -0,0 +1,165 @@
+# кэш готовых ответов для GET /books, /books/filter и /books/{book_id}
+#
+# запросы почти все на чтение, а данные меняются редко. поэтому храним уже
+# закодированный JSON по ключу "путь + отсортированные параметры" и отдаём
+# его без повторной сериализации. каждая запись помечена тегами (books -
+# зависит от всего каталога, book:<id> - от одной книжки), и обработчики
+# записи сбрасывают только записи с нужными тегами
+#
+# вытеснение: самые давно не использованные (LRU) при превышении лимита по
+# числу записей или по байтам, плюс TTL. у каждого ответа есть ETag, и на
+# If-None-Match с тем же ETag отвечаем 304 без тела
+#
+# сжатые варианты ответа (см. compression.py) хранятся в той же записи
+# (variants: кодировка -> байты) и входят в лимит по байтам
+
+import hashlib
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode
+
+from fastapi import Response
+
+from etags import strip_coding
+
+
+# ключ кэша: путь и параметры в одном порядке
+def cache_key(request):
+    query = sorted(parse_qsl(request.url.query, keep_blank_values=True))
+    return f"{request.url.path}?{urlencode(query)}"
+
+
+# совпадает ли If-None-Match с ETag (слабое сравнение, как требует RFC 9110).
+# ETag сжатого варианта ("3-5-gzip", см. etags.py) тоже подходит: это та же
+# версия, а 304 вернёт клиенту его тег (compression.py)
+def etag_matches(if_none_match, etag):
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return any(strip_coding(tag.strip().removeprefix("W/")) == etag for tag in if_none_match.split(","))
+
+
+class CacheEntry:
+    __slots__ = ("body", "etag", "headers", "tags", "expires", "variants", "cache", "generation")
+
+    def __init__(self, body, etag, headers, tags, expires):
+        self.body = body
+        self.etag = etag
+        self.headers = headers
+        self.tags = tags
+        self.expires = expires
+        self.variants = {}
+        # кэш в котором лежит запись (None - не сохранили или уже вытеснили)
+        # и его generation на момент сохранения (после clear запись не в кэше)
+        self.cache = None
+        self.generation = 0
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(data) for data in self.variants.values())
+
+    # сжатое тело: сохраняем и учитываем в лимите кэша
+    def add_variant(self, encoding, data):
+        if encoding in self.variants:
+            return
+        self.variants[encoding] = data
+        if self.cache is not None and self.cache.generation == self.generation:
+            self.cache._grow(len(data))
+
+    # ответ на запрос: 304 если у клиента уже есть эта версия
+    def response(self, request):
+        headers = {**self.headers, "ETag": self.etag}
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=headers)
+        # middleware сжатия возьмёт готовый вариант из записи или сохранит в неё
+        request.scope["cache_entry"] = self
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+
+class ResponseCache:
+    def __init__(self, max_entries=10_000, max_bytes=64 * 2**20, ttl=60.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # тег -> ключи записей с этим тегом
+        self._tags = {}
+        self._bytes = 0
+        # растёт при каждом сбросе: ответ посчитанный до сброса не кладём
+        self.epoch = 0
+        # растёт при clear: записи сохранённые до него уже не в кэше
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires < time.monotonic():
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    # кладём закодированный ответ, возвращаем запись (даже если не сохранили)
+    # etag по умолчанию - хэш тела; epoch - значение self.epoch до чтения данных
+    def put(self, key, body, tags, headers=None, etag=None, epoch=None):
+        if etag is None:
+            etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        entry = CacheEntry(body, etag, headers or {}, frozenset(tags), time.monotonic() + self.ttl)
+        # данные успели поменять пока мы их читали, или ответ не влезает
+        if (epoch is not None and epoch != self.epoch) or len(body) > self.max_bytes:
+            return entry
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        entry.cache = self
+        entry.generation = self.generation
+        self._bytes += len(body)
+        for tag in entry.tags:
+            self._tags.setdefault(tag, set()).add(key)
+        self._evict()
+        return entry
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _grow(self, size):
+        self._bytes += size
+        self._evict()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        entry.cache = None
+        self._bytes -= entry.size
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    # сбрасываем все записи с любым из тегов
+    def invalidate(self, tags):
+        self.epoch += 1
+        for tag in tags:
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+
+    # сбрасываем всё за O(1): записи не обходим, а отвязываем по generation
+    # (читатель зовёт clear на каждой новой версии снимка, см. replica.py)
+    def clear(self):
+        self.epoch += 1
+        self.generation += 1
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._bytes = 0
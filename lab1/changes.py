@@ -0,0 +1,101 @@
+# лента изменений каталога для GET /books/changes
+#
+# потребители раньше забирали весь GET /books и сами искали разницу. теперь
+# каждая изменённая книжка получает номер seq (общий растущий счётчик) и
+# попадает в кольцевой буфер на capacity последних изменений:
+#   put    - книжка после изменения (добавление или обновление)
+#   delete - надгробие удалённой книжки
+# клиент запоминает seq из ответа и спрашивает ?since=<seq>. если такие
+# старые изменения уже вытеснены из буфера (или сервер перезапустился),
+# приходит reset: клиент заново читает GET /books и продолжает с seq из
+# ответа с reset. записи - полное состояние книжки, поэтому применять их
+# повторно безопасно
+#
+# с журналом (oplog.py) seq совпадает с его seq и не начинается заново
+# после перезапуска. без журнала первый seq - время старта в микросекундах,
+# чтобы номера нового процесса были больше старых и клиент получил reset
+# вместо чужих изменений
+#
+# лента своя у каждого процесса, поэтому она только для хранилища в памяти
+
+import asyncio
+import time
+
+
+class ChangeFeed:
+    def __init__(self, capacity=10_000, seq=None):
+        self.capacity = capacity
+        self.seq = int(time.time() * 1e6) if seq is None else seq
+        # изменение с номером s лежит в _ring[s % capacity]
+        self._ring = [None] * capacity
+        # самый старый seq который ещё есть в буфере
+        self._first = self.seq + 1
+        # future ожидающих long-poll/SSE клиентов
+        self._waiters = []
+
+    # записываем изменение книжки (record None - удалена), возвращаем seq
+    def record(self, book_id, record, version=None):
+        self.seq += 1
+        if record is None:
+            entry = {"seq": self.seq, "op": "delete", "id": book_id}
+        else:
+            entry = {"seq": self.seq, "op": "put", "id": book_id, "book": record, "version": version}
+        self._ring[self.seq % self.capacity] = entry
+        self._first = max(self._first, self.seq - self.capacity + 1)
+        waiters, self._waiters = self._waiters, []
+        for future in waiters:
+            if not future.done():
+                future.set_result(None)
+        return self.seq
+
+    # можно ли отдать изменения после since (или нужен reset)
+    def available(self, since):
+        return self._first - 1 <= since <= self.seq
+
+    # изменения после since (не больше limit), у книжки - только последнее
+    # None если since уже вытеснен и нужен reset
+    def since(self, since, limit=1000):
+        if not self.available(since):
+            return None
+        entries = []
+        for seq in range(since + 1, min(self.seq, since + limit) + 1):
+            entries.append(self._ring[seq % self.capacity])
+        latest = {}
+        for entry in entries:
+            latest.pop(entry["id"], None)
+            latest[entry["id"]] = entry
+        return list(latest.values()), (entries[-1]["seq"] if entries else since)
+
+    # ждём нового изменения не дольше timeout секунд, True если дождались
+    async def wait(self, since, timeout):
+        if self.seq > since:
+            return True
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            if future in self._waiters:
+                self._waiters.remove(future)
+        return self.seq > since
+
+
+# события для GET /books/changes/stream (server-sent events): каждое
+# изменение - событие с id=seq, reset - отдельным событием. пока изменений
+# нет, раз в heartbeat секунд шлём комментарий, чтобы прокси не закрыли
+# соединение
+async def sse_events(feed, since, is_disconnected, dumps, heartbeat=15.0):
+    position = since
+    while not await is_disconnected():
+        found = None if position is None else feed.since(position)
+        if found is None:
+            position = feed.seq
+            yield f"event: reset\nid: {position}\ndata: {{\"seq\": {position}}}\n\n".encode()
+            continue
+        entries, position = found
+        for entry in entries:
+            yield b"id: %d\ndata: " % entry["seq"] + dumps(entry) + b"\n\n"
+        if position == feed.seq and not await feed.wait(position, heartbeat):
+            yield b": heartbeat\n\n"
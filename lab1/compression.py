@@ -0,0 +1,228 @@
+# сжатие ответов (Content-Encoding) по Accept-Encoding клиента
+#
+# весь каталог (GET /books) и широкие выборки /books/filter - это JSON с
+# повторяющимися ключами и именами, он сжимается в разы. middleware
+# выбирает кодировку по Accept-Encoding: zstd и br если установлены пакеты
+# zstandard и brotli, gzip есть всегда (zlib). порядок при равном q -
+# encodings (по умолчанию zstd, br, gzip)
+#
+#   - тела меньше min_size отдаём как есть: заголовок дороже выигрыша
+#   - тело от offload_size сжимаем в пуле потоков, чтобы не держать цикл
+#     событий (zlib, brotli и zstandard отпускают GIL)
+#   - потоковые ответы (выгрузка) сжимаем кусками по мере отправки,
+#     поток изменений (text/event-stream) не сжимаем: события копились бы
+#     в буфере компрессора
+#   - ответы из кэша (cache.py) сжимаем один раз: обработчик кладёт запись
+#     кэша в scope["cache_entry"], и сжатое тело сохраняется в ней рядом
+#     с исходными байтами
+#
+# у сжатого ответа свой сильный ETag с кодировкой в конце ("3-5-gzip", см.
+# etags.py): байты другие, а If-Match сравнивается сильно. If-None-Match с
+# таким тегом даёт 304 (cache.py), и в 304 возвращаем клиенту его же тег.
+# ко всем ответам которые можно сжать добавляем Vary: Accept-Encoding
+
+import zlib
+from functools import lru_cache
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from etags import coded_etag, strip_coding
+from metrics import registry, timed
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# уровни сжатия: быстрые, ответы сжимаются на лету
+LEVELS = {"zstd": 3, "br": 5, "gzip": 6}
+AVAILABLE = tuple(
+    encoding for encoding, module in (("zstd", zstandard), ("br", brotli), ("gzip", zlib))
+    if module is not None
+)
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+SKIP_TYPES = ("text/event-stream",)
+
+registry.describe("http_compression_input_bytes_total", "Байт ответов до сжатия")
+registry.describe("http_compression_output_bytes_total", "Байт ответов после сжатия")
+
+
+# кодировка для Accept-Encoding: наибольший q, при равенстве - порядок
+# encodings. None - отдаём без сжатия
+@lru_cache(maxsize=256)
+def negotiate(accept_encoding, encodings=AVAILABLE):
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    best = None
+    best_q = 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+@timed("compress")
+def compress(body, encoding):
+    if encoding == "gzip":
+        data = zlib.compress(body, LEVELS["gzip"], wbits=31)
+    elif encoding == "br":
+        data = brotli.compress(body, quality=LEVELS["br"])
+    elif encoding == "zstd":
+        data = zstandard.ZstdCompressor(level=LEVELS["zstd"]).compress(body)
+    else:
+        raise ValueError(f"Неизвестная кодировка: {encoding}")
+    registry.inc("http_compression_input_bytes_total", (("encoding", encoding),), len(body))
+    registry.inc("http_compression_output_bytes_total", (("encoding", encoding),), len(data))
+    return data
+
+
+# сжатие потока по кускам
+class StreamCompressor:
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._obj = zlib.compressobj(LEVELS["gzip"], zlib.DEFLATED, 31)
+            self._compress, self._finish = self._obj.compress, self._obj.flush
+        elif encoding == "br":
+            self._obj = brotli.Compressor(quality=LEVELS["br"])
+            self._compress, self._finish = self._obj.process, self._obj.finish
+        elif encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=LEVELS["zstd"]).compressobj()
+            self._compress, self._finish = self._obj.compress, self._obj.flush
+        else:
+            raise ValueError(f"Неизвестная кодировка: {encoding}")
+
+    @timed("compress")
+    def compress(self, chunk, last=False):
+        data = self._compress(chunk)
+        if last:
+            data += self._finish()
+        registry.inc("http_compression_input_bytes_total", (("encoding", self.encoding),), len(chunk))
+        registry.inc("http_compression_output_bytes_total", (("encoding", self.encoding),), len(data))
+        return data
+
+
+def _compressible(start, method):
+    headers = Headers(raw=start["headers"])
+    content_type = headers.get("content-type", "")
+    return (
+        method != "HEAD"
+        and 200 <= start["status"] and start["status"] not in (204, 206, 304)
+        and "content-encoding" not in headers
+        and content_type.startswith(COMPRESSIBLE_TYPES)
+        and not content_type.startswith(SKIP_TYPES)
+    )
+
+
+# ASGI middleware (без BaseHTTPMiddleware, чтобы не копировать тело ответа)
+class CompressionMiddleware:
+    def __init__(self, app, min_size=1024, offload_size=64 * 2**10, encodings=AVAILABLE):
+        self.app = app
+        self.min_size = min_size
+        self.offload_size = offload_size
+        self.encodings = tuple(encoding for encoding in encodings if encoding in AVAILABLE)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.min_size:
+            return await self.app(scope, receive, send)
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"), self.encodings)
+        # start - заголовки ждут первого куска тела, stream - сжимаем поток
+        start = None
+        stream = None
+
+        async def send_compressed(message):
+            nonlocal start, stream
+            if message["type"] == "http.response.start":
+                if message["status"] == 304:
+                    self._not_modified(message, scope)
+                if not _compressible(message, scope["method"]):
+                    return await send(message)
+                MutableHeaders(scope=message).add_vary_header("Accept-Encoding")
+                if encoding is None:
+                    return await send(message)
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if stream is not None:
+                data = await self._run(stream.compress, body, not more)
+                if data or not more:
+                    await send({"type": "http.response.body", "body": data, "more_body": more})
+                return
+            if start is None:
+                return await send(message)
+            held, start = start, None
+            if not more:
+                if len(body) < self.min_size:
+                    await send(held)
+                    return await send(message)
+                entry = scope.get("cache_entry")
+                data = entry.variants.get(encoding) if entry is not None else None
+                if data is None:
+                    data = await self._run(compress, body, encoding)
+                    if entry is not None:
+                        entry.add_variant(encoding, data)
+                self._encoded(held, encoding, len(data))
+                await send(held)
+                return await send({"type": "http.response.body", "body": data})
+            # потоковый ответ: размер заранее неизвестен, сжимаем всегда
+            stream = StreamCompressor(encoding)
+            self._encoded(held, encoding, None)
+            await send(held)
+            data = await self._run(stream.compress, body)
+            await send({"type": "http.response.body", "body": data, "more_body": True})
+
+        await self.app(scope, receive, send_compressed)
+
+    # большие тела - в пуле потоков
+    async def _run(self, fn, body, *args):
+        if len(body) >= self.offload_size:
+            return await run_in_threadpool(fn, body, *args)
+        return fn(body, *args)
+
+    @staticmethod
+    def _encoded(start, encoding, length):
+        headers = MutableHeaders(scope=start)
+        headers["content-encoding"] = encoding
+        if length is None:
+            del headers["content-length"]
+        else:
+            headers["content-length"] = str(length)
+        etag = headers.get("etag")
+        if etag:
+            headers["etag"] = coded_etag(etag, encoding)
+
+    # 304 на тег сжатого варианта: отдаём тот же тег, а не тег исходных байт
+    @staticmethod
+    def _not_modified(start, scope):
+        headers = MutableHeaders(scope=start)
+        etag = headers.get("etag")
+        if not etag:
+            return
+        for tag in Headers(scope=scope).get("if-none-match", "").split(","):
+            tag = tag.strip().removeprefix("W/")
+            if tag != etag and strip_coding(tag) == etag:
+                headers["etag"] = tag
+                return
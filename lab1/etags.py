@@ -0,0 +1,60 @@
+# ETag книжки и разбор If-Match для оптимистичных блокировок
+#
+# ETag строится из айдишника и версии книжки ("3-5"). PUT/PATCH/DELETE с
+# заголовком If-Match применяются только если версия совпала, иначе 412:
+# значит кто-то успел поменять книжку и клиенту надо перечитать её
+#
+# сжатый ответ (compression.py) - другие байты, поэтому у него свой сильный
+# ETag с кодировкой в конце ("3-5-gzip"). If-Match сравнивается сильно
+# (RFC 9110): слабые W/ теги не подходят, а суффикс кодировки отбрасываем -
+# версия книжки в нём та же
+
+from fastapi import HTTPException
+
+
+# кодировки которые compression.py дописывает в ETag
+CODINGS = ("gzip", "br", "zstd")
+
+
+def book_etag(book_id, version):
+    return f'"{book_id}-{version}"'
+
+
+# ETag сжатого варианта: "3-5" -> "3-5-gzip"
+def coded_etag(etag, encoding):
+    if not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+# ETag без суффикса кодировки: "3-5-gzip" -> "3-5"
+def strip_coding(etag):
+    for encoding in CODINGS:
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+# допустимые версии из If-Match (None - проверять не надо)
+def parse_if_match(if_match, book_id):
+    if if_match is None or if_match.strip() == "*":
+        return None
+    versions = set()
+    for tag in if_match.split(","):
+        tag = tag.strip()
+        if not (tag.startswith('"') and tag.endswith('"')):
+            continue
+        tag = strip_coding(tag)
+        tag_id, _, version = tag[1:-1].partition("-")
+        if tag_id == str(book_id) and version.isdigit():
+            versions.add(int(version))
+    return frozenset(versions)
+
+
+def precondition_failed(book_id, version):
+    return HTTPException(
+        status_code=412,
+        detail="Книга была изменена, перечитайте её",
+        headers={"ETag": book_etag(book_id, version)},
+    )
@@ -0,0 +1,64 @@
+# потоковая выгрузка всего каталога (GET /books/export)
+#
+# вместо сборки всего списка в памяти идём по хранилищу страницами через
+# курсор и отдаём книжки по мере кодирования. в памяти одновременно лежит
+# только одна пачка, сколько бы книжек ни было
+
+import asyncio
+
+from starlette.concurrency import iterate_in_threadpool
+
+from serialization import dumps
+
+# сколько книжек кодируем за раз
+EXPORT_BATCH = 1000
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+
+# куски выгрузки: ndjson - по книжке на строку, json - один массив
+def iter_export(store, fmt="ndjson", batch=EXPORT_BATCH):
+    after = None
+    first = True
+    if fmt == "json":
+        yield b"["
+    while True:
+        records = store.page(after=after, limit=batch)
+        if not records:
+            break
+        after = records[-1]["id"]
+        # книжки кодируем тем же dumps что и остальные ответы (serialization.py)
+        if fmt == "json":
+            chunk = b",".join([dumps(b) for b in records])
+            if not first:
+                chunk = b"," + chunk
+        else:
+            chunk = b"".join([dumps(b) + b"\n" for b in records])
+        first = False
+        yield chunk
+    if fmt == "json":
+        yield b"]"
+
+
+async def _aiter(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+# то же самое для StreamingResponse: между пачками отдаём управление циклу
+# событий и перестаём выгружать если клиент отключился
+# (если хранилище ходит на диск - читаем его в пуле потоков)
+async def stream_export(request, store, fmt="ndjson", batch=EXPORT_BATCH):
+    chunks = iter_export(store, fmt, batch)
+    if store.blocking:
+        chunks = iterate_in_threadpool(chunks)
+    else:
+        chunks = _aiter(chunks)
+    async for chunk in chunks:
+        if await request.is_disconnected():
+            break
+        yield chunk
+        await asyncio.sleep(0)
@@ -0,0 +1,88 @@
+# индексы для фильтрации книжек
+#
+# filter_books раньше на каждый запрос приводил к нижнему регистру все
+# названия и авторов и пробегал весь список. индексы ниже обновляются
+# инкрементально при каждой записи в хранилище (см. BookStore), а поиск
+# отдаёт множество подходящих айдишников. записи - Book из records.py
+
+
+# все триграммы строки
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# триграммный индекс для поиска подстроки без учёта регистра
+class TrigramIndex:
+    def __init__(self, field):
+        self.field = field
+        # id -> значение поля в нижнем регистре (чтобы не считать lower() заново)
+        self._lowered = {}
+        # триграмма -> айдишники книжек где она встречается
+        self._postings = {}
+
+    def add(self, record):
+        value = getattr(record, self.field)
+        if value is None:
+            return
+        lowered = value.lower()
+        self._lowered[record.id] = lowered
+        for gram in trigrams(lowered):
+            self._postings.setdefault(gram, set()).add(record.id)
+
+    def remove(self, record):
+        lowered = self._lowered.pop(record.id, None)
+        if lowered is None:
+            return
+        for gram in trigrams(lowered):
+            ids = self._postings[gram]
+            ids.discard(record.id)
+            if not ids:
+                del self._postings[gram]
+
+    # кандидаты для подстроки query (уже в нижнем регистре)
+    # None значит что индекс тут не помогает (строка короче триграммы)
+    def candidates(self, query):
+        if len(query) < 3:
+            return None
+        sets = []
+        for gram in trigrams(query):
+            ids = self._postings.get(gram)
+            if not ids:
+                return set()
+            sets.append(ids)
+        # пересекаем начиная с самого маленького множества
+        sets.sort(key=len)
+        result = set(sets[0])
+        for ids in sets[1:]:
+            result &= ids
+            if not result:
+                break
+        return result
+
+    # точная проверка подстроки (триграммы дают только кандидатов)
+    def matches(self, book_id, query):
+        lowered = self._lowered.get(book_id)
+        return lowered is not None and query in lowered
+
+
+# индекс по значению поля (для completed: True / False)
+class ValueIndex:
+    def __init__(self, field):
+        self.field = field
+        # значение -> айдишники
+        self._ids = {}
+
+    def add(self, record):
+        value = getattr(record, self.field)
+        if value is not None:
+            self._ids.setdefault(value, set()).add(record.id)
+
+    def remove(self, record):
+        value = getattr(record, self.field)
+        if value is not None:
+            ids = self._ids.get(value)
+            if ids is not None:
+                ids.discard(record.id)
+
+    def candidates(self, value):
+        return self._ids.get(value, set())
@@ -1,18 +1,53 @@
 #  вызов unicorh:  uvicorn main:app --reload
+#  или фабрикой:   uvicorn main:create_app --factory
+#
+# приложение собирает create_app(config): middleware, маршруты (router) и
+# lifespan. хранилище, журнал, лента изменений, очередь записи и проверка
+# паролей (компоненты) при импорте не создаются: их поднимает start() в
+# пуле потоков - в фоне сразу после старта воркера (lifespan) или на
+# первом запросе, если lifespan не запускали (ASGITransport в тестах).
+# запросы до конца загрузки ждут её (ensure_started). схема OpenAPI
+# строится только на первый запрос /openapi.json, а с APP_ENV=production
+# её и /docs нет совсем
+#
+# компоненты - глобальные переменные модуля (обработчики берут их в момент
+# вызова), поэтому приложение одно на процесс: create_app их сбрасывает
 
-from fastapi import FastAPI, HTTPException, Response, Form, Security
-from pydantic import BaseModel, Field
-from auth import is_authenticated, is_admin_user
+import asyncio
+import math
+import threading
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Response, Form, Security, Query, Request, Header
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+import auth
+from auth import is_authenticated, is_admin_user, is_admin_token, bearer_scheme
+from settings import Settings
+from store import MissingBooks, VersionConflict, open_store
+from snapshot import write_snapshot
+from oplog import OpLog
+from writer import WriteQueue, changed_ids
+from changes import ChangeFeed, sse_events
+from replica import ReplicaPublisher, ReplicaStore, WriteProxyMiddleware
+from etags import book_etag, parse_if_match, precondition_failed
+from pagination import decode_cursor, fetch_size, paginate, parse_fields
+from export import EXPORT_FORMATS, stream_export
+from cache import ResponseCache, cache_key
+from serialization import dumps, json_response, message_response
+from users import PasswordVerifier, UserStore
+from bulk import BookPatch, check_duplicates, missing_error, read_items, validate_items
+from metrics import MetricsMiddleware, metrics_response, registry
+from admission import AdmissionMiddleware
+from compression import CompressionMiddleware
+from profiler import DEFAULT_INTERVAL, MAX_SECONDS, PROFILE_SCOPE, ProfileMiddleware, StackSampler, begin_session, end_session
 from fastapi.security import OAuth2PasswordBearer
 
 # OAuth2PasswordBearer - схема для отображения поля для введения токена в сваггере
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-# экземпляр приложения fastapi
-app = FastAPI()
-
-# наша бд
-books = [
+# начальные книжки пустого каталога
+SEED_BOOKS = [
     {
         "id": 1,
         "title": "Асинхронность на Python",
@@ -27,46 +62,432 @@ books = [
     }
 ]
 
+# настройки и кэш ответов задаёт create_app, остальное (компоненты) - start()
+settings = None
+response_cache = None
+# наша бд (хранилище выбирается настройками, см. store.py). читатель
+# (serve.py) берёт книжки из снимка который публикует писатель
+books = None
+# журнал изменений (только для хранилища в памяти, sqlite пишет на диск сам)
+oplog = None
+# проверка паролей при входе (в отдельном пуле потоков, см. users.py)
+password_verifier = None
+# лента изменений для GET /books/changes (см. changes.py), только для
+# хранилища в памяти: у каждого процесса она своя
+changes = None
+# писатель (serve.py) публикует каталог для читателей (см. replica.py)
+publisher = None
+# очередь одиночных записей (см. writer.py), None - пишем сразу
+writes = None
+
+_started = False
+_start_lock = threading.Lock()
+# загрузка компонентов которую ждут запросы (см. ensure_started)
+_starting = None
+
+
+# поднимаем компоненты по settings. блокирующая (читает снимок, повторяет
+# журнал), поэтому main.py зовёт её в пуле потоков. бенчмарки зовут её
+# сами, а потом подменяют компоненты
+def start():
+    global books, oplog, password_verifier, changes, publisher, writes, _started
+    with _start_lock:
+        if _started:
+            return
+        if settings.role == "reader":
+            books = ReplicaStore(
+                settings.replica_path,
+                check_interval=settings.replica_check,
+                on_swap=lambda: response_cache.clear(),
+            )
+        else:
+            books = open_store(settings, SEED_BOOKS)
+        if settings.log_path and settings.backend == "memory" and settings.role != "reader":
+            oplog = OpLog.open(
+                books,
+                settings.log_path,
+                settings.snapshot_path,
+                fsync=settings.log_fsync,
+                interval=settings.log_interval,
+                compact_bytes=settings.log_compact_bytes,
+            )
+        password_verifier = PasswordVerifier(
+            UserStore.load(settings.users_path),
+            workers=settings.login_workers,
+            concurrency=settings.login_concurrency,
+            attempts=settings.login_attempts,
+            window=settings.login_window,
+        )
+        if settings.backend == "memory" and settings.changes_capacity and settings.role != "reader":
+            changes = ChangeFeed(settings.changes_capacity, seq=oplog.seq if oplog else None)
+        # каталог из снимка переезжает в память в фоне, не задерживая старт
+        # (до конца переезда main.py зовёт хранилище в пуле потоков)
+        if settings.role != "reader" and hasattr(books, "load_in_background"):
+            books.load_in_background()
+        if settings.role == "writer":
+            publisher = ReplicaPublisher(settings.replica_path, settings.publish_interval)
+            publisher.publish_now(books)
+        if settings.write_batch:
+            writes = WriteQueue(books_changed, is_blocking=lambda: books.blocking, max_batch=settings.write_batch)
+        _started = True
+
+
+# закрываем журнал, базу и пул проверки паролей (выключение воркера).
+# очередь записи и публикацию снимка останавливаем раньше них: lifespan
+# сначала дожидается их (drain), а здесь их только отменяем, если drain
+# не звали
+def stop():
+    global books, oplog, password_verifier, changes, publisher, writes, _started, _starting
+    with _start_lock:
+        if _started:
+            if writes is not None:
+                writes.cancel()
+            if publisher is not None:
+                publisher.cancel()
+            if oplog is not None:
+                oplog.close()
+            if hasattr(books, "close"):
+                books.close()
+            password_verifier.close()
+        books = oplog = password_verifier = changes = publisher = writes = None
+        _started = False
+        _starting = None
+
+
+# при выключении: дописываем очередь записи и публикуем последний снимок,
+# пока журнал и хранилище ещё открыты
+async def drain():
+    if writes is not None:
+        await writes.close()
+    if publisher is not None:
+        await publisher.close()
+
+
+# зависимость всех маршрутов: ждём пока компоненты загрузятся. загрузка
+# одна на все запросы, а если она упала - следующий запрос пробует снова
+async def ensure_started():
+    global _starting
+    if _started:
+        return
+    if _starting is None or _starting.get_loop() is not asyncio.get_running_loop():
+        _starting = asyncio.ensure_future(run_in_threadpool(start))
+    starting = _starting
+    try:
+        await asyncio.shield(starting)
+    except Exception:
+        if _starting is starting:
+            _starting = None
+        raise
+
+
+# читатель (serve.py): новая версия снимка подхватывается здесь, в цикле
+# событий, до обращения к кэшу ответов (см. replica.py)
+async def poll_replica():
+    if settings.role == "reader" and books is not None:
+        books.poll()
+
+
+# все маршруты ждут компоненты
+router = APIRouter(dependencies=[Depends(ensure_started), Depends(poll_replica)])
+
+
+# при старте воркера грузим компоненты в фоне, не задерживая приём
+# соединений, при выключении - закрываем
+@asynccontextmanager
+async def lifespan(app):
+    loading = asyncio.ensure_future(ensure_started())
+    yield
+    await asyncio.gather(loading, return_exceptions=True)
+    await drain()
+    stop()
+
+
+# значения которые считаем только при запросе /metrics
+registry.describe("books_catalogue_size", "Книжек в каталоге")
+registry.describe("books_response_cache_entries", "Ответов в кэше")
+registry.describe("books_response_cache_requests_total", "Обращения к кэшу ответов")
+registry.describe("books_oplog_bytes", "Размер журнала изменений")
+registry.describe("books_oplog_fsyncs_total", "fsync журнала изменений")
+
+
+@registry.gauge
+def books_gauges():
+    if response_cache is not None:
+        yield "books_response_cache_entries", (), len(response_cache)
+        yield "books_response_cache_requests_total", (("result", "hit"),), response_cache.hits
+        yield "books_response_cache_requests_total", (("result", "miss"),), response_cache.misses
+    # пока компоненты не загрузились - только кэш
+    if books is not None:
+        yield "books_catalogue_size", (), len(books)
+    if oplog is not None:
+        yield "books_oplog_bytes", (), oplog.size
+        yield "books_oplog_fsyncs_total", (), oplog.syncs
+
+
+# после записи: пишем изменённые книжки в журнал и ленту изменений (если
+# они есть), сбрасываем списки и ответы по ним и публикуем каталог для
+# читателей (писатель serve.py). вызывается сразу после записи в
+# хранилище, без await между ними, поэтому в журнал попадает именно
+# состояние после этой записи
+async def books_changed(*book_ids):
+    response_cache.invalidate(["books", *(f"book:{i}" for i in book_ids)])
+    if publisher is not None and book_ids:
+        publisher.schedule(lambda: books, book_ids)
+    if oplog is None and changes is None:
+        return
+    for book_id in book_ids:
+        record, version = books.versioned(book_id) or (None, None)
+        if oplog is not None:
+            oplog.append(book_id, record, version)
+        if changes is not None:
+            changes.record(book_id, record, version)
+    if oplog is not None:
+        await oplog.commit()
+        oplog.maybe_compact(books)
+
+
+# запись в хранилище: fn(*args, **kwargs) через очередь или сразу
+# ids - какие книжки она меняет (None - айдишник новой книжки из результата)
+async def write_books(fn, ids, *args, **kwargs):
+    if writes is not None:
+        return await writes.submit(fn, ids, *args, **kwargs)
+    result = await run_store(fn, *args, **kwargs)
+    await books_changed(*changed_ids(result, ids))
+    return result
+
+
+# готовый ответ из кэша; запрос под профилировщиком (X-Profile, см.
+# profiler.py) идёт мимо кэша, чтобы в профиль попал сам обработчик
+def cached(request, key):
+    if request.scope.get(PROFILE_SCOPE):
+        return None
+    return response_cache.get(key)
+
+
+# вызов хранилища: если оно ходит на диск - уводим вызов в пул потоков,
+# чтобы цикл событий не ждал
+async def run_store(fn, *args, **kwargs):
+    if books.blocking:
+        return await run_in_threadpool(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
+
+
+# книжка в ответах (в хранилище - records.Book, см. Book.to_dict)
+class BookOut(BaseModel):
+    id: int
+    title: str
+    author: str
+    completed: bool | None = None
+
+
+# книжка в результатах поиска: чем больше score, тем лучше подходит
+class SearchHit(BookOut):
+    score: float
+
 
 # get запрос на получение всех книжек
-@app.get("/books", tags=["Книги"], summary="Получить все книги")
+# limit/offset или курсор из заголовка X-Next-Cursor, fields=id,title - нужные поля
+@router.get("/books", tags=["Книги"], summary="Получить все книги", response_model=list[BookOut])
 async def read_books(
+    request: Request,
+    limit: int | None = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    cursor: str | None = None,
+    fields: str | None = None,
     # только авторизованные
     current_user: dict = Security(is_authenticated),
 ):
-    return books
+    key = cache_key(request)
+    entry = cached(request, key)
+    if entry is None:
+        epoch = response_cache.epoch
+        fields = parse_fields(fields)
+        after = decode_cursor(cursor) if cursor else None
+        records = await run_store(books.page, after=after, offset=offset, limit=fetch_size(limit))
+        body, headers = paginate(books, records, limit, fields)
+        entry = response_cache.put(key, body, ["books"], headers, epoch=epoch)
+    return entry.response(request)
 
 
 # get запрос на получение книжек с фильтрацией
-@app.get("/books/filter", tags=["Книги"], summary="Получение книг с фильтрацией")
+@router.get("/books/filter", tags=["Книги"], summary="Получение книг с фильтрацией",
+            response_model=list[BookOut])
 async def filter_books(
+    request: Request,
     title: str | None = None,
     author: str | None = None,
     completed: bool | None = None,
+    limit: int | None = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    cursor: str | None = None,
+    fields: str | None = None,
     current_user: dict = Security(is_authenticated),
 ):
-    # применяем фильтры
-    filtered = books
-    if title:
-        filtered = [b for b in filtered if title.lower() in b["title"].lower()]
-    if author:
-        filtered = [b for b in filtered if author.lower()
-                    in b["author"].lower()]
-    if completed is not None:
-        filtered = [b for b in filtered if b.get("completed") == completed]
-    return filtered
+    key = cache_key(request)
+    entry = cached(request, key)
+    if entry is None:
+        epoch = response_cache.epoch
+        fields = parse_fields(fields)
+        after = decode_cursor(cursor) if cursor else None
+        # применяем фильтры (через индексы хранилища)
+        records = await run_store(
+            books.filter, title=title, author=author, completed=completed,
+            after=after, offset=offset, limit=fetch_size(limit),
+        )
+        body, headers = paginate(books, records, limit, fields)
+        entry = response_cache.put(key, body, ["books"], headers, epoch=epoch)
+    return entry.response(request)
+
+
+# get запрос на выгрузку всего каталога потоком (для синхронизации и бэкапов)
+@router.get("/books/export", tags=["Книги"], summary="Выгрузка всех книг")
+async def export_books(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|json)$"),
+    current_user: dict = Security(is_authenticated),
+):
+    return StreamingResponse(
+        stream_export(request, books, format),
+        media_type=EXPORT_FORMATS[format],
+    )
+
+
+# get запрос на поиск по словам в названии и авторе (см. search.py):
+# k лучших книжек по убыванию score
+@router.get("/books/search", tags=["Книги"], summary="Поиск книг",
+            response_model=list[SearchHit])
+async def search_books(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    k: int = Query(10, ge=1, le=100),
+    current_user: dict = Security(is_authenticated),
+):
+    key = cache_key(request)
+    entry = cached(request, key)
+    if entry is None:
+        epoch = response_cache.epoch
+        records = await run_store(books.search, q, limit=k)
+        entry = response_cache.put(key, dumps(records), ["books"], epoch=epoch)
+    return entry.response(request)
+
+
+# get запрос на выборку для отчётов (см. analytics.py): авторы из списка
+# (?author=...&author=...), completed и диапазон айдишников. страницы как
+# в filter_books
+@router.get("/books/query", tags=["Книги"], summary="Выборка книг для отчётов",
+            response_model=list[BookOut])
+async def query_books(
+    request: Request,
+    author: list[str] | None = Query(None),
+    completed: bool | None = None,
+    id_min: int | None = None,
+    id_max: int | None = None,
+    limit: int | None = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    cursor: str | None = None,
+    fields: str | None = None,
+    current_user: dict = Security(is_authenticated),
+):
+    key = cache_key(request)
+    entry = cached(request, key)
+    if entry is None:
+        epoch = response_cache.epoch
+        fields = parse_fields(fields)
+        after = decode_cursor(cursor) if cursor else None
+        records = await run_store(
+            books.query, authors=author, completed=completed, id_min=id_min, id_max=id_max,
+            after=after, offset=offset, limit=fetch_size(limit),
+        )
+        body, headers = paginate(books, records, limit, fields)
+        entry = response_cache.put(key, body, ["books"], headers, epoch=epoch)
+    return entry.response(request)
+
+
+# get запрос на сводку по каталогу: сколько книжек, доля прочитанных и
+# top авторов по числу книжек. условия те же что у /books/query
+@router.get("/books/stats", tags=["Книги"], summary="Статистика по книгам")
+async def books_stats(
+    request: Request,
+    author: list[str] | None = Query(None),
+    completed: bool | None = None,
+    id_min: int | None = None,
+    id_max: int | None = None,
+    top: int = Query(20, ge=1, le=1000),
+    current_user: dict = Security(is_authenticated),
+):
+    key = cache_key(request)
+    entry = cached(request, key)
+    if entry is None:
+        epoch = response_cache.epoch
+        result = await run_store(
+            books.stats, authors=author, completed=completed, id_min=id_min, id_max=id_max, top=top,
+        )
+        entry = response_cache.put(key, dumps(result), ["books"], epoch=epoch)
+    return entry.response(request)
+
+
+# get запрос на изменения каталога после since (см. changes.py)
+# без since или если since слишком старый - reset: перечитать GET /books
+# и продолжить с seq из ответа. wait - сколько секунд ждать изменений
+# если их пока нет (long-poll)
+@router.get("/books/changes", tags=["Книги"], summary="Изменения каталога")
+async def read_changes(
+    since: int | None = None,
+    limit: int = Query(1000, ge=1, le=10_000),
+    wait: float = Query(0, ge=0, le=60),
+    current_user: dict = Security(is_authenticated),
+):
+    if changes is None:
+        raise HTTPException(status_code=501, detail="Лента изменений недоступна")
+    if since is not None and wait:
+        await changes.wait(since, wait)
+    found = None if since is None else changes.since(since, limit)
+    if found is None:
+        return json_response({"reset": True, "seq": changes.seq, "more": False, "changes": []})
+    entries, seq = found
+    return json_response({"reset": False, "seq": seq, "more": seq < changes.seq, "changes": entries})
+
+
+# то же потоком server-sent events: since или заголовок Last-Event-ID
+@router.get("/books/changes/stream", tags=["Книги"], summary="Поток изменений каталога")
+async def stream_changes(
+    request: Request,
+    since: int | None = None,
+    last_event_id: int | None = Header(None),
+    current_user: dict = Security(is_authenticated),
+):
+    if changes is None:
+        raise HTTPException(status_code=501, detail="Лента изменений недоступна")
+    return StreamingResponse(
+        sse_events(changes, since if since is not None else last_event_id, request.is_disconnected, dumps),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
 
 
 # get запрос на получение конкретной книжки
-@app.get("/books/{book_id}", tags=["Книги"], summary="Получить конкретную книжку")
+@router.get("/books/{book_id}", tags=["Книги"], summary="Получить конкретную книжку",
+            response_model=BookOut)
 async def get_book(
     book_id: int,
+    request: Request,
     current_user: dict = Security(is_authenticated),
 ):
+    key = cache_key(request)
+    entry = cached(request, key)
+    if entry is not None:
+        return entry.response(request)
+    epoch = response_cache.epoch
     # ищем книжку по айдишнику
-    for b in books:
-        if b["id"] == book_id:
-            return b
+    found = await run_store(books.versioned, book_id)
+    if found is not None:
+        b, version = found
+        # ETag из версии - его же ждут в If-Match при изменении
+        entry = response_cache.put(
+            key, books.encoded(b), [f"book:{book_id}"],
+            etag=book_etag(book_id, version), epoch=epoch,
+        )
+        return entry.response(request)
     # если нету - ошибка
     raise HTTPException(status_code=404, detail="Книга не найдена")
 
@@ -78,105 +499,274 @@ class NewBook(BaseModel):
 
 
 # post запрос для добавления книжки
-@app.post("/books", tags=["Книги"], summary="Добавление книжки",)
+@router.post("/books", tags=["Книги"], summary="Добавление книжки",)
 async def create_book(
     new_book: NewBook,
     # только для админа
     current_user: dict = Security(is_admin_user),
 ):
     # добавляем новую книжку
-    books.append({
-        "id": len(books) + 1,
-        "title": new_book.title,
-        "author": new_book.author,
-    })
-    # простой JSON ответ
-    return Response(
-        content='{"success": true, "message": "Книга добавлена"}',
-        media_type="application/json"
+    book = await write_books(books.add, None, title=new_book.title, author=new_book.author)
+    # простой JSON ответ и айдишник новой книжки
+    return json_response({"success": True, "message": "Книга добавлена", "id": book["id"]})
+
+
+# пакетное добавление книжек: JSON массив или NDJSON с объектами NewBook
+@router.post("/books/bulk", tags=["Книги"], summary="Пакетное добавление книг")
+async def create_books_bulk(
+    request: Request,
+    current_user: dict = Security(is_admin_user),
+):
+    items = validate_items(await read_items(request), NewBook)
+    created = await run_store(
+        books.add_many,
+        [{"title": item.title, "author": item.author} for item in items],
     )
+    await books_changed(*(b["id"] for b in created))
+    return json_response({
+        "success": True,
+        "results": [{"id": b["id"], "status": "created"} for b in created],
+    })
+
+
+# пакетное частичное обновление: объекты {"id": ..., "title": ..., "author": ...}
+@router.patch("/books/bulk", tags=["Книги"], summary="Пакетное обновление книг")
+async def update_books_bulk(
+    request: Request,
+    current_user: dict = Security(is_admin_user),
+):
+    items = validate_items(await read_items(request), BookPatch)
+    ids = [item.id for item in items]
+    check_duplicates(ids)
+    try:
+        await run_store(
+            books.update_many,
+            [(item.id, item.model_dump(exclude={"id"}, exclude_none=True)) for item in items],
+        )
+    except MissingBooks as e:
+        raise missing_error(ids, e.ids)
+    await books_changed(*ids)
+    return json_response({
+        "success": True,
+        "results": [{"id": item.id, "status": "updated"} for item in items],
+    })
+
+
+# пакетное удаление: массив айдишников
+@router.delete("/books/bulk", tags=["Книги"], summary="Пакетное удаление книг")
+async def delete_books_bulk(
+    request: Request,
+    current_user: dict = Security(is_admin_user),
+):
+    ids = await read_items(request)
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        raise HTTPException(status_code=422, detail="Ожидаются целые айдишники")
+    check_duplicates(ids)
+    try:
+        await run_store(books.delete_many, ids)
+    except MissingBooks as e:
+        raise missing_error(ids, e.ids)
+    await books_changed(*ids)
+    return json_response({
+        "success": True,
+        "results": [{"id": book_id, "status": "deleted"} for book_id in ids],
+    })
 
 
 # post запрос для получения токена (реализация аутентификации)
-@app.post("/token", tags=["Авторизация"], summary="Получение токена")
+@router.post("/token", tags=["Авторизация"], summary="Получение токена")
 async def login(
     username: str = Form(...),
     password: str = Form(...),
 ):
+    # слишком много неудачных попыток для этого имени
+    retry_after = password_verifier.retry_after(username)
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="Слишком много попыток входа",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
     # проверка учётных данных
-    if username == "admin" and password == "admin":
-        return {"access_token": "admin_token", "token_type": "bearer"}
-    elif username == "user" and password == "user":
-        return {"access_token": "user_token", "token_type": "bearer"}
-    else:
+    user = await password_verifier.authenticate(username, password)
+    if user is None:
         raise HTTPException(status_code=400, detail="Неверные данные")
+    return {"access_token": auth.token_backend.issue(user), "token_type": "bearer"}
+
+
+# post запрос на отзыв текущего токена (выход)
+@router.post("/token/revoke", tags=["Авторизация"], summary="Отзыв токена")
+async def revoke_token(
+    credentials=Security(bearer_scheme),
+    current_user: dict = Security(is_authenticated),
+):
+    auth.token_backend.revoke(credentials.credentials)
+    return message_response("Токен отозван")
 
 
 # put запрос для обновления всей книжки
-@app.put("/books/{book_id}", tags=["Книги"], summary="Обновление всей книги")
+@router.put("/books/{book_id}", tags=["Книги"], summary="Обновление всей книги")
 async def update_book(
     book_id: int,
     title: str,
     author: str,
+    if_match: str | None = Header(None),
     current_user: dict = Security(is_admin_user),
 ):
-    # обновляем все поля сразу
-    for b in books:
-        if b["id"] == book_id:
-            b.update({"title": title, "author": author})
-            return Response(
-                content='{"success": true, "message": "Книга обновлена"}',
-                media_type="application/json"
-            )
+    # обновляем все поля сразу (если книжку не успели поменять)
+    try:
+        updated = await write_books(
+            books.update, [book_id], book_id, expected_version=parse_if_match(if_match, book_id),
+            title=title, author=author,
+        )
+    except VersionConflict as e:
+        raise precondition_failed(book_id, e.version)
+    if updated is not None:
+        return message_response("Книга обновлена")
     raise HTTPException(status_code=404, detail="Книга не найдена")
 
 
 # patch запрос на частичное обновление книжки
-@app.patch("/books/{book_id}", tags=["Книги"], summary="Частичное обновление книги")
+@router.patch("/books/{book_id}", tags=["Книги"], summary="Частичное обновление книги")
 async def partial_update_book(
     book_id: int,
     title: str | None = None,
     author: str | None = None,
+    if_match: str | None = Header(None),
     current_user: dict = Security(is_admin_user),
 ):
-    for b in books:
-        if b["id"] == book_id:
-            # обновляем только те поля которые переданы
-            if title is not None:
-                b["title"] = title
-            if author is not None:
-                b["author"] = author
-            return Response(
-                content='{"success": true, "message": "Книга частично обновлена"}',
-                media_type="application/json"
-            )
+    # обновляем только те поля которые переданы
+    fields = {}
+    if title is not None:
+        fields["title"] = title
+    if author is not None:
+        fields["author"] = author
+    try:
+        updated = await write_books(
+            books.update, [book_id], book_id, expected_version=parse_if_match(if_match, book_id),
+            **fields,
+        )
+    except VersionConflict as e:
+        raise precondition_failed(book_id, e.version)
+    if updated is not None:
+        return message_response("Книга частично обновлена")
     raise HTTPException(status_code=404, detail="Книга не найдена")
 
 
 # delete запрос
-@app.delete("/books/{book_id}", tags=["Книги"], summary="Удаление книги")
+@router.delete("/books/{book_id}", tags=["Книги"], summary="Удаление книги")
 async def delete_book(
     book_id: int,
+    if_match: str | None = Header(None),
     current_user: dict = Security(is_admin_user),
 ):
-    # удаляем книжку по индексу
-    for i, b in enumerate(books):
-        if b["id"] == book_id:
-            books.pop(i)
-            return Response(
-                content='{"success": true, "message": "Книга удалена"}',
-                media_type="application/json"
-            )
+    # удаляем книжку по айдишнику
+    try:
+        deleted = await write_books(
+            books.delete, [book_id], book_id, expected_version=parse_if_match(if_match, book_id),
+        )
+    except VersionConflict as e:
+        raise precondition_failed(book_id, e.version)
+    if deleted:
+        return message_response("Книга удалена")
     raise HTTPException(status_code=404, detail="Книга не найдена")
 
 
-# пример валидации
-class UserSchema(BaseModel):
-    email: str
-    bio: str | None = Field(max_length=1000)
-    age: int = Field(ge=0, le=130)
+# метрики в формате Prometheus
+@router.get("/metrics", tags=["Администрирование"], summary="Метрики", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+
+# профиль всего воркера за seconds секунд в формате collapsed stacks
+@router.post("/admin/profile", tags=["Администрирование"], summary="Снять профиль воркера")
+async def profile_worker(
+    seconds: float = Query(10, gt=0, le=MAX_SECONDS),
+    interval: float = Query(DEFAULT_INTERVAL, ge=0.001, le=1),
+    current_user: dict = Security(is_admin_user),
+):
+    begin_session()
+    try:
+        sampler = StackSampler(interval).start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile = sampler.stop()
+    finally:
+        end_session()
+    return Response(
+        content=profile,
+        media_type="text/plain",
+        headers={"X-Profile-Samples": str(sampler.samples)},
+    )
+
+
+# post запрос на сохранение снимка каталога (для быстрого старта)
+@router.post("/admin/snapshot", tags=["Администрирование"], summary="Сохранить снимок каталога")
+async def save_snapshot(
+    current_user: dict = Security(is_admin_user),
+):
+    if not hasattr(books, "snapshot_rows") or not settings.snapshot_path:
+        raise HTTPException(status_code=409, detail="Снимки не настроены")
+    # с журналом снимок - это его свёртка
+    if oplog is not None:
+        return json_response({"success": True, "count": await oplog.compact(books)})
+    # каталог ещё в снимке - ждём переезда в потоке
+    if books.blocking:
+        await run_in_threadpool(books.load)
+    # в цикле событий берём только список книжек, а кортежи собираем,
+    # кодируем и пишем файл уже в потоке
+    records = books.snapshot_records()
+    rows = (book.row() for book in records)
+    await run_in_threadpool(write_snapshot, settings.snapshot_path, rows, books.next_id)
+    return json_response({"success": True, "count": len(records)})
 
 
-user_data = {"email": "abc@mail.ru", "bio": None, "age": 20}
-user = UserSchema(**user_data)
-print(user)
+# приложение по настройкам config (None - из переменных окружения)
+def create_app(config=None):
+    global settings, response_cache
+    stop()
+    settings = config or Settings.from_env()
+    if config is not None:
+        auth.configure(config)
+    # кэш готовых ответов на чтение (см. cache.py)
+    response_cache = ResponseCache(
+        max_entries=settings.cache_max_entries,
+        max_bytes=settings.cache_max_bytes,
+        ttl=settings.cache_ttl,
+    )
+    # в production схемы и документации нет
+    docs = settings.environment != "production"
+    app = FastAPI(
+        lifespan=lifespan,
+        openapi_url="/openapi.json" if docs else None,
+        docs_url="/docs" if docs else None,
+        redoc_url="/redoc" if docs else None,
+    )
+    # сжатие ответов по Accept-Encoding (см. compression.py). внутри
+    # остальных middleware: время сжатия видно в метриках как фаза compress
+    app.add_middleware(
+        CompressionMiddleware,
+        min_size=settings.compress_min_size,
+        offload_size=settings.compress_offload_size,
+        encodings=tuple(e.strip() for e in settings.compress_encodings.split(",") if e.strip()),
+    )
+    # сверх settings.max_concurrent_requests запросов сразу 503 (см. admission.py)
+    app.add_middleware(
+        AdmissionMiddleware,
+        max_concurrent=settings.max_concurrent_requests,
+        retry_after=settings.shed_retry_after,
+    )
+    # профиль запроса по заголовку X-Profile (см. profiler.py)
+    app.add_middleware(ProfileMiddleware, is_admin=is_admin_token)
+    # время запросов по маршрутам и фазам для /metrics (см. metrics.py)
+    app.add_middleware(MetricsMiddleware)
+    # читатель: записи - писателю (см. replica.py)
+    if settings.role == "reader":
+        app.add_middleware(WriteProxyMiddleware, writer_url=settings.writer_url)
+    app.include_router(router)
+    return app
+
+
+# экземпляр приложения fastapi
+app = create_app()
@@ -0,0 +1,276 @@
+# журнал изменений каталога (append-only) для хранилища в памяти
+#
+# без журнала все записи пропадают при перезапуске, а переписывать весь
+# каталог на каждую запись слишком дорого. поэтому каждое изменение
+# дописывается в конец файла одной строкой:
+#
+#   <crc32 hex> {"seq": 12, "op": "put", "book": {...}, "version": 3}
+#   <crc32 hex> {"seq": 13, "op": "delete", "id": 5}
+#
+# put - полное состояние книжки после записи, поэтому повтор журнала не
+# зависит от того, какой запрос её изменил. при старте берём снимок
+# (snapshot.py) и повторяем записи с seq больше его seq. оборванная или
+# битая строка в конце (сбой посреди записи) отрезается
+#
+# когда журнал разрастается, он сворачивается в новый снимок: текущий файл
+# переименовывается в <path>.old, записи идут в новый, а fsync старого
+# файла и сам снимок делаются в потоке, после чего .old удаляется. при
+# сбое посреди свёртки повторяются оба файла - лишнее отсекается по seq
+#
+# fsync (settings.log_fsync):
+#   always   - ответ уходит только после fsync. одновременные запросы ждут
+#              один общий fsync (group commit): пока идёт fsync, новые
+#              записи копятся и уходят следующим fsync одной пачкой
+#   interval - строки сразу пишутся в файл, fsync раз в log_interval секунд.
+#              при падении процесса ничего не теряется (данные уже в ядре),
+#              при отключении питания - последние log_interval секунд
+#   never    - только запись в файл, fsync делает ОС когда захочет
+
+import asyncio
+import json
+import os
+import shutil
+import zlib
+
+from serialization import dumps
+from snapshot import write_snapshot
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+class OpLogError(Exception):
+    pass
+
+
+# старый файл журнала при свёртке: fsync и закрытие, а если в .old
+# дописали текущий файл (merged) - fsync и его
+def _retire(fd, merged=None):
+    os.fsync(fd)
+    os.close(fd)
+    if merged is not None:
+        fd = os.open(merged, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _encode(entry):
+    payload = dumps(entry)
+    return b"%08x " % zlib.crc32(payload) + payload + b"\n"
+
+
+# записи журнала по порядку и длина целой части файла
+def read_log(path):
+    entries = []
+    valid = 0
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return entries, 0
+    for line in data.splitlines(keepends=True):
+        if not line.endswith(b"\n") or len(line) < 10:
+            break
+        crc, payload = line[:8], line[9:-1]
+        try:
+            if int(crc, 16) != zlib.crc32(payload):
+                break
+        except ValueError:
+            break
+        entries.append(json.loads(payload))
+        valid += len(line)
+    return entries, valid
+
+
+# повторяем записи журнала с seq больше after, возвращаем последний seq
+def replay(store, entries, after=0):
+    seq = after
+    for entry in entries:
+        if entry["seq"] <= seq:
+            continue
+        if entry["op"] == "put":
+            store.restore(entry["book"], entry["version"])
+        elif entry["op"] == "delete":
+            store.delete(entry["id"])
+        else:
+            raise OpLogError(f"Неизвестная операция в журнале: {entry['op']}")
+        seq = entry["seq"]
+    return seq
+
+
+class OpLog:
+    def __init__(self, path, snapshot_path, fsync="always", interval=0.01,
+                 compact_bytes=64 * 2**20, seq=0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Неизвестная политика fsync: {fsync}")
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.fsync = fsync
+        self.interval = interval
+        self.compact_bytes = compact_bytes
+        # последний выданный seq и последний seq который точно на диске
+        self.seq = seq
+        self.durable = seq
+        self.syncs = 0
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._size = os.fstat(self._fd).st_size
+        # записи которые ещё не отдали в файл
+        self._pending = bytearray()
+        self._written = seq
+        self._flushing = None
+        self._timer = None
+        self._timer_loop = None
+        self._compacting = None
+        # fsync и закрытие старого файла при свёртке (None - не идёт)
+        self._retiring = None
+        self.compact_error = None
+
+    # открываем журнал и доводим store до последнего состояния
+    @classmethod
+    def open(cls, store, path, snapshot_path, **kwargs):
+        snapshot = getattr(store, "_snapshot", None)
+        seq = snapshot.seq if snapshot is not None else 0
+        old = f"{path}.old"
+        # остаток прерванной свёртки
+        if os.path.exists(old):
+            entries, _ = read_log(old)
+            seq = replay(store, entries, seq)
+        entries, valid = read_log(path)
+        seq = replay(store, entries, seq)
+        if os.path.exists(path) and os.path.getsize(path) != valid:
+            # обрезаем оборванный хвост, чтобы дописывать после целых строк
+            os.truncate(path, valid)
+        return cls(path, snapshot_path, seq=seq, **kwargs)
+
+    @property
+    def size(self):
+        return self._size + len(self._pending)
+
+    # запоминаем изменения книжек: record - книжка после записи (None - удалена)
+    def append(self, book_id, record, version=None):
+        self.seq += 1
+        if record is None:
+            entry = {"seq": self.seq, "op": "delete", "id": book_id}
+        else:
+            entry = {"seq": self.seq, "op": "put", "book": record, "version": version}
+        self._pending += _encode(entry)
+        return self.seq
+
+    # ждём пока записи до seq дойдут до файла (и до диска при always)
+    async def commit(self, seq=None):
+        seq = self.seq if seq is None else seq
+        if self.fsync != "always":
+            self._write()
+            if self.fsync == "interval":
+                self._schedule_sync()
+            return
+        while self.durable < seq:
+            if self._flushing is None:
+                self._flushing = asyncio.ensure_future(self._flush())
+            await asyncio.shield(self._flushing)
+
+    def _write(self):
+        if self._pending:
+            data, self._pending = bytes(self._pending), bytearray()
+            os.write(self._fd, data)
+            self._size += len(data)
+            self._written = self.seq
+
+    # один fsync на всё что накопилось. строки отдаём в файл сразу (это
+    # быстро, данные просто копируются в ядро), а сам fsync ждём в потоке
+    async def _flush(self):
+        try:
+            self._write()
+            upto = self._written
+            await asyncio.get_running_loop().run_in_executor(None, self._sync)
+            if self._retiring is not None:
+                await asyncio.shield(self._retiring)
+            self.durable = upto
+        finally:
+            self._flushing = None
+
+    def _sync(self):
+        os.fsync(self._fd)
+        self.syncs += 1
+
+    def _schedule_sync(self):
+        loop = asyncio.get_running_loop()
+        if self._timer is not None and self._timer_loop is loop:
+            return
+        self._timer_loop = loop
+        self._timer = loop.call_later(self.interval, self._start_sync)
+
+    def _start_sync(self):
+        self._timer = None
+        if self._flushing is None and self.durable < self._written:
+            self._flushing = asyncio.ensure_future(self._flush())
+
+    # ждём текущий fsync и отдаём в файл всё накопленное
+    async def drain(self):
+        while self._flushing is not None:
+            await asyncio.shield(self._flushing)
+        self._write()
+
+    # свёртка в фоне когда журнал разросся
+    def maybe_compact(self, store):
+        if self._compacting is None and self.size >= self.compact_bytes:
+            self._start_compaction(store)
+
+    def _start_compaction(self, store):
+        self._compacting = asyncio.ensure_future(self._compact(store))
+        self._compacting.add_done_callback(self._compacted)
+        return self._compacting
+
+    def _compacted(self, task):
+        self._compacting = None
+        # фоновую ошибку запоминаем, иначе её никто не увидит
+        if not task.cancelled():
+            self.compact_error = task.exception()
+
+    # сворачиваем журнал в снимок store, возвращаем число книжек в снимке
+    async def compact(self, store):
+        while self._compacting is not None:
+            await asyncio.wait([self._compacting])
+        return await asyncio.shield(self._start_compaction(store))
+
+    async def _compact(self, store):
+        loop = asyncio.get_running_loop()
+        # каталог ещё в снимке (store.py): переезд ждём в потоке, а не в цикле
+        if getattr(store, "blocking", False):
+            await loop.run_in_executor(None, store.load)
+        await self.drain()
+        # список книжек и seq берём без await между ними и сменой файла.
+        # кортежи собираем уже в потоке: книжку могут поменять и после seq,
+        # но такие изменения лежат в новом журнале и повторятся поверх снимка
+        records = store.snapshot_records()
+        seq, next_id = self.seq, store.next_id
+        fd = self._fd
+        old = f"{self.path}.old"
+        merged = os.path.exists(old)
+        if merged:
+            # прошлая свёртка не дошла до конца: .old ещё нужен при повторе
+            with open(self.path, "rb") as src, open(old, "ab") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(self.path)
+        else:
+            os.replace(self.path, old)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._size = 0
+        # fsync старого файла - в потоке; до его конца _flush не считает
+        # записи на диске, даже если fsync нового файла уже прошёл
+        self._retiring = loop.run_in_executor(None, _retire, fd, old if merged else None)
+        try:
+            await asyncio.shield(self._retiring)
+        finally:
+            self._retiring = None
+        self.durable = max(self.durable, seq)
+        rows = (book.row() for book in records)
+        await loop.run_in_executor(None, write_snapshot, self.snapshot_path, rows, next_id, seq)
+        os.remove(old)
+        return len(records)
+
+    def close(self):
+        self._write()
+        os.fsync(self._fd)
+        os.close(self._fd)
@@ -0,0 +1,68 @@
+# постраничная выдача и выбор полей для GET /books и /books/filter
+
+import base64
+
+from fastapi import HTTPException
+
+from metrics import timed
+from serialization import dumps, encode_records
+
+# поля книжки которые можно запросить через fields=
+BOOK_FIELDS = ("id", "title", "author", "completed")
+
+
+# курсор - айдишник последней отданной книжки, упакованный в base64
+def encode_cursor(book_id):
+    return base64.urlsafe_b64encode(f"id:{book_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        kind, value = base64.urlsafe_b64decode(padded).decode().split(":")
+        if kind != "id":
+            raise ValueError(kind)
+        return int(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный курсор")
+
+
+# разбираем fields=id,title в кортеж полей
+def parse_fields(fields):
+    if not fields:
+        return None
+    names = tuple(name.strip() for name in fields.split(",") if name.strip())
+    unknown = [name for name in names if name not in BOOK_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Неизвестные поля: {', '.join(unknown)}"
+        )
+    return names
+
+
+# оставляем в книжках только запрошенные поля
+def project(records, fields):
+    if fields is None:
+        return records
+    return [{name: b[name] for name in fields if name in b} for b in records]
+
+
+# сколько книжек просить у хранилища: на одну больше limit,
+# чтобы понять есть ли следующая страница
+def fetch_size(limit):
+    return None if limit is None else limit + 1
+
+
+# страница для ответа в JSON и заголовки к ней: курсор на следующую
+# страницу кладём в X-Next-Cursor. records получены с limit=fetch_size(limit)
+# без fields склеиваем готовые байты книжек из хранилища
+@timed("serialize")
+def paginate(store, records, limit, fields):
+    headers = {}
+    if limit is not None and len(records) > limit:
+        records = records[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(records[-1]["id"])
+    if fields is None:
+        return encode_records(store, records), headers
+    return dumps(project(records, fields)), headers
@@ -0,0 +1,153 @@
+# сэмплирующий профилировщик для работающего воркера
+#
+# подключить отладчик к воркеру uvicorn в проде нельзя, поэтому профиль
+# снимается изнутри: фоновый поток раз в interval секунд берёт стеки всех
+# потоков (sys._current_frames) и считает одинаковые стеки. результат - в
+# формате collapsed stacks ("поток;модуль:функция;... число"), его понимают
+# flamegraph.pl и speedscope
+#
+# два способа включить (оба только для админа):
+#   POST /admin/profile?seconds=N - профиль всего воркера за N секунд
+#   заголовок X-Profile: <повторы> на GET запросе - запрос выполняется
+#       <повторы> раз под профилировщиком (одного быстрого запроса мало
+#       для статистики), а вместо ответа приходит профиль. статус исходного
+#       ответа - в заголовке X-Profile-Status. в профиль попадает всё что
+#       в это время делали потоки воркера, в том числе чужие запросы.
+#       такие запросы помечены scope["profile"] и идут мимо кэша ответов
+#       (main.py), иначе со второго повтора профилировался бы поиск в кэше
+#
+# пока профиль не снимается, потока нет, а middleware только смотрит есть
+# ли заголовок
+
+import sys
+import threading
+from collections import Counter
+
+from fastapi import HTTPException
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_SCOPE = "profile"
+MAX_SECONDS = 60
+MAX_REPEAT = 1000
+DEFAULT_INTERVAL = 0.005
+
+# одновременно снимается только один профиль
+_session = threading.Lock()
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class StackSampler:
+    def __init__(self, interval=DEFAULT_INTERVAL, thread_id=None):
+        self.interval = interval
+        # только этот поток (None - все кроме самого сэмплера)
+        self.thread_id = thread_id
+        self.samples = 0
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (self.thread_id is not None and ident != self.thread_id):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(ident, str(ident)))
+                self._stacks[";".join(reversed(stack))] += 1
+
+    # останавливаем и отдаём collapsed stacks
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return collapse(self._stacks)
+
+
+def collapse(stacks):
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+# начинаем сессию профилирования, 409 если уже идёт другая
+def begin_session():
+    if not _session.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="Профиль уже снимается")
+
+
+def end_session():
+    _session.release()
+
+
+def _header(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+# X-Profile на запросе админа: повторяем запрос под профилировщиком
+# is_admin - функция (значение Authorization) -> True для токена админа
+class ProfileMiddleware:
+    def __init__(self, app, is_admin):
+        self.app = app
+        self.is_admin = is_admin
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _header(scope, PROFILE_HEADER) is None:
+            return await self.app(scope, receive, send)
+        if scope["method"] != "GET" or not self.is_admin(_header(scope, b"authorization")):
+            return await self._reply(send, 403, "Профиль запроса - только для GET запроса админа".encode())
+        try:
+            repeat = min(max(int(_header(scope, PROFILE_HEADER)), 1), MAX_REPEAT)
+        except ValueError:
+            return await self._reply(send, 400, "X-Profile - число повторов запроса".encode())
+        if not _session.acquire(blocking=False):
+            return await self._reply(send, 409, "Профиль уже снимается".encode())
+        status = 0
+
+        async def receive_empty():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def capture(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        try:
+            # все потоки: синхронные зависимости и run_store идут в пуле потоков
+            sampler = StackSampler(interval=0.001).start()
+            try:
+                for _ in range(repeat):
+                    await self.app({**scope, PROFILE_SCOPE: True}, receive_empty, capture)
+            finally:
+                profile = sampler.stop()
+        finally:
+            _session.release()
+        await self._reply(send, 200, profile.encode(), [
+            (b"x-profile-status", str(status).encode()),
+            (b"x-profile-samples", str(sampler.samples).encode()),
+        ])
+
+    @staticmethod
+    async def _reply(send, status, body, headers=()):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8"), *headers],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,145 @@
+# ограничение частоты по ключу (token bucket)
+#
+# у каждого ключа ведро на burst жетонов, которое пополняется со скоростью
+# rate жетонов в секунду. состояние ключа - два числа, проверка за O(1).
+# ключей держим не больше max_keys: давно не трогавшиеся выкидываем (их
+# ведро к этому времени всё равно почти полное)
+#
+# TokenBucketLimiter - в памяти процесса, у каждого воркера свой.
+# SQLiteTokenBucketLimiter - общий для всех воркеров на одной машине: ведра
+# лежат в файле sqlite и меняются в транзакции. он ходит на диск, поэтому
+# blocking = True и вызывать его надо из пула потоков (как SQLiteBookStore)
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+    blocking = False
+
+    def __init__(self, rate, burst, max_keys=100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # ключ -> [жетоны, время последнего пересчёта]
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _bucket(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(self.burst), now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    # через сколько секунд у ключа наберётся cost жетонов (0 - уже есть)
+    def retry_after(self, key, cost=1, now=None):
+        now = time.monotonic() if now is None else now
+        tokens = self._bucket(key, now)[0]
+        if tokens >= cost:
+            return 0.0
+        return (cost - tokens) / self.rate
+
+    # забираем cost жетонов; 0 если получилось, иначе сколько ждать
+    def acquire(self, key, cost=1, now=None):
+        now = time.monotonic() if now is None else now
+        bucket = self._bucket(key, now)
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return 0.0
+        return (cost - bucket[0]) / self.rate
+
+
+class SQLiteTokenBucketLimiter:
+    blocking = True
+
+    def __init__(self, path, rate, burst, max_keys=100_000, table="buckets"):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.table = table
+        # соединение на поток, sqlite сам разбирается с соседними процессами
+        self._local = threading.local()
+        self._calls = 0
+        with self._connection() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_updated ON {table} (updated)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        return self._connection().execute(f"SELECT count(*) FROM {self.table}").fetchone()[0]
+
+    # время общее для процессов, поэтому time.time, а не monotonic
+    def _take(self, key, cost, now, take):
+        now = time.time() if now is None else now
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(f"SELECT tokens, updated FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            tokens = float(self.burst) if row is None else min(
+                self.burst, row[0] + max(now - row[1], 0.0) * self.rate
+            )
+            wait = 0.0 if tokens >= cost else (cost - tokens) / self.rate
+            if take and not wait:
+                tokens -= cost
+            conn.execute(
+                f"INSERT INTO {self.table} (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._calls += 1
+        if self._calls % 1000 == 0:
+            self._evict(conn, now)
+        return wait
+
+    # выкидываем ведра которые и так уже полные, а если ключей всё равно
+    # больше max_keys - самые давние
+    def _evict(self, conn, now):
+        conn.execute(f"DELETE FROM {self.table} WHERE updated < ?", (now - self.burst / self.rate,))
+        conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+            "ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+            (self.max_keys,),
+        )
+
+    def retry_after(self, key, cost=1, now=None):
+        return self._take(key, cost, now, take=False)
+
+    def acquire(self, key, cost=1, now=None):
+        return self._take(key, cost, now, take=True)
+
+
+# ограничитель по настройкам: None если rate = 0 (без ограничения)
+def make_limiter(backend, rate, burst, max_keys=100_000, path=None, table="buckets"):
+    if not rate:
+        return None
+    if backend == "memory":
+        return TokenBucketLimiter(rate, burst, max_keys)
+    if backend == "sqlite":
+        return SQLiteTokenBucketLimiter(path, rate, burst, max_keys, table)
+    raise ValueError(f"Неизвестный backend ограничителя: {backend}")
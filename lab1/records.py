@@ -0,0 +1,52 @@
+# компактная запись книжки для хранилища в памяти
+#
+# словарь {"id", "title", "author", "completed"} со строковыми ключами
+# занимает пару сотен байт ещё до самих строк. класс со __slots__ - около
+# 80 байт, а одинаковые имена авторов хранятся одной строкой (sys.intern).
+# в слотах же лежат версия книжки и её закодированный JSON, чтобы не
+# держать для них отдельные словари по айдишнику
+#
+# наружу хранилище отдаёт обычные словари (to_dict), как и раньше
+
+import sys
+from dataclasses import dataclass, field
+
+
+@dataclass(slots=True)
+class Book:
+    id: int
+    title: str
+    author: str
+    # None - поля нет (у книжек добавленных через POST /books)
+    completed: bool | None = None
+    version: int = 1
+    # JSON книжки, сбрасывается при изменении
+    encoded: bytes | None = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            id=data["id"],
+            title=data["title"],
+            author=sys.intern(data["author"]),
+            completed=data.get("completed"),
+        )
+
+    def to_dict(self):
+        data = {"id": self.id, "title": self.title, "author": self.author}
+        if self.completed is not None:
+            data["completed"] = self.completed
+        return data
+
+    # кортеж для write_snapshot (snapshot.py)
+    def row(self):
+        return (self.id, self.title, self.author, self.completed, self.version)
+
+    # меняем поля книжки (version и encoded обновляет хранилище)
+    def set(self, fields):
+        for name, value in fields.items():
+            if name not in ("title", "author", "completed"):
+                raise ValueError(f"Неизвестное поле: {name}")
+            if name == "author":
+                value = sys.intern(value)
+            setattr(self, name, value)
@@ -0,0 +1,290 @@
+# реплики каталога для нескольких процессов (см. serve.py)
+#
+# один процесс-писатель держит каталог в памяти и принимает все записи.
+# после записей он публикует бинарный снимок (snapshot.py) в файл
+# settings.replica_path: пишет его во временный файл и заменяет старый
+# через os.replace. читатели открывают снимок через mmap и отдают GET
+# /books, /books/filter и /books/{book_id} прямо из него, не разбирая
+# весь каталог
+#
+# блокировок нет: os.replace атомарен, а старый файл остаётся доступен
+# читателю пока он его не закрыл. читатель не чаще раза в check_interval
+# секунд проверяет inode файла и, если он сменился, открывает новую
+# версию и сбрасывает свой кэш ответов. отставание читателей - интервал
+# публикации писателя плюс check_interval
+#
+# индексов в снимке нет, и строить их заново на каждую версию (раз в
+# interval писателя) дороже самой версии: фильтр у читателя - перебор
+# снимка. поэтому хранилище читателя blocking, и main.py зовёт его в пуле
+# потоков. новую версию проверяет poll() в цикле событий перед запросом:
+# кэш ответов сбрасывается там же, а потоки только читают текущую версию
+#
+# записи, поиск и отчёты читатель сам не обрабатывает: проксирует их писателю
+
+import asyncio
+import os
+import time
+
+from snapshot import MappedSnapshot, write_snapshot
+from store import BookStore
+
+# пути которые читатель отправляет писателю при любом методе (индексов
+# поиска и колонок для отчётов в снимке нет, они есть только у писателя)
+WRITER_PATHS = ("/books/changes", "/books/search", "/books/query", "/books/stats", "/admin/snapshot")
+# заголовки одного соединения: через прокси их не передаём (host httpx
+# ставит сам по адресу писателя)
+HOP_HEADERS = frozenset({
+    b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization", b"te",
+    b"trailer", b"transfer-encoding", b"upgrade", b"host",
+})
+
+
+# хранилище читателя: текущая версия снимка, только чтение
+class ReplicaStore:
+    blocking = True
+
+    def __init__(self, path, check_interval=0.01, on_swap=None):
+        self.path = path
+        self.check_interval = check_interval
+        self.on_swap = on_swap
+        self.swaps = 0
+        self._inode = None
+        self._checked = time.monotonic()
+        self._snapshot = None
+        self._store = None
+        self.version = 0
+        self._refresh()
+
+    def _refresh(self):
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if inode is None or inode == self._inode:
+            return
+        old = self._snapshot
+        # снимок пишет наш писатель целиком через os.replace, недописанным
+        # он не бывает: crc всего файла на каждой смене версии не считаем
+        self._snapshot = MappedSnapshot(self.path, verify=False)
+        self._store = BookStore(snapshot=self._snapshot)
+        self._inode = inode
+        self.version = self._snapshot.seq
+        # старый снимок явно не закрываем: его ещё может читать поток пула
+        if old is not None:
+            self.swaps += 1
+            if self.on_swap is not None:
+                self.on_swap()
+
+    # раз в check_interval проверяем не вышла ли новая версия (в цикле
+    # событий, см. main.poll_replica)
+    def poll(self):
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            self._checked = now
+            self._refresh()
+
+    # текущая версия (из любого потока)
+    def current(self):
+        if self._store is None:
+            raise RuntimeError(f"Снимок каталога {self.path} ещё не опубликован")
+        return self._store
+
+    def __len__(self):
+        return len(self.current())
+
+    def __contains__(self, book_id):
+        return book_id in self.current()
+
+    def get(self, book_id):
+        return self.current().get(book_id)
+
+    def versioned(self, book_id):
+        return self.current().versioned(book_id)
+
+    def encoded(self, record):
+        return self.current().encoded(record)
+
+    def page(self, after=None, offset=0, limit=None):
+        return self.current().page(after=after, offset=offset, limit=limit)
+
+    def filter(self, title=None, author=None, completed=None, after=None, offset=0, limit=None):
+        return self.current().filter(title, author, completed, after=after, offset=offset, limit=limit)
+
+
+# кортежи книжек для write_snapshot (в потоке) и их позиции по айдишнику
+def _rows(records):
+    rows = [book.row() for book in records]
+    return rows, {row[0]: i for i, row in enumerate(rows)}
+
+
+# писатель: после записей публикует снимок не чаще раза в interval секунд
+class ReplicaPublisher:
+    def __init__(self, path, interval=0.05):
+        self.path = path
+        self.interval = interval
+        self.version = 0
+        self._dirty = False
+        self._task = None
+        # айдишники изменённые пока поток собирает кортежи (None - не собирает)
+        self._changed = None
+
+    # сразу (при старте писателя, до запуска читателей)
+    def publish_now(self, store):
+        self.version += 1
+        write_snapshot(self.path, store.snapshot_rows(), store.next_id, self.version)
+
+    # книжки book_ids поменялись - опубликуем каталог в фоне; store -
+    # функция, возвращающая текущее хранилище
+    def schedule(self, store, book_ids):
+        self._dirty = True
+        if self._changed is not None:
+            self._changed.update(book_ids)
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._publish(store))
+
+    # при выключении писателя: дожидаемся начатой публикации (новых
+    # записей уже нет, см. main.lifespan)
+    async def close(self):
+        task = self._task
+        if task is None or task.done():
+            return
+        if task.get_loop() is not asyncio.get_running_loop():
+            return self.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    # остановить публикацию не дожидаясь её (можно звать из любого потока)
+    def cancel(self):
+        task = self._task
+        if task is not None and not task.done() and not task.get_loop().is_closed():
+            task.get_loop().call_soon_threadsafe(task.cancel)
+
+    # в цикле событий только копия списка записей и книжки изменённые за
+    # время сборки; кортежи всего каталога собираем и пишем в потоке
+    async def _publish(self, store):
+        loop = asyncio.get_running_loop()
+        while self._dirty:
+            await asyncio.sleep(self.interval)
+            self._dirty = False
+            current = store()
+            self._changed = changed = set()
+            try:
+                rows, positions = await loop.run_in_executor(None, _rows, current.snapshot_records())
+            finally:
+                self._changed = None
+            # поток мог прочитать книжку посреди записи - берём её заново
+            appended = []
+            for book_id in changed:
+                row = current.snapshot_row(book_id)
+                i = positions.get(book_id)
+                if i is not None:
+                    rows[i] = row
+                elif row is not None:
+                    appended.append(row)
+            rows.extend(sorted(appended))
+            self.version += 1
+            # удалённые за это время книжки (None) пропускаем уже в потоке
+            await loop.run_in_executor(
+                None, write_snapshot, self.path, (row for row in rows if row is not None),
+                current.next_id, self.version,
+            )
+
+
+# читатель: записи, ленту изменений и отчёты проксируем писателю. клиент
+# говорит только с портом читателей: редирект на другой порт - это другой
+# origin, и httpx, requests и браузеры не отправили бы туда Authorization.
+# тела запроса и ответа идут потоком, так что лента изменений (long-poll и
+# SSE) тоже работает через читателя
+class WriteProxyMiddleware:
+    def __init__(self, app, writer_url, transport=None):
+        self.app = app
+        self.writer_url = writer_url.rstrip("/")
+        # transport - для тестов (httpx.ASGITransport вместо сети)
+        self.transport = transport
+        self._client = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._to_writer(scope):
+            return await self.app(scope, receive, send)
+        client = self._get_client()
+        request = client.build_request(
+            scope["method"],
+            scope["path"],
+            params=scope["query_string"].decode("latin-1") or None,
+            headers=[(name, value) for name, value in scope["headers"] if name.lower() not in HOP_HEADERS],
+            content=self._body(receive),
+        )
+        try:
+            response = await client.send(request, stream=True)
+        except self._httpx.TransportError:
+            return await self._bad_gateway(send)
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [
+                    (name, value) for name, value in response.headers.raw if name.lower() not in HOP_HEADERS
+                ],
+            })
+            # тело запроса уже отправлено: дальше receive скажет только об
+            # отключении клиента, тогда перестаём читать ответ писателя
+            relay = asyncio.ensure_future(self._relay(response, send))
+            disconnect = asyncio.ensure_future(self._disconnected(receive))
+            done, pending = await asyncio.wait((relay, disconnect), return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            if relay in done:
+                relay.result()
+        finally:
+            await response.aclose()
+
+    # клиент писателя: httpx нужен только читателю, импортируем при первом запросе
+    def _get_client(self):
+        if self._client is None:
+            import httpx
+
+            self._httpx = httpx
+            self._client = httpx.AsyncClient(
+                base_url=self.writer_url, transport=self.transport, timeout=None,
+            )
+        return self._client
+
+    @staticmethod
+    async def _body(receive):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            yield message.get("body", b"")
+            if not message.get("more_body", False):
+                return
+
+    @staticmethod
+    async def _relay(response, send):
+        async for chunk in response.aiter_raw():
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    @staticmethod
+    async def _disconnected(receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    @staticmethod
+    async def _bad_gateway(send):
+        await send({
+            "type": "http.response.start",
+            "status": 502,
+            "headers": [(b"content-type", b"application/json")],
+        })
+        await send({
+            "type": "http.response.body",
+            "body": '{"detail":"Писатель каталога недоступен"}'.encode(),
+        })
+
+    @staticmethod
+    def _to_writer(scope):
+        path = scope["path"]
+        if path.startswith(WRITER_PATHS):
+            return True
+        return scope["method"] not in ("GET", "HEAD") and path.startswith("/books")
@@ -0,0 +1,48 @@
+# быстрая сборка JSON ответов
+#
+# обычный путь fastapi - jsonable_encoder по всем словарям и потом
+# стандартный json. тут кодируем сразу в байты через orjson (если он
+# установлен, иначе стандартный json с теми же настройками), а список
+# книжек собираем склейкой уже закодированных записей: хранилище держит
+# байты каждой книжки и пересчитывает их только когда книжка меняется
+
+import json
+from functools import cache
+
+from fastapi import Response
+
+from metrics import timed
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    def dumps(content):
+        return orjson.dumps(content)
+else:
+    # то же что JSONResponse в fastapi: без \u-экранирования и лишних пробелов
+    def dumps(content):
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+# JSON массив из закодированных записей хранилища
+def encode_records(store, records):
+    return b"[" + b",".join([store.encoded(record) for record in records]) + b"]"
+
+
+@cache
+def _message_body(message):
+    return dumps({"success": True, "message": message})
+
+
+# ответ {"success": true, "message": ...} для обработчиков записи
+def message_response(message):
+    return Response(content=_message_body(message), media_type="application/json")
+
+
+@timed("serialize")
+def json_response(content, **kwargs):
+    return Response(content=dumps(content), media_type="application/json", **kwargs)
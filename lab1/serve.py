@@ -0,0 +1,124 @@
+# запуск в несколько процессов: один писатель и N читателей
+# запуск из папки lab1:
+#   python serve.py --workers 4 --port 8000 --writer-port 8001
+#
+# писатель (BOOKS_ROLE=writer) - обычный main.py на --writer-port: держит
+# каталог, принимает все записи и публикует снимок каталога в
+# <data-dir>/books.replica (см. replica.py). читатели (BOOKS_ROLE=reader)
+# слушают общий сокет на --port, отдают чтение из снимка через mmap, а
+# записи проксируют писателю: клиенту хватает одного адреса --port
+#
+# вход (/token) работает на любом процессе. с AUTH_BACKEND=hmac нужен
+# общий ключ: если AUTH_SECRET не задан, он выбирается здесь один на все
+# процессы. отзыв токена (/token/revoke) действует только в том процессе,
+# который его получил
+
+import argparse
+import multiprocessing
+import os
+import secrets
+import signal
+import socket
+import sys
+import time
+
+
+def bind(host, port):
+    # IPPROTO_TCP явно: иначе asyncio не включит TCP_NODELAY на соединениях
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+# в дочернем процессе: настройки - через окружение до импорта main
+def run_worker(env, sock):
+    import uvicorn
+
+    os.environ.update(env)
+    config = uvicorn.Config("main:app", access_log=False, log_level="warning")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+# адрес писателя для читателей: они на той же машине, и если писатель
+# слушает все интерфейсы (0.0.0.0), ходим к нему через loopback
+def writer_url(host, port):
+    if host in ("", "0.0.0.0"):
+        host = "127.0.0.1"
+    return f"http://{host}:{port}"
+
+
+def wait_for(path, timeout):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            raise SystemExit(f"писатель не опубликовал {path} за {timeout} с")
+        time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Писатель и N читателей каталога")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--writer-port", type=int, default=8001)
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--startup-timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    # читатели импортируют main из этой папки
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    os.makedirs(args.data_dir, exist_ok=True)
+    replica = os.path.abspath(os.path.join(args.data_dir, "books.replica"))
+    # старый снимок от прошлого запуска читателям не нужен
+    if os.path.exists(replica):
+        os.remove(replica)
+
+    env = {"BOOKS_REPLICA": replica}
+    if os.environ.get("AUTH_BACKEND") == "hmac" and not os.environ.get("AUTH_SECRET"):
+        env["AUTH_SECRET"] = secrets.token_hex(32)
+
+    ctx = multiprocessing.get_context("spawn")
+    processes = []
+    writer = ctx.Process(
+        target=run_worker,
+        args=({**env, "BOOKS_ROLE": "writer"}, bind(args.host, args.writer_port)),
+        name="books-writer",
+    )
+    writer.start()
+    processes.append(writer)
+    wait_for(replica, args.startup_timeout)
+
+    sock = bind(args.host, args.port)
+    reader_env = {
+        **env,
+        "BOOKS_ROLE": "reader",
+        "BOOKS_WRITER_URL": writer_url(args.host, args.writer_port),
+    }
+    for i in range(args.workers):
+        reader = ctx.Process(target=run_worker, args=(reader_env, sock), name=f"books-reader-{i}")
+        reader.start()
+        processes.append(reader)
+    print(f"писатель: http://{args.host}:{args.writer_port}, "
+          f"читателей: {args.workers} на http://{args.host}:{args.port}", flush=True)
+
+    def stop(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    # упал любой процесс - останавливаем всех
+    while all(process.is_alive() for process in processes):
+        time.sleep(0.2)
+    stop(None, None)
+    for process in processes:
+        process.join()
+    sys.exit(0 if all(process.exitcode in (0, -signal.SIGTERM) for process in processes) else 1)
+
+
+if __name__ == "__main__":
+    main()
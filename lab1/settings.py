@@ -0,0 +1,144 @@
+# настройки приложения
+#
+# всё берём из переменных окружения, чтобы одинаково настраивать и
+# `uvicorn main:app`, и несколько воркеров, и тесты
+#   APP_ENV             - development (по умолчанию) или production: в production
+#                         нет /docs, /redoc и /openapi.json
+#   BOOKS_BACKEND       - где хранить книжки: memory (по умолчанию) или sqlite
+#   BOOKS_ROLE          - single (один процесс), writer или reader (см. serve.py, replica.py)
+#   BOOKS_REPLICA       - файл снимка который писатель публикует для читателей
+#   BOOKS_WRITER_URL    - адрес писателя, туда читатели отправляют записи
+#   BOOKS_PUBLISH_INTERVAL - раз во сколько секунд писатель публикует изменения
+#   BOOKS_REPLICA_CHECK - раз во сколько секунд читатель проверяет новую версию
+#   BOOKS_DB_PATH       - файл базы для sqlite
+#   BOOKS_DB_POOL_SIZE  - сколько соединений с базой держать открытыми
+#   BOOKS_SNAPSHOT      - файл бинарного снимка для memory (пусто - без снимка,
+#                         а при включённом журнале - <BOOKS_LOG>.snap)
+#   BOOKS_LOG           - журнал изменений для memory (пусто - не вести), см. oplog.py
+#   BOOKS_LOG_FSYNC     - always (fsync перед ответом), interval или never
+#   BOOKS_LOG_INTERVAL  - раз во сколько секунд fsync при interval
+#   BOOKS_LOG_COMPACT_BYTES - при каком размере журнала сворачивать его в снимок
+#   BOOKS_WRITE_BATCH   - сколько одиночных записей применять одной пачкой
+#                         (0 - каждую сразу, без очереди, см. writer.py)
+#   BOOKS_CHANGES_CAPACITY - сколько последних изменений помнить для
+#                         GET /books/changes (0 - без ленты изменений)
+#   BOOKS_CACHE_MAX_BYTES   - сколько байт ответов держать в кэше (0 - не кэшировать)
+#   BOOKS_CACHE_MAX_ENTRIES - сколько ответов держать в кэше
+#   BOOKS_CACHE_TTL         - сколько секунд живёт ответ в кэше. кэш у каждого
+#                             воркера свой, поэтому при sqlite и нескольких
+#                             воркерах чужие изменения видны не позже чем через TTL
+#   COMPRESS_MIN_SIZE   - тела от скольки байт сжимать (0 - не сжимать), см. compression.py
+#   COMPRESS_OFFLOAD_SIZE - тела от скольки байт сжимать в пуле потоков
+#   COMPRESS_ENCODINGS  - кодировки через запятую в порядке предпочтения
+#                         (zstd и br - только если установлены zstandard и brotli)
+#   AUTH_BACKEND        - токены: static (фиксированные из users_db) или hmac (подписанные)
+#   AUTH_SECRET         - ключ подписи hmac-токенов, должен совпадать у всех воркеров
+#   AUTH_TOKEN_TTL      - сколько секунд живёт hmac-токен
+#   AUTH_CACHE_SIZE     - сколько проверенных токенов помнить
+#   USERS_PATH          - json с пользователями и хэшами паролей
+#   LOGIN_WORKERS       - потоков для проверки паролей
+#   LOGIN_CONCURRENCY   - сколько проверок паролей идёт одновременно
+#   LOGIN_ATTEMPTS, LOGIN_WINDOW - сколько неудачных входов на имя за сколько секунд
+#   RATE_LIMIT_READ, RATE_LIMIT_READ_BURST   - запросов в секунду и запас на
+#                         пользователя для чтения (0 - без ограничения, например 50 и 100)
+#   RATE_LIMIT_ADMIN, RATE_LIMIT_ADMIN_BURST - то же для записи админа
+#   RATE_LIMIT_MAX_KEYS - сколько пользователей помнить (давно не заходившие забываются)
+#   RATE_LIMIT_BACKEND  - memory (у каждого воркера свой лимит) или sqlite
+#                         (общий для воркеров, в файле RATE_LIMIT_DB_PATH)
+#   MAX_CONCURRENT_REQUESTS - сколько запросов воркер обрабатывает одновременно,
+#                         остальным сразу 503 (0 - без ограничения)
+#   SHED_RETRY_AFTER    - Retry-After в секундах для этих 503
+
+import os
+from dataclasses import dataclass
+
+
+@dataclass
+class Settings:
+    environment: str = "development"
+    backend: str = "memory"
+    role: str = "single"
+    replica_path: str = "books.replica"
+    writer_url: str = "http://127.0.0.1:8001"
+    publish_interval: float = 0.05
+    replica_check: float = 0.01
+    db_path: str = "books.db"
+    db_pool_size: int = 4
+    snapshot_path: str = ""
+    log_path: str = ""
+    log_fsync: str = "always"
+    log_interval: float = 0.01
+    log_compact_bytes: int = 64 * 2**20
+    write_batch: int = 0
+    changes_capacity: int = 10_000
+    cache_max_bytes: int = 64 * 2**20
+    cache_max_entries: int = 10_000
+    cache_ttl: float = 60.0
+    compress_min_size: int = 1024
+    compress_offload_size: int = 64 * 2**10
+    compress_encodings: str = "zstd,br,gzip"
+    auth_backend: str = "static"
+    auth_secret: str = ""
+    auth_token_ttl: int = 3600
+    auth_cache_size: int = 10_000
+    users_path: str = os.path.join(os.path.dirname(__file__), "users.json")
+    login_workers: int = 2
+    login_concurrency: int = 4
+    login_attempts: int = 5
+    login_window: float = 60.0
+    rate_limit_read: float = 0.0
+    rate_limit_read_burst: int = 100
+    rate_limit_admin: float = 0.0
+    rate_limit_admin_burst: int = 50
+    rate_limit_max_keys: int = 100_000
+    rate_limit_backend: str = "memory"
+    rate_limit_db_path: str = "ratelimit.db"
+    max_concurrent_requests: int = 1000
+    shed_retry_after: int = 1
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            environment=os.environ.get("APP_ENV", cls.environment),
+            backend=os.environ.get("BOOKS_BACKEND", cls.backend),
+            role=os.environ.get("BOOKS_ROLE", cls.role),
+            replica_path=os.environ.get("BOOKS_REPLICA", cls.replica_path),
+            writer_url=os.environ.get("BOOKS_WRITER_URL", cls.writer_url),
+            publish_interval=float(os.environ.get("BOOKS_PUBLISH_INTERVAL", cls.publish_interval)),
+            replica_check=float(os.environ.get("BOOKS_REPLICA_CHECK", cls.replica_check)),
+            db_path=os.environ.get("BOOKS_DB_PATH", cls.db_path),
+            db_pool_size=int(os.environ.get("BOOKS_DB_POOL_SIZE", cls.db_pool_size)),
+            snapshot_path=os.environ.get("BOOKS_SNAPSHOT") or (
+                f"{os.environ['BOOKS_LOG']}.snap" if os.environ.get("BOOKS_LOG") else cls.snapshot_path
+            ),
+            log_path=os.environ.get("BOOKS_LOG", cls.log_path),
+            log_fsync=os.environ.get("BOOKS_LOG_FSYNC", cls.log_fsync),
+            log_interval=float(os.environ.get("BOOKS_LOG_INTERVAL", cls.log_interval)),
+            log_compact_bytes=int(os.environ.get("BOOKS_LOG_COMPACT_BYTES", cls.log_compact_bytes)),
+            write_batch=int(os.environ.get("BOOKS_WRITE_BATCH", cls.write_batch)),
+            changes_capacity=int(os.environ.get("BOOKS_CHANGES_CAPACITY", cls.changes_capacity)),
+            cache_max_bytes=int(os.environ.get("BOOKS_CACHE_MAX_BYTES", cls.cache_max_bytes)),
+            cache_max_entries=int(os.environ.get("BOOKS_CACHE_MAX_ENTRIES", cls.cache_max_entries)),
+            cache_ttl=float(os.environ.get("BOOKS_CACHE_TTL", cls.cache_ttl)),
+            compress_min_size=int(os.environ.get("COMPRESS_MIN_SIZE", cls.compress_min_size)),
+            compress_offload_size=int(os.environ.get("COMPRESS_OFFLOAD_SIZE", cls.compress_offload_size)),
+            compress_encodings=os.environ.get("COMPRESS_ENCODINGS", cls.compress_encodings),
+            auth_backend=os.environ.get("AUTH_BACKEND", cls.auth_backend),
+            auth_secret=os.environ.get("AUTH_SECRET", cls.auth_secret),
+            auth_token_ttl=int(os.environ.get("AUTH_TOKEN_TTL", cls.auth_token_ttl)),
+            auth_cache_size=int(os.environ.get("AUTH_CACHE_SIZE", cls.auth_cache_size)),
+            users_path=os.environ.get("USERS_PATH", cls.users_path),
+            login_workers=int(os.environ.get("LOGIN_WORKERS", cls.login_workers)),
+            login_concurrency=int(os.environ.get("LOGIN_CONCURRENCY", cls.login_concurrency)),
+            login_attempts=int(os.environ.get("LOGIN_ATTEMPTS", cls.login_attempts)),
+            login_window=float(os.environ.get("LOGIN_WINDOW", cls.login_window)),
+            rate_limit_read=float(os.environ.get("RATE_LIMIT_READ", cls.rate_limit_read)),
+            rate_limit_read_burst=int(os.environ.get("RATE_LIMIT_READ_BURST", cls.rate_limit_read_burst)),
+            rate_limit_admin=float(os.environ.get("RATE_LIMIT_ADMIN", cls.rate_limit_admin)),
+            rate_limit_admin_burst=int(os.environ.get("RATE_LIMIT_ADMIN_BURST", cls.rate_limit_admin_burst)),
+            rate_limit_max_keys=int(os.environ.get("RATE_LIMIT_MAX_KEYS", cls.rate_limit_max_keys)),
+            rate_limit_backend=os.environ.get("RATE_LIMIT_BACKEND", cls.rate_limit_backend),
+            rate_limit_db_path=os.environ.get("RATE_LIMIT_DB_PATH", cls.rate_limit_db_path),
+            max_concurrent_requests=int(os.environ.get("MAX_CONCURRENT_REQUESTS", cls.max_concurrent_requests)),
+            shed_retry_after=int(os.environ.get("SHED_RETRY_AFTER", cls.shed_retry_after)),
+        )
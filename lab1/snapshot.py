@@ -0,0 +1,176 @@
+# бинарный снимок каталога для быстрого холодного старта
+#
+# вместо json, который при старте пришлось бы разбирать целиком, книжки
+# пишутся колонками фиксированной ширины плюс общая куча строк:
+#
+#   заголовок   MAGIC, версия формата, число книжек, next_id, seq,
+#               размер кучи и crc32 всего что после заголовка
+#   ids         int64[count]   айдишники по возрастанию
+#   versions    uint32[count]  версии книжек
+#   completed   int8[count]    -1 - поля нет, 0 / 1
+#   title_off   uint64[count+1] границы названий в куче
+#   author_off  uint64[count+1] границы авторов в куче
+#   heap        utf-8 строки подряд
+#
+# файл открывается через mmap, колонки читаются через memoryview прямо из
+# страниц файла: книжку по айдишнику находим бинарным поиском по ids и
+# разбираем только её. пишется снимок атомарно: во временный файл рядом,
+# fsync, os.replace
+#
+# seq - номер последней операции журнала вошедшей в снимок (см. oplog.py)
+
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+
+MAGIC = b"BKSNAP\0\0"
+FORMAT_VERSION = 1
+# magic, версия, флаги, count, next_id, seq, heap_size, crc32
+HEADER = struct.Struct("<8sIIQQQQI4x")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+# смещения колонок в файле для count книжек
+def _layout(count):
+    offset = HEADER.size
+    layout = {}
+    for name, width in (("ids", 8 * count), ("versions", 4 * count), ("completed", count),
+                        ("title_off", 8 * (count + 1)), ("author_off", 8 * (count + 1))):
+        layout[name] = (offset, width)
+        offset = _align(offset + width)
+    layout["heap"] = offset
+    return layout
+
+
+# пишем снимок: rows - кортежи (id, title, author, completed, version)
+# по возрастанию id
+def write_snapshot(path, rows, next_id, seq=0):
+    ids = array("q")
+    versions = array("I")
+    completed = array("b")
+    title_off = array("Q", [0])
+    author_off = array("Q")
+    titles = bytearray()
+    authors = bytearray()
+    for book_id, title, author, done, version in rows:
+        ids.append(book_id)
+        versions.append(version)
+        completed.append(-1 if done is None else int(done))
+        titles += title.encode()
+        title_off.append(len(titles))
+        authors += author.encode()
+        author_off.append(len(authors))
+    # авторы лежат в куче после названий
+    author_off = array("Q", [len(titles)] + [len(titles) + off for off in author_off])
+    count = len(ids)
+    layout = _layout(count)
+    body = bytearray(layout["heap"] - HEADER.size + len(titles) + len(authors))
+    for name, column in (("ids", ids), ("versions", versions), ("completed", completed),
+                         ("title_off", title_off), ("author_off", author_off)):
+        offset, width = layout[name]
+        body[offset - HEADER.size:offset - HEADER.size + width] = column.tobytes()
+    body[layout["heap"] - HEADER.size:] = titles + authors
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, count, next_id, seq,
+                         len(titles) + len(authors), zlib.crc32(body))
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    # fsync каталога, чтобы переименование пережило сбой питания
+    dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+# снимок открытый через mmap, книжки разбираются по одной по запросу
+class MappedSnapshot:
+    def __init__(self, path, verify=True):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < HEADER.size:
+            raise SnapshotError("Файл снимка обрезан")
+        magic, fmt, _, count, next_id, seq, heap_size, crc = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise SnapshotError("Это не снимок каталога")
+        if fmt != FORMAT_VERSION:
+            raise SnapshotError(f"Неизвестная версия снимка: {fmt}")
+        layout = _layout(count)
+        if len(self._mmap) != layout["heap"] + heap_size:
+            raise SnapshotError("Размер снимка не совпадает с заголовком")
+        view = memoryview(self._mmap)
+        if verify and zlib.crc32(view[HEADER.size:]) != crc:
+            raise SnapshotError("Контрольная сумма снимка не совпала")
+        self.count = count
+        self.next_id = next_id
+        self.seq = seq
+
+        def column(name, fmt):
+            offset, width = layout[name]
+            return view[offset:offset + width].cast(fmt)
+
+        self.ids = column("ids", "q")
+        self._versions = column("versions", "I")
+        self._completed = column("completed", "b")
+        self._title_off = column("title_off", "Q")
+        self._author_off = column("author_off", "Q")
+        self._heap = view[layout["heap"]:]
+        self._view = view
+
+    def close(self):
+        for name in ("ids", "_versions", "_completed", "_title_off", "_author_off", "_heap", "_view"):
+            getattr(self, name).release()
+        self._mmap.close()
+
+    def __len__(self):
+        return self.count
+
+    # позиция книжки в колонках или -1
+    def find(self, book_id):
+        i = bisect_left(self.ids, book_id)
+        if i < self.count and self.ids[i] == book_id:
+            return i
+        return -1
+
+    # позиция первой книжки с айдишником больше after
+    def position_after(self, after):
+        return 0 if after is None else bisect_right(self.ids, after)
+
+    def _string(self, offsets, i):
+        return str(self._heap[offsets[i]:offsets[i + 1]], "utf-8")
+
+    def title(self, i):
+        return self._string(self._title_off, i)
+
+    def author(self, i):
+        return self._string(self._author_off, i)
+
+    def completed(self, i):
+        value = self._completed[i]
+        return None if value < 0 else bool(value)
+
+    def version(self, i):
+        return self._versions[i]
+
+    # книжка в том же виде что отдаёт хранилище
+    def record(self, i):
+        book = {"id": self.ids[i], "title": self.title(i), "author": self.author(i)}
+        completed = self.completed(i)
+        if completed is not None:
+            book["completed"] = completed
+        return book
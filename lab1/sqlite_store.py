@@ -0,0 +1,381 @@
+# хранилище книжек в SQLite
+#
+# тот же интерфейс что у BookStore из store.py, но данные лежат в файле и
+# переживают перезапуск, а несколько воркеров uvicorn видят одну базу.
+# база в режиме WAL: читатели не ждут писателя. запросы - постоянные
+# строки с параметрами, sqlite3 держит их скомпилированными в кэше
+# соединения. соединения берутся из пула, а сами вызовы main.py уводит
+# в пул потоков (blocking = True), чтобы цикл событий не ждал диск
+#
+# айдишники выдаёт сама база (AUTOINCREMENT): они только растут и не
+# повторяются даже если пишут несколько процессов. версия книжки - колонка
+# version, проверка If-Match делается в том же UPDATE/DELETE (WHERE version)
+#
+# для поиска (search) рядом лежит таблица FTS5 books_fts: слова названия и
+# автора после search.tokenize, её поддерживают триггеры на books, а
+# ранжирует сам SQLite (bm25 с весами полей из search.WEIGHTS). триггеры
+# вызывают py_tokens, поэтому писать в базу можно только через этот класс
+
+import queue
+import sqlite3
+from contextlib import contextmanager
+
+from analytics import stats_result
+from search import WEIGHTS, tokenize
+from serialization import dumps
+from store import MissingBooks, VersionConflict, count_call
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    completed INTEGER,
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS books_title ON books (title);
+CREATE INDEX IF NOT EXISTS books_author ON books (author);
+CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+    title, author, tokenize = 'unicode61 remove_diacritics 0'
+);
+CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+    INSERT INTO books_fts (rowid, title, author)
+    VALUES (new.id, py_tokens(new.title), py_tokens(new.author));
+END;
+CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+    DELETE FROM books_fts WHERE rowid = old.id;
+END;
+CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, author ON books BEGIN
+    UPDATE books_fts SET title = py_tokens(new.title), author = py_tokens(new.author)
+    WHERE rowid = new.id;
+END;
+"""
+
+COLUMNS = ("title", "author", "completed")
+
+SELECT = "SELECT id, title, author, completed FROM books"
+SELECT_VERSIONED = "SELECT id, title, author, completed, version FROM books"
+
+SEARCH = f"""
+SELECT books.id, books.title, books.author, books.completed, -bm25(books_fts, {WEIGHTS["title"]}, {WEIGHTS["author"]})
+FROM books_fts JOIN books ON books.id = books_fts.rowid
+WHERE books_fts MATCH ?
+ORDER BY bm25(books_fts, {WEIGHTS["title"]}, {WEIGHTS["author"]}), books.id
+LIMIT ?
+"""
+
+
+# слова через пробел: unicode61 дальше просто режет по пробелам
+def _tokens(text):
+    return " ".join(tokenize(text))
+
+
+# строка базы -> запись книжки как в BookStore
+# (completed = NULL значит что поля у книжки нет, как у добавленных через POST)
+def _record(row):
+    book = {"id": row[0], "title": row[1], "author": row[2]}
+    if row[3] is not None:
+        book["completed"] = bool(row[3])
+    return book
+
+
+def _values(fields):
+    unknown = set(fields) - set(COLUMNS)
+    if unknown:
+        raise ValueError(f"Неизвестные поля: {', '.join(sorted(unknown))}")
+    return {
+        name: int(value) if name == "completed" and value is not None else value
+        for name, value in fields.items()
+    }
+
+
+class SQLiteBookStore:
+    # вызовы ходят на диск, их надо выполнять в пуле потоков
+    blocking = True
+
+    def __init__(self, path, pool_size=4, books=None):
+        self.path = path
+        self._pool = queue.Queue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+        with self._connection() as conn:
+            fresh_fts = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'books_fts'"
+            ).fetchone() is None
+            conn.executescript(SCHEMA)
+            # базы созданные до появления поиска
+            if fresh_fts:
+                conn.execute(
+                    "INSERT INTO books_fts (rowid, title, author) "
+                    "SELECT id, py_tokens(title), py_tokens(author) FROM books"
+                )
+            # базы созданные до появления версий
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(books)")]
+            if "version" not in columns:
+                conn.execute("ALTER TABLE books ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+            # начальные книжки кладём только в пустую базу
+            if books and conn.execute("SELECT 1 FROM books LIMIT 1").fetchone() is None:
+                with self._transaction(conn):
+                    for book in sorted(books, key=lambda b: b["id"]):
+                        values = _values({k: v for k, v in book.items() if k != "id"})
+                        conn.execute(
+                            "INSERT INTO books (id, title, author, completed) VALUES (?, ?, ?, ?)",
+                            (book["id"], values["title"], values["author"], values.get("completed")),
+                        )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        # lower() в SQLite понимает только латиницу, берём питоновский
+        conn.create_function("py_lower", 1, str.lower, deterministic=True)
+        conn.create_function("py_tokens", 1, _tokens, deterministic=True)
+        return conn
+
+    # соединение из пула на время вызова
+    @contextmanager
+    def _connection(self):
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    # транзакция на запись: BEGIN IMMEDIATE сразу берёт блокировку записи,
+    # чтобы проверка и изменение в пакетах шли без чужих записей между ними
+    @contextmanager
+    def _transaction(self, conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get().close()
+
+    def __len__(self):
+        with self._connection() as conn:
+            return conn.execute("SELECT count(*) FROM books").fetchone()[0]
+
+    def __iter__(self):
+        # идём страницами, чтобы не держать всю таблицу в памяти
+        after = None
+        while True:
+            records = self.page(after=after, limit=1000)
+            if not records:
+                return
+            yield from records
+            after = records[-1]["id"]
+
+    def __contains__(self, book_id):
+        with self._connection() as conn:
+            return conn.execute("SELECT 1 FROM books WHERE id = ?", (book_id,)).fetchone() is not None
+
+    def all(self):
+        return self.page()
+
+    def get(self, book_id):
+        count_call("get")
+        with self._connection() as conn:
+            row = conn.execute(SELECT + " WHERE id = ?", (book_id,)).fetchone()
+        return None if row is None else _record(row)
+
+    # книжку могут поменять другие процессы, поэтому байты не храним
+    def encoded(self, record):
+        return dumps(record)
+
+    def versioned(self, book_id):
+        count_call("get")
+        with self._connection() as conn:
+            row = conn.execute(SELECT_VERSIONED + " WHERE id = ?", (book_id,)).fetchone()
+        return None if row is None else (_record(row), row[4])
+
+    # условие на версию для UPDATE/DELETE
+    @staticmethod
+    def _version_clause(expected):
+        if expected is None:
+            return "", []
+        expected = list(expected)
+        return f" AND version IN ({','.join('?' * len(expected))})", expected
+
+    # запись не прошла: книжки нет (None) или версия не совпала
+    @staticmethod
+    def _conflict(conn, book_id):
+        row = conn.execute("SELECT version FROM books WHERE id = ?", (book_id,)).fetchone()
+        if row is not None:
+            raise VersionConflict(row[0])
+
+    def _add(self, conn, fields):
+        values = _values(fields)
+        cur = conn.execute(
+            "INSERT INTO books (title, author, completed) VALUES (?, ?, ?)",
+            (values["title"], values["author"], values.get("completed")),
+        )
+        return {"id": cur.lastrowid, **fields}
+
+    def _update(self, conn, book_id, fields, expected_version=None):
+        values = _values(fields)
+        names = sorted(values)
+        clause, params = self._version_clause(expected_version)
+        assignments = "".join(f"{n} = ?, " for n in names)
+        cur = conn.execute(
+            f"UPDATE books SET {assignments}version = version + 1 WHERE id = ?{clause}",
+            [values[n] for n in names] + [book_id] + params,
+        )
+        if cur.rowcount == 0:
+            self._conflict(conn, book_id)
+            return None
+        row = conn.execute(SELECT + " WHERE id = ?", (book_id,)).fetchone()
+        return _record(row)
+
+    def add(self, **fields):
+        count_call("add")
+        with self._connection() as conn:
+            return self._add(conn, fields)
+
+    def update(self, book_id, expected_version=None, **fields):
+        count_call("update")
+        with self._connection() as conn, self._transaction(conn):
+            return self._update(conn, book_id, fields, expected_version)
+
+    def delete(self, book_id, expected_version=None):
+        count_call("delete")
+        clause, params = self._version_clause(expected_version)
+        with self._connection() as conn, self._transaction(conn):
+            cur = conn.execute(f"DELETE FROM books WHERE id = ?{clause}", [book_id] + params)
+            if cur.rowcount == 0:
+                self._conflict(conn, book_id)
+                return False
+        return True
+
+    # айдишники из ids которых нет в базе
+    def _missing(self, conn, ids):
+        ids = list(ids)
+        found = set()
+        # не больше 500 параметров в одном запросе
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(
+                row[0] for row in
+                conn.execute(f"SELECT id FROM books WHERE id IN ({placeholders})", chunk)
+            )
+        return [book_id for book_id in ids if book_id not in found]
+
+    def add_many(self, items):
+        with self._connection() as conn, self._transaction(conn):
+            return [self._add(conn, fields) for fields in items]
+
+    def update_many(self, items):
+        items = list(items)
+        with self._connection() as conn, self._transaction(conn):
+            missing = self._missing(conn, [book_id for book_id, _ in items])
+            if missing:
+                raise MissingBooks(missing)
+            return [self._update(conn, book_id, fields) for book_id, fields in items]
+
+    def delete_many(self, ids):
+        ids = list(ids)
+        with self._connection() as conn, self._transaction(conn):
+            missing = self._missing(conn, ids)
+            if missing:
+                raise MissingBooks(missing)
+            conn.executemany("DELETE FROM books WHERE id = ?", [(i,) for i in ids])
+        return [True] * len(ids)
+
+    def _select(self, where, params, after, offset, limit):
+        if after is not None:
+            where.append("id > ?")
+            params.append(after)
+        sql = SELECT
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset]
+        with self._connection() as conn:
+            return [_record(row) for row in conn.execute(sql, params)]
+
+    def page(self, after=None, offset=0, limit=None):
+        count_call("page")
+        return self._select([], [], after, offset, limit)
+
+    # те же правила что у BookStore.filter: подстрока без учёта регистра
+    def filter(self, title=None, author=None, completed=None,
+               after=None, offset=0, limit=None):
+        count_call("filter")
+        where = []
+        params = []
+        if title:
+            where.append("instr(py_lower(title), ?) > 0")
+            params.append(title.lower())
+        if author:
+            where.append("instr(py_lower(author), ?) > 0")
+            params.append(author.lower())
+        if completed is not None:
+            where.append("completed = ?")
+            params.append(int(completed))
+        return self._select(where, params, after, offset, limit)
+
+    # те же правила что у BookStore.search: лучшие limit книжек по словам
+    def search(self, query, limit=10):
+        count_call("search")
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words:
+            return []
+        match = " OR ".join(f'"{word}"' for word in words)
+        with self._connection() as conn:
+            return [
+                {**_record(row), "score": row[4]}
+                for row in conn.execute(SEARCH, (match, limit))
+            ]
+
+    # условия отчётов (см. analytics.py) для WHERE
+    @staticmethod
+    def _report_where(authors, completed, id_min, id_max):
+        where = []
+        params = []
+        if authors:
+            authors = list(dict.fromkeys(authors))
+            where.append(f"author IN ({','.join('?' * len(authors))})")
+            params += authors
+        if completed is not None:
+            where.append("completed = ?")
+            params.append(int(completed))
+        if id_min is not None:
+            where.append("id >= ?")
+            params.append(id_min)
+        if id_max is not None:
+            where.append("id <= ?")
+            params.append(id_max)
+        return where, params
+
+    # те же правила что у BookStore.query
+    def query(self, authors=None, completed=None, id_min=None, id_max=None,
+              after=None, offset=0, limit=None):
+        count_call("query")
+        where, params = self._report_where(authors, completed, id_min, id_max)
+        return self._select(where, params, after, offset, limit)
+
+    # те же правила что у BookStore.stats: группирует сама база
+    def stats(self, authors=None, completed=None, id_min=None, id_max=None, top=None):
+        count_call("stats")
+        where, params = self._report_where(authors, completed, id_min, id_max)
+        sql = "SELECT author, count(*), sum(completed IS 1), sum(completed IS 0) FROM books"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " GROUP BY author"
+        with self._connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        rows.sort(key=lambda row: (-row[1], row[0]))
+        return stats_result(
+            sum(row[1] for row in rows),
+            sum(row[2] for row in rows),
+            sum(row[3] for row in rows),
+            len(rows),
+            [(author, count, done) for author, count, done, _ in rows[:top]],
+        )
@@ -0,0 +1,465 @@
+# хранилище книжек в памяти
+#
+# раньше книжки лежали в обычном списке и каждый запрос по айдишнику
+# пробегал его целиком. тут держим словарь id -> запись: поиск, обновление
+# и удаление за O(1), а порядок обхода остаётся порядком добавления
+# (словари в питоне его сохраняют). айдишники выдаются по возрастанию,
+# поэтому порядок добавления совпадает с порядком айдишников
+#
+# для filter_books хранилище держит индексы из indexes.py, для
+# search_books - индексы поиска из search.py, а для отчётов - колонки из
+# analytics.py, и обновляет их при каждой записи
+#
+# для постраничной выдачи рядом лежит отсортированный список айдишников:
+# курсор (айдишник последней отданной книжки) находим бинарным поиском.
+# удалённые айдишники из списка не вырезаем сразу (это O(n)), а чистим
+# пачкой когда их накопится много
+#
+# у каждой книжки есть версия, она растёт при каждом изменении. по ней
+# main.py строит ETag, и запись с If-Match применяется только если книжку
+# никто не поменял с тех пор как клиент её прочитал (VersionConflict иначе)
+#
+# закодированный JSON каждой книжки тоже хранится здесь (encoded) и
+# выбрасывается при изменении книжки, см. serialization.py
+#
+# внутри книжки лежат компактными записями Book (records.py), а наружу
+# отдаются обычными словарями
+#
+# хранилище можно поднять из снимка (snapshot.py) без разбора всех книжек:
+# чтение, страницы и фильтр идут прямо из mmap снимка, а в память книжки
+# переезжают в фоновом потоке (load_in_background, его запускает
+# main.start) или при первой записи. пока книжки в снимке, хранилище
+# blocking: фильтр - перебор всего снимка, а запись ждёт переезда, поэтому
+# main.py вызывает его в пуле потоков, а не в цикле событий. переезд и
+# записи идут под self._lock, чтение из снимка - без него
+
+import os
+import sys
+import threading
+from bisect import bisect_right
+from functools import wraps
+from itertools import islice
+
+from analytics import ColumnIndex
+from indexes import TrigramIndex, ValueIndex
+from records import Book
+from search import SearchIndex, top_k
+from metrics import registry
+from serialization import dumps
+from snapshot import MappedSnapshot, write_snapshot
+
+
+# пакетная операция ссылается на книжки которых нет (ничего не применено)
+class MissingBooks(LookupError):
+    def __init__(self, ids):
+        super().__init__(ids)
+        self.ids = ids
+
+
+# книжку успели изменить: версия не совпала с ожидаемой (ничего не применено)
+class VersionConflict(Exception):
+    def __init__(self, version):
+        super().__init__(version)
+        # текущая версия книжки
+        self.version = version
+
+
+# хранилище по настройкам: memory - этот класс, sqlite - SQLiteBookStore
+# books - начальные книжки (в sqlite кладутся только в пустую базу,
+# в memory - если нет снимка settings.snapshot_path)
+def open_store(settings, books=None):
+    if settings.backend == "memory":
+        if settings.snapshot_path and os.path.exists(settings.snapshot_path):
+            return BookStore(snapshot=MappedSnapshot(settings.snapshot_path))
+        return BookStore(books)
+    if settings.backend == "sqlite":
+        from sqlite_store import SQLiteBookStore
+        return SQLiteBookStore(settings.db_path, settings.db_pool_size, books)
+    raise ValueError(f"Неизвестное хранилище: {settings.backend}")
+
+
+# метки для счётчиков (см. metrics.py), заранее, чтобы не собирать на каждый вызов
+_OPS = {op: (("op", op),) for op in ("get", "page", "filter", "search", "query", "stats", "add", "update", "delete")}
+
+
+def count_call(op):
+    registry.inc("books_store_calls_total", _OPS[op])
+
+
+# метод хранилища под self._lock (см. начало файла)
+def _locked(method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class BookStore:
+    def __init__(self, books=None, snapshot=None, vectorized=None):
+        # переезд из снимка и записи (могут идти в разных потоках)
+        self._lock = threading.RLock()
+        # id -> запись книжки (Book)
+        self._records = {}
+        # снимок из которого ещё не перенесли книжки в память
+        self._snapshot = snapshot
+        # следующий свободный айдишник (только растёт, удалённые не переиспользуем)
+        self._next_id = 1
+        # айдишники по возрастанию (могут быть уже удалённые) и сколько таких
+        self._ids = []
+        self._dead = 0
+        # индексы для фильтрации
+        self._title_index = TrigramIndex("title")
+        self._author_index = TrigramIndex("author")
+        self._completed_index = ValueIndex("completed")
+        # индексы поиска (по словам, с ранжированием)
+        self._search = [SearchIndex("title"), SearchIndex("author")]
+        # колонки для отчётов (vectorized - через numpy, None - если он есть)
+        self._columns = ColumnIndex(vectorized)
+        self._indexes = [
+            self._title_index, self._author_index, self._completed_index, *self._search, self._columns,
+        ]
+        if snapshot is not None:
+            self._next_id = snapshot.next_id
+        for book in sorted(books or (), key=lambda b: b["id"]):
+            self._insert(Book.from_dict(book))
+
+    def _insert(self, book):
+        self._records[book.id] = book
+        self._ids.append(book.id)
+        if book.id >= self._next_id:
+            self._next_id = book.id + 1
+        for index in self._indexes:
+            index.add(book)
+
+    # пока книжки в снимке - вызывать в пуле потоков, потом всё в памяти и
+    # можно прямо из цикла событий
+    @property
+    def blocking(self):
+        return self._snapshot is not None
+
+    # переносим книжки из снимка в память (дальше снимок не нужен). снимок
+    # убираем только когда всё перенесено: до этого чтение идёт из него.
+    # явно не закрываем - его ещё может читать другой поток
+    @_locked
+    def load(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return
+        for i in range(len(snapshot)):
+            self._insert(Book(
+                id=snapshot.ids[i],
+                title=snapshot.title(i),
+                author=sys.intern(snapshot.author(i)),
+                completed=snapshot.completed(i),
+                version=snapshot.version(i),
+            ))
+        self._next_id = max(self._next_id, snapshot.next_id)
+        self._snapshot = None
+
+    # переезд из снимка в фоновом потоке
+    def load_in_background(self):
+        if self._snapshot is not None:
+            threading.Thread(target=self.load, name="books-load", daemon=True).start()
+
+    # все книжки кортежами для write_snapshot
+    def snapshot_rows(self):
+        return [book.row() for book in self.snapshot_records()]
+
+    # записи книжек списком: его можно обходить в другом потоке, пока цикл
+    # событий меняет хранилище (см. replica.py)
+    @_locked
+    def snapshot_records(self):
+        self.load()
+        return list(self._records.values())
+
+    # кортеж одной книжки для write_snapshot, None если её нет
+    @_locked
+    def snapshot_row(self, book_id):
+        self.load()
+        book = self._records.get(book_id)
+        return None if book is None else book.row()
+
+    # айдишник который получит следующая книжка
+    @property
+    def next_id(self):
+        return self._next_id
+
+    # сохраняем снимок (seq - номер последней операции журнала в нём)
+    def save_snapshot(self, path, seq=0):
+        write_snapshot(path, self.snapshot_rows(), self._next_id, seq)
+
+    def __len__(self):
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return len(snapshot)
+        return len(self._records)
+
+    def __iter__(self):
+        self.load()
+        return (book.to_dict() for book in self._records.values())
+
+    def __contains__(self, book_id):
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot.find(book_id) >= 0
+        return book_id in self._records
+
+    # все книжки списком (в порядке добавления)
+    @_locked
+    def all(self):
+        self.load()
+        return [book.to_dict() for book in self._records.values()]
+
+    # книжка по айдишнику или None
+    def get(self, book_id):
+        found = self.versioned(book_id)
+        return None if found is None else found[0]
+
+    # книжка и её версия, None если книжки нет
+    def versioned(self, book_id):
+        count_call("get")
+        snapshot = self._snapshot
+        if snapshot is not None:
+            i = snapshot.find(book_id)
+            if i < 0:
+                return None
+            return snapshot.record(i), snapshot.version(i)
+        with self._lock:
+            book = self._records.get(book_id)
+            if book is None:
+                return None
+            return book.to_dict(), book.version
+
+    # книжка (словарь из этого хранилища) в JSON, кодируем один раз до
+    # следующего изменения
+    def encoded(self, record):
+        book = self._records.get(record["id"])
+        if book is None:
+            return dumps(record)
+        if book.encoded is None:
+            book.encoded = dumps(record)
+        return book.encoded
+
+    # проверка версии перед записью: expected - допустимые версии или None
+    @staticmethod
+    def _check_version(book, expected):
+        if expected is not None and book.version not in expected:
+            raise VersionConflict(book.version)
+
+    # добавляем новую книжку, айдишник выдаёт само хранилище
+    @_locked
+    def add(self, **fields):
+        count_call("add")
+        self.load()
+        book = Book.from_dict({"id": self._next_id, **fields})
+        self._insert(book)
+        return book.to_dict()
+
+    # обновляем переданные поля, None если книжки нет
+    @_locked
+    def update(self, book_id, expected_version=None, **fields):
+        count_call("update")
+        self.load()
+        book = self._records.get(book_id)
+        if book is None:
+            return None
+        self._check_version(book, expected_version)
+        # переиндексируем только затронутые поля (field None - вся запись)
+        touched = [index for index in self._indexes if index.field is None or index.field in fields]
+        for index in touched:
+            index.remove(book)
+        book.set(fields)
+        book.version += 1
+        book.encoded = None
+        for index in touched:
+            index.add(book)
+        return book.to_dict()
+
+    # кладём книжку как есть, с её айдишником и версией (повтор журнала,
+    # см. oplog.py). существующая книжка заменяется на своём месте, новая
+    # добавляется в конец: журнал пишется в порядке выдачи айдишников
+    @_locked
+    def restore(self, record, version):
+        self.load()
+        book = Book.from_dict(record)
+        book.version = version
+        old = self._records.get(book.id)
+        if old is None:
+            self._insert(book)
+            return
+        for index in self._indexes:
+            index.remove(old)
+            index.add(book)
+        self._records[book.id] = book
+
+    # пакетные версии add/update/delete: либо применяется всё, либо
+    # ничего и MissingBooks со списком отсутствующих айдишников
+    @_locked
+    def add_many(self, items):
+        return [self.add(**fields) for fields in items]
+
+    @_locked
+    def update_many(self, items):
+        items = list(items)
+        self._check_exist(book_id for book_id, _ in items)
+        return [self.update(book_id, **fields) for book_id, fields in items]
+
+    @_locked
+    def delete_many(self, ids):
+        ids = list(ids)
+        self._check_exist(ids)
+        return [self.delete(book_id) for book_id in ids]
+
+    def _check_exist(self, ids):
+        self.load()
+        missing = [book_id for book_id in ids if book_id not in self._records]
+        if missing:
+            raise MissingBooks(missing)
+
+    # удаляем книжку, False если её не было
+    @_locked
+    def delete(self, book_id, expected_version=None):
+        count_call("delete")
+        self.load()
+        book = self._records.get(book_id)
+        if book is None:
+            return False
+        self._check_version(book, expected_version)
+        del self._records[book_id]
+        for index in self._indexes:
+            index.remove(book)
+        self._dead += 1
+        if self._dead > len(self._records):
+            self._ids = list(self._records)
+            self._dead = 0
+        return True
+
+    # страница книжек: после айдишника after (курсор) или со смещением offset
+    def page(self, after=None, offset=0, limit=None):
+        count_call("page")
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return self._snapshot_filter(snapshot, None, None, None, after, offset, limit)
+        with self._lock:
+            return self._page(after, offset, limit)
+
+    def _page(self, after, offset, limit):
+        if after is None:
+            records = islice(self._records.values(), offset, None)
+        else:
+            start = bisect_right(self._ids, after)
+            ids = self._ids
+            records = (
+                self._records[ids[j]] for j in range(start, len(ids))
+                if ids[j] in self._records
+            )
+            records = islice(records, offset, None)
+        if limit is not None:
+            records = islice(records, limit)
+        return [book.to_dict() for book in records]
+
+    # фильтрация по подстроке в названии/авторе и по completed
+    # результат тот же что у старого перебора списка в filter_books,
+    # after/offset/limit работают так же как в page()
+    def filter(self, title=None, author=None, completed=None,
+               after=None, offset=0, limit=None):
+        count_call("filter")
+        title = title.lower() if title else None
+        author = author.lower() if author else None
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return self._snapshot_filter(snapshot, title, author, completed, after, offset, limit)
+        with self._lock:
+            return self._filter(title, author, completed, after, offset, limit)
+
+    def _filter(self, title, author, completed, after, offset, limit):
+        # собираем множества кандидатов от индексов
+        sets = []
+        if title:
+            sets.append(self._candidates(self._title_index, title))
+        if author:
+            sets.append(self._candidates(self._author_index, author))
+        if completed is not None:
+            sets.append(self._candidates(self._completed_index, completed))
+        sets = [ids for ids in sets if ids is not None]
+        if sets:
+            # пересекаем начиная с самого дешёвого
+            sets.sort(key=len)
+            ids = set(sets[0])
+            for other in sets[1:]:
+                ids &= other
+        elif title or author:
+            # короткие запросы, индекс не помог - проверяем всех
+            ids = self._records.keys()
+        else:
+            return self._page(after, offset, limit)
+        # подтверждаем подстроки (триграммы дают только кандидатов)
+        if title:
+            ids = [i for i in ids if self._title_index.matches(i, title)]
+        if author:
+            ids = [i for i in ids if self._author_index.matches(i, author)]
+        ids = sorted(ids)
+        start = 0 if after is None else bisect_right(ids, after)
+        start += offset
+        end = None if limit is None else start + limit
+        return [self._records[i].to_dict() for i in ids[start:end]]
+
+    # поиск по словам в названии и авторе: лучшие limit книжек, у каждой
+    # её score. индексов поиска в снимке нет, поэтому книжки из него
+    # переезжают в память как при первой записи
+    @_locked
+    def search(self, query, limit=10):
+        count_call("search")
+        self.load()
+        return [
+            {**self._records[book_id].to_dict(), "score": score}
+            for book_id, score in top_k(self._search, query, limit)
+        ]
+
+    # выборка для отчётов по колонкам (см. analytics.py): авторы из
+    # списка authors, completed, айдишники от id_min до id_max включительно.
+    # after/offset/limit работают так же как в page(). колонок в снимке нет,
+    # поэтому книжки из него переезжают в память как при первой записи
+    @_locked
+    def query(self, authors=None, completed=None, id_min=None, id_max=None,
+              after=None, offset=0, limit=None):
+        count_call("query")
+        self.load()
+        ids = self._columns.select(authors, completed, id_min, id_max, after, offset, limit)
+        return [self._records[i].to_dict() for i in ids]
+
+    # сводка по тем же условиям: сколько книжек, доля прочитанных и top
+    # авторов по числу книжек
+    @_locked
+    def stats(self, authors=None, completed=None, id_min=None, id_max=None, top=None):
+        count_call("stats")
+        self.load()
+        return self._columns.stats(authors, completed, id_min, id_max, top)
+
+    # кандидаты от индекса со счётчиком: hit - индекс сузил поиск, scan - нет
+    @staticmethod
+    def _candidates(index, query):
+        ids = index.candidates(query)
+        result = "scan" if ids is None else "hit"
+        registry.inc("books_index_lookups_total", (("index", index.field), ("result", result)))
+        return ids
+
+    # страница или фильтр прямо по колонкам снимка (индексов ещё нет)
+    @staticmethod
+    def _snapshot_filter(snapshot, title, author, completed, after, offset, limit):
+        records = []
+        for i in range(snapshot.position_after(after), len(snapshot)):
+            if completed is not None and snapshot.completed(i) != completed:
+                continue
+            if title and title not in snapshot.title(i).lower():
+                continue
+            if author and author not in snapshot.author(i).lower():
+                continue
+            if offset:
+                offset -= 1
+                continue
+            if limit is not None and len(records) >= limit:
+                break
+            records.append(snapshot.record(i))
+        return records
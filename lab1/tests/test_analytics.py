@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+from analytics import HAVE_NUMPY
+from sqlite_store import SQLiteBookStore
+from store import BookStore
+from tests.test_indexes import random_book
+
+ENGINES = ["python", "sqlite"] + (["numpy"] if HAVE_NUMPY else [])
+
+
+# отчёты старым способом: перебор словарей книжек
+def reference_query(books, authors=None, completed=None, id_min=None, id_max=None):
+    found = books
+    if authors:
+        authors = set(authors)
+        found = [b for b in found if b["author"] in authors]
+    if completed is not None:
+        found = [b for b in found if b.get("completed") == completed]
+    if id_min is not None:
+        found = [b for b in found if b["id"] >= id_min]
+    if id_max is not None:
+        found = [b for b in found if b["id"] <= id_max]
+    return found
+
+
+def reference_stats(books, top=None, **query):
+    found = reference_query(books, **query)
+    groups = {}
+    for b in found:
+        count, done = groups.get(b["author"], (0, 0))
+        groups[b["author"]] = (count + 1, done + (b.get("completed") is True))
+    finished = sum(b.get("completed") is True for b in found)
+    unfinished = sum(b.get("completed") is False for b in found)
+    order = sorted(groups, key=lambda a: (-groups[a][0], a))[:top]
+    return {
+        "count": len(found),
+        "completed": finished,
+        "not_completed": unfinished,
+        "unknown": len(found) - finished - unfinished,
+        "completed_ratio": finished / len(found) if found else None,
+        "author_count": len(groups),
+        "authors": [
+            {"author": a, "count": groups[a][0], "completed": groups[a][1],
+             "completed_ratio": groups[a][1] / groups[a][0]}
+            for a in order
+        ],
+    }
+
+
+@pytest.fixture(params=ENGINES)
+def make_store(request, tmp_path):
+    def make(books):
+        if request.param == "sqlite":
+            return SQLiteBookStore(str(tmp_path / "books.db"), 2, books)
+        return BookStore(books, vectorized=request.param == "numpy")
+    return make
+
+
+QUERIES = [
+    {},
+    {"authors": ["Вася"]},
+    {"authors": ["Вася", "Петя", "Никто"], "completed": True},
+    {"completed": False},
+    {"id_min": 50, "id_max": 120},
+    {"authors": ["Маша", "Петя"], "completed": True, "id_min": 10},
+    {"authors": ["Никто"]},
+]
+
+
+# колонки дают то же что перебор, в том числе после записей и удалений
+def test_matches_row_path(make_store):
+    rng = random.Random(7)
+    store = make_store([random_book(rng, i) for i in range(1, 201)])
+    for step in range(400):
+        op = rng.random()
+        book_id = rng.randint(1, 230)
+        if op < 0.25:
+            store.add(**{k: v for k, v in random_book(rng, 0).items() if k != "id"})
+        elif op < 0.6:
+            fields = {k: v for k, v in random_book(rng, 0).items() if k in ("author", "completed")}
+            if book_id in store:
+                store.update(book_id, **fields)
+        else:
+            store.delete(book_id)
+        if step % 50 == 0:
+            books = store.all()
+            for query in QUERIES:
+                assert store.query(**query) == reference_query(books, **query)
+                assert store.stats(**query) == reference_stats(books, **query)
+                assert store.stats(top=2, **query) == reference_stats(books, top=2, **query)
+    books = store.all()
+    expected = reference_query(books, completed=True)
+    assert store.query(completed=True, limit=3) == expected[:3]
+    assert store.query(completed=True, after=expected[2]["id"], offset=1, limit=2) == expected[4:6]
+
+
+# удалить почти всё - строки чистятся, результат прежний
+def test_compaction(make_store):
+    store = make_store([{"id": i, "title": "Книга", "author": f"Автор {i % 3}"} for i in range(1, 101)])
+    store.delete_many(range(1, 91))
+    assert store.stats()["count"] == 10
+    assert [b["id"] for b in store.query(authors=["Автор 1"])] == [91, 94, 97, 100]
+    assert store.stats()["authors"][0] == {"author": "Автор 1", "count": 4, "completed": 0, "completed_ratio": 0.0}
@@ -1,7 +1,10 @@
+import json
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient, ASGITransport
 from main import app
+from auth import token_backend
+from tokens import StaticTokenBackend
 
 
 # функция чтобы тестировать приложение без запуска сервера
@@ -215,3 +218,310 @@ async def test_delete_book_as_admin(client, admin_auth_headers):
     # проверяем, что книга удалена
     res2 = await client.get(f"/books/{book_id}", headers=admin_auth_headers)
     assert res2.status_code == 404
+
+
+# постраничная выдача: limit + курсор из заголовка
+@pytest.mark.asyncio
+async def test_read_books_cursor_pagination(client, user_auth_headers):
+    res_all = await client.get("/books", headers=user_auth_headers)
+    all_ids = [b["id"] for b in res_all.json()]
+    # идём по страницам по одной книжке
+    seen = []
+    params = {"limit": 1}
+    while True:
+        res = await client.get("/books", params=params, headers=user_auth_headers)
+        assert res.status_code == 200
+        page = res.json()
+        assert len(page) <= 1
+        seen += [b["id"] for b in page]
+        cursor = res.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        params = {"limit": 1, "cursor": cursor}
+    assert seen == all_ids
+
+
+# limit/offset и выбор полей
+@pytest.mark.asyncio
+async def test_read_books_offset_and_fields(client, user_auth_headers):
+    res = await client.get("/books", params={"offset": 1, "limit": 1, "fields": "id,title"},
+                           headers=user_auth_headers)
+    assert res.status_code == 200
+    page = res.json()
+    assert page == [{"id": 2, "title": "Backend разработка на Python"}]
+
+
+# неизвестное поле и битый курсор
+@pytest.mark.asyncio
+async def test_read_books_bad_fields_and_cursor(client, user_auth_headers):
+    res = await client.get("/books", params={"fields": "id,password"}, headers=user_auth_headers)
+    assert res.status_code == 422
+    res = await client.get("/books", params={"cursor": "???"}, headers=user_auth_headers)
+    assert res.status_code == 400
+
+
+# фильтрация тоже листается и умеет выбирать поля
+@pytest.mark.asyncio
+async def test_filter_books_paginated(client, user_auth_headers):
+    params = {"title": "Python", "limit": 1, "fields": "title"}
+    res = await client.get("/books/filter", params=params, headers=user_auth_headers)
+    assert res.status_code == 200
+    assert res.json() == [{"title": "Асинхронность на Python"}]
+    params["cursor"] = res.headers["X-Next-Cursor"]
+    res = await client.get("/books/filter", params=params, headers=user_auth_headers)
+    assert res.json() == [{"title": "Backend разработка на Python"}]
+
+
+# потоковая выгрузка совпадает с обычным списком
+@pytest.mark.asyncio
+async def test_export_books(client, user_auth_headers):
+    res_all = await client.get("/books", headers=user_auth_headers)
+    res = await client.get("/books/export", headers=user_auth_headers)
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in res.text.splitlines()]
+    assert lines == res_all.json()
+    res = await client.get("/books/export", params={"format": "json"}, headers=user_auth_headers)
+    assert res.json() == res_all.json()
+    res = await client.get("/books/export", params={"format": "xml"}, headers=user_auth_headers)
+    assert res.status_code == 422
+
+
+# пакетное добавление, обновление и удаление
+@pytest.mark.asyncio
+async def test_bulk_create_update_delete(client, admin_auth_headers):
+    payload = [{"title": "Bulk 1", "author": "A"}, {"title": "Bulk 2", "author": "B"}]
+    res = await client.post("/books/bulk", json=payload, headers=admin_auth_headers)
+    assert res.status_code == 200
+    ids = [r["id"] for r in res.json()["results"]]
+    assert len(ids) == 2
+    # ndjson тоже принимается
+    body = '{"title": "Bulk 3", "author": "C"}\n{"title": "Bulk 4", "author": "D"}\n'
+    headers = {**admin_auth_headers, "Content-Type": "application/x-ndjson"}
+    res = await client.post("/books/bulk", content=body, headers=headers)
+    assert res.status_code == 200
+    ids += [r["id"] for r in res.json()["results"]]
+
+    patch = [{"id": ids[0], "title": "Bulk 1 (2 изд.)"}, {"id": ids[1], "author": "BB"}]
+    res = await client.patch("/books/bulk", json=patch, headers=admin_auth_headers)
+    assert res.status_code == 200
+    b1 = (await client.get(f"/books/{ids[0]}", headers=admin_auth_headers)).json()
+    b2 = (await client.get(f"/books/{ids[1]}", headers=admin_auth_headers)).json()
+    assert (b1["title"], b1["author"]) == ("Bulk 1 (2 изд.)", "A")
+    assert (b2["title"], b2["author"]) == ("Bulk 2", "BB")
+
+    res = await client.request("DELETE", "/books/bulk", json=ids, headers=admin_auth_headers)
+    assert res.status_code == 200
+    for book_id in ids:
+        res = await client.get(f"/books/{book_id}", headers=admin_auth_headers)
+        assert res.status_code == 404
+
+
+# пакет с ошибкой не применяется целиком
+@pytest.mark.asyncio
+async def test_bulk_is_atomic(client, admin_auth_headers):
+    before = (await client.get("/books", headers=admin_auth_headers)).json()
+    payload = [{"title": "Ok", "author": "A"}, {"title": "NoAuthor"}]
+    res = await client.post("/books/bulk", json=payload, headers=admin_auth_headers)
+    assert res.status_code == 422
+    assert [e["index"] for e in res.json()["detail"]] == [1]
+    res = await client.patch("/books/bulk", json=[{"id": 1, "title": "X"}, {"id": 9999, "title": "Y"}],
+                             headers=admin_auth_headers)
+    assert res.status_code == 404
+    assert res.json()["detail"][0]["id"] == 9999
+    # повтор айдишника - ошибка проверки пакета, а не отсутствующая книжка
+    res = await client.request("DELETE", "/books/bulk", json=[1, 1], headers=admin_auth_headers)
+    assert res.status_code == 422
+    assert res.json()["detail"] == [{"index": 1, "id": 1, "error": "Повторяющийся айдишник"}]
+    after = (await client.get("/books", headers=admin_auth_headers)).json()
+    assert after == before
+
+
+# пакеты только для админа
+@pytest.mark.asyncio
+async def test_bulk_forbidden(client, user_auth_headers):
+    res = await client.post("/books/bulk", json=[], headers=user_auth_headers)
+    assert res.status_code == 403
+
+
+# оптимистичная блокировка: изменение по устаревшему ETag отклоняется
+@pytest.mark.asyncio
+async def test_update_with_if_match(client, admin_auth_headers):
+    res = await client.post("/books/bulk", json=[{"title": "Versioned", "author": "A"}],
+                            headers=admin_auth_headers)
+    book_id = res.json()["results"][0]["id"]
+    res = await client.get(f"/books/{book_id}", headers=admin_auth_headers)
+    etag = res.headers["ETag"]
+    # первый админ правит книжку со свежим ETag
+    res = await client.patch(f"/books/{book_id}", params={"title": "V2"},
+                             headers={**admin_auth_headers, "If-Match": etag})
+    assert res.status_code == 200
+    # второй админ со старым ETag получает 412 и новый ETag
+    res = await client.put(f"/books/{book_id}", params={"title": "V3", "author": "B"},
+                           headers={**admin_auth_headers, "If-Match": etag})
+    assert res.status_code == 412
+    new_etag = res.headers["ETag"]
+    assert new_etag != etag
+    res = await client.delete(f"/books/{book_id}", headers={**admin_auth_headers, "If-Match": etag})
+    assert res.status_code == 412
+    res = await client.get(f"/books/{book_id}", headers=admin_auth_headers)
+    assert res.json()["title"] == "V2"
+    assert res.headers["ETag"] == new_etag
+    res = await client.delete(f"/books/{book_id}", headers={**admin_auth_headers, "If-Match": new_etag})
+    assert res.status_code == 200
+
+
+# айдишники не повторяются после удаления
+@pytest.mark.asyncio
+async def test_create_after_delete_gets_new_id(client, admin_auth_headers):
+    res = await client.post("/books/bulk", json=[{"title": "Gone", "author": "A"}], headers=admin_auth_headers)
+    gone_id = res.json()["results"][0]["id"]
+    await client.delete(f"/books/{gone_id}", headers=admin_auth_headers)
+    await client.post("/books", json={"title": "Fresh", "author": "A"}, headers=admin_auth_headers)
+    res = await client.get("/books/filter", params={"title": "Fresh"}, headers=admin_auth_headers)
+    assert all(b["id"] > gone_id for b in res.json())
+
+
+# повторный запрос с If-None-Match получает 304, запись сбрасывает кэш
+@pytest.mark.asyncio
+async def test_read_books_etag_and_invalidation(client, admin_auth_headers):
+    res = await client.get("/books", headers=admin_auth_headers)
+    etag = res.headers["ETag"]
+    res = await client.get("/books", headers={**admin_auth_headers, "If-None-Match": etag})
+    assert res.status_code == 304
+    assert res.content == b""
+    await client.post("/books", json={"title": "Cached?", "author": "A"}, headers=admin_auth_headers)
+    res = await client.get("/books", headers={**admin_auth_headers, "If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
+    assert any(b["title"] == "Cached?" for b in res.json())
+
+
+# книжка из кэша обновляется после PATCH
+@pytest.mark.asyncio
+async def test_get_book_cache_invalidated_on_patch(client, admin_auth_headers):
+    res = await client.get("/books/2", headers=admin_auth_headers)
+    etag = res.headers["ETag"]
+    res = await client.get("/books/2", headers={**admin_auth_headers, "If-None-Match": etag})
+    assert res.status_code == 304
+    await client.patch("/books/2", params={"author": "Пётр"}, headers=admin_auth_headers)
+    res = await client.get("/books/2", headers={**admin_auth_headers, "If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.json()["author"] == "Пётр"
+
+
+# после отзыва токен больше не принимается (для статических токенов отзыв ничего не делает)
+@pytest.mark.asyncio
+async def test_revoke_token(client):
+    res = await client.post("/token", data={"username": "user", "password": "user"})
+    headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+    res = await client.post("/token/revoke", headers=headers)
+    assert res.status_code == 200
+    res = await client.get("/books", headers=headers)
+    assert res.status_code == (200 if isinstance(token_backend, StaticTokenBackend) else 401)
+
+
+# много неудачных входов подряд - 429
+@pytest.mark.asyncio
+async def test_login_rate_limited(client):
+    statuses = []
+    for _ in range(7):
+        res = await client.post("/token", data={"username": "brute", "password": "guess"})
+        statuses.append(res.status_code)
+    assert statuses[0] == 400
+    assert statuses[-1] == 429
+    assert "Retry-After" in res.headers
+
+
+# админ сохраняет снимок каталога, пользователю нельзя
+@pytest.mark.asyncio
+async def test_save_snapshot(client, admin_auth_headers, user_auth_headers, tmp_path, monkeypatch):
+    import main
+    from snapshot import MappedSnapshot
+    monkeypatch.setattr(main.settings, "snapshot_path", str(tmp_path / "books.snap"))
+    res = await client.post("/admin/snapshot", headers=user_auth_headers)
+    assert res.status_code == 403
+    res = await client.post("/admin/snapshot", headers=admin_auth_headers)
+    # снимок есть только у хранилища в памяти, sqlite пишет на диск сам
+    if main.settings.backend != "memory":
+        assert res.status_code == 409
+        return
+    assert res.status_code == 200
+    # с журналом снимок пишется туда, где его ждёт журнал
+    snapshot = MappedSnapshot(main.oplog.snapshot_path if main.oplog else main.settings.snapshot_path)
+    assert len(snapshot) == res.json()["count"] == len(main.books)
+    snapshot.close()
+
+
+# поиск: лучшие k книжек, /books/search не путается с /books/{book_id}
+@pytest.mark.asyncio
+async def test_search_books(client, admin_auth_headers, user_auth_headers):
+    res = await client.post("/books", json={"title": "Python, python и ещё раз Python", "author": "Гвидо"},
+                            headers=admin_auth_headers)
+    assert res.status_code == 200
+    res = await client.get("/books/search", params={"q": "PYTHON", "k": 1}, headers=user_auth_headers)
+    assert res.status_code == 200
+    [hit] = res.json()
+    assert hit["title"] == "Python, python и ещё раз Python" and hit["score"] > 0
+    res = await client.get("/books/search", params={"q": "гвидо"}, headers=user_auth_headers)
+    assert [b["title"] for b in res.json()] == ["Python, python и ещё раз Python"]
+    assert (await client.get("/books/search", headers=user_auth_headers)).status_code == 422
+    assert (await client.get("/books/search", params={"q": "x", "k": 0}, headers=user_auth_headers)).status_code == 422
+    assert (await client.get("/books/search", params={"q": "python"})).status_code in (401, 403)
+
+
+# выборка и сводка для отчётов: список авторов, completed, диапазон айдишников
+@pytest.mark.asyncio
+async def test_query_and_stats(client, admin_auth_headers, user_auth_headers):
+    for author in ("Отчётов", "Отчётов", "Сводкин"):
+        res = await client.post("/books", json={"title": "Отчёт", "author": author}, headers=admin_auth_headers)
+        assert res.status_code == 200
+    params = [("author", "Отчётов"), ("author", "Сводкин")]
+    res = await client.get("/books/query", params=params + [("limit", 2)], headers=user_auth_headers)
+    assert res.status_code == 200
+    first = res.json()
+    assert [b["author"] for b in first] == ["Отчётов", "Отчётов"]
+    res = await client.get("/books/query", params=params + [("cursor", res.headers["X-Next-Cursor"])],
+                           headers=user_auth_headers)
+    assert [b["author"] for b in res.json()] == ["Сводкин"]
+    res = await client.get("/books/query", params=params + [("id_min", first[1]["id"])], headers=user_auth_headers)
+    assert len(res.json()) == 2
+    res = await client.get("/books/stats", params=params + [("top", 1)], headers=user_auth_headers)
+    assert res.status_code == 200
+    assert res.json() == {
+        "count": 3, "completed": 0, "not_completed": 0, "unknown": 3, "completed_ratio": 0.0,
+        "author_count": 2,
+        "authors": [{"author": "Отчётов", "count": 2, "completed": 0, "completed_ratio": 0.0}],
+    }
+    res = await client.get("/books/stats", params={"completed": True}, headers=user_auth_headers)
+    assert res.json()["completed_ratio"] == 1.0
+
+
+# пользователь есть только в users.json: статический бэкенд выдаёт ему новый токен
+@pytest.mark.asyncio
+async def test_login_user_from_user_store(tmp_path):
+    import main
+    from settings import Settings
+    from users import hash_password
+
+    path = tmp_path / "users.json"
+    with open(main.settings.users_path, encoding="utf-8") as f:
+        users = json.load(f)
+    users.append({"username": "маша", "is_admin": False,
+                  "password_hash": hash_password("маша", n=2**10, r=8, p=1)})
+    path.write_text(json.dumps(users, ensure_ascii=False), encoding="utf-8")
+    app = main.create_app(Settings(auth_backend="static", users_path=str(path)))
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver") as client:
+            res = await client.post("/token", data={"username": "маша", "password": "маша"})
+            assert res.status_code == 200
+            token = res.json()["access_token"]
+            # повторный вход - тот же токен
+            res = await client.post("/token", data={"username": "маша", "password": "маша"})
+            assert res.json()["access_token"] == token
+            headers = {"Authorization": f"Bearer {token}"}
+            assert (await client.get("/books", headers=headers)).status_code == 200
+            res = await client.post("/books", json={"title": "Моя", "author": "Маша"}, headers=headers)
+            assert res.status_code == 403
+    finally:
+        main.create_app(Settings.from_env())
@@ -0,0 +1,77 @@
+from cache import ResponseCache, etag_matches
+from etags import parse_if_match
+
+
+# сброс по тегу убирает только связанные записи
+def test_invalidate_by_tag():
+    cache = ResponseCache()
+    cache.put("/books?", b"[]", ["books"])
+    cache.put("/books/1?", b"{}", ["book:1"])
+    cache.put("/books/2?", b"{}", ["book:2"])
+    cache.invalidate(["books", "book:1"])
+    assert cache.get("/books?") is None
+    assert cache.get("/books/1?") is None
+    assert cache.get("/books/2?") is not None
+
+
+# вытеснение по числу записей и по байтам
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2, max_bytes=10)
+    cache.put("a", b"1234", ["books"])
+    cache.put("b", b"1234", ["books"])
+    cache.get("a")
+    cache.put("c", b"1234", ["books"])
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    cache.put("d", b"12345678", ["books"])
+    assert len(cache) == 1
+    # больше всего бюджета не кладём вовсе
+    cache.put("e", b"x" * 11, ["books"])
+    assert cache.get("e") is None
+
+
+# устаревшие записи не отдаём
+def test_ttl():
+    cache = ResponseCache(ttl=-1)
+    cache.put("a", b"[]", ["books"])
+    assert cache.get("a") is None
+
+
+# ответ посчитанный до сброса не кладём
+def test_put_after_invalidate_is_skipped():
+    cache = ResponseCache()
+    epoch = cache.epoch
+    cache.invalidate(["books"])
+    entry = cache.put("a", b"[]", ["books"], epoch=epoch)
+    assert entry.body == b"[]"
+    assert cache.get("a") is None
+
+
+def test_etag_matches():
+    assert etag_matches('"x"', '"x"')
+    assert etag_matches('W/"x", "y"', '"x"')
+    assert etag_matches("*", '"x"')
+    assert not etag_matches('"y"', '"x"')
+    assert not etag_matches(None, '"x"')
+    # тег сжатого варианта - та же версия
+    assert etag_matches('"3-5-gzip"', '"3-5"')
+    assert not etag_matches('"3-4-br"', '"3-5"')
+
+
+# If-Match сравнивается сильно, суффикс кодировки не мешает
+def test_parse_if_match():
+    assert parse_if_match('"3-5", "3-6-gzip", "4-7"', 3) == {5, 6}
+    assert parse_if_match('W/"3-5"', 3) == frozenset()
+    assert parse_if_match("*", 3) is None
+
+
+# clear сбрасывает всё, сжатый вариант старой записи в кэш уже не идёт
+def test_clear():
+    cache = ResponseCache(max_bytes=100)
+    entry = cache.put("a", b"x" * 10, ["books"])
+    cache.clear()
+    assert len(cache) == 0 and cache.get("a") is None
+    entry.add_variant("gzip", b"z" * 4)
+    assert cache._bytes == 0
+    cache.put("a", b"y" * 5, ["books"]).add_variant("gzip", b"z" * 4)
+    assert cache._bytes == 9
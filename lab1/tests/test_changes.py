@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+import main
+from changes import ChangeFeed, sse_events
+from serialization import dumps
+
+
+# изменения после since, у книжки только последнее
+def test_since_dedupes():
+    feed = ChangeFeed(capacity=10, seq=0)
+    feed.record(1, {"id": 1, "title": "A"}, 1)
+    feed.record(2, {"id": 2, "title": "B"}, 1)
+    feed.record(1, {"id": 1, "title": "A2"}, 2)
+    feed.record(2, None)
+    entries, seq = feed.since(0)
+    assert seq == 4
+    assert [(e["id"], e["op"]) for e in entries] == [(1, "put"), (2, "delete")]
+    assert entries[0]["book"]["title"] == "A2"
+    assert feed.since(4) == ([], 4)
+    entries, seq = feed.since(1, limit=1)
+    assert seq == 2 and entries[0]["id"] == 2
+
+
+# вытесненный или чужой since - None (reset)
+def test_evicted_since():
+    feed = ChangeFeed(capacity=3, seq=100)
+    for i in range(5):
+        feed.record(i, {"id": i}, 1)
+    assert feed.since(101) is None
+    assert feed.since(102) is not None
+    assert feed.since(500) is None
+
+
+# long-poll ждёт следующую запись
+@pytest.mark.asyncio
+async def test_wait():
+    feed = ChangeFeed(seq=0)
+    assert not await feed.wait(0, 0.01)
+    asyncio.get_running_loop().call_later(0.01, feed.record, 1, {"id": 1}, 1)
+    assert await feed.wait(0, 1)
+
+
+# поток событий: reset, потом изменения
+@pytest.mark.asyncio
+async def test_sse_events():
+    feed = ChangeFeed(seq=0)
+    feed.record(1, {"id": 1}, 1)
+
+    async def connected():
+        return False
+
+    events = sse_events(feed, None, connected, dumps, heartbeat=0.01)
+    assert (await anext(events)).startswith(b"event: reset\nid: 1\n")
+    # пока изменений нет - heartbeat
+    assert await anext(events) == b": heartbeat\n\n"
+    feed.record(2, None)
+    event = await anext(events)
+    assert event.startswith(b"id: 2\ndata: ")
+    assert json.loads(event.split(b"data: ", 1)[1]) == {"seq": 2, "op": "delete", "id": 2}
+
+
+@pytest_asyncio.fixture
+async def client():
+    async with AsyncClient(transport=ASGITransport(app=main.app), base_url="http://testserver") as ac:
+        yield ac
+
+
+async def login(client, username):
+    res = await client.post("/token", data={"username": username, "password": username})
+    return {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+
+# через API: reset, потом только изменения после seq
+@pytest.mark.asyncio
+async def test_changes_endpoint(client):
+    user = await login(client, "user")
+    admin = await login(client, "admin")
+    res = await client.get("/books/changes", headers=user)
+    assert res.status_code == 200
+    start = res.json()
+    assert start["reset"] is True
+    await client.post("/books", json={"title": "Лента", "author": "Маша"}, headers=admin)
+    res = await client.get("/books/changes", params={"since": start["seq"]}, headers=user)
+    body = res.json()
+    assert body["reset"] is False and body["seq"] == start["seq"] + 1
+    assert body["changes"][0]["book"]["title"] == "Лента"
+    res = await client.get("/books/changes", params={"since": body["seq"], "wait": 0.01}, headers=user)
+    assert res.json()["changes"] == []
@@ -0,0 +1,157 @@
+import gzip
+import json
+
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+import compression
+import main
+from cache import ResponseCache
+from compression import AVAILABLE, StreamCompressor, compress, negotiate
+from settings import Settings
+from store import BookStore
+
+HEADERS = {"Authorization": "Bearer user_token", "Accept-Encoding": "gzip"}
+
+
+def make_books(n):
+    return [
+        {"id": i, "title": f"Книга номер {i}", "author": f"Автор {i % 10}", "completed": i % 2 == 0}
+        for i in range(1, n + 1)
+    ]
+
+
+@pytest_asyncio.fixture
+async def client():
+    app = main.create_app(Settings(compress_encodings="gzip"))
+    main.start()
+    main.books = BookStore(make_books(500))
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver") as ac:
+        yield ac
+    # остальные тесты работают с приложением из переменных окружения
+    main.create_app(Settings.from_env())
+
+
+def test_negotiate():
+    encodings = ("zstd", "br", "gzip")
+    assert negotiate("gzip, br", encodings) == "br"
+    assert negotiate("gzip;q=1, br;q=0.5", encodings) == "gzip"
+    assert negotiate("br;q=0, *", encodings) == "zstd"
+    assert negotiate("*;q=0", encodings) is None
+    assert negotiate("identity", encodings) is None
+    assert negotiate("GZIP;q=bad, deflate", encodings) is None
+    assert negotiate(None, encodings) is None
+
+
+@pytest.mark.parametrize("encoding", AVAILABLE)
+def test_stream_matches_whole(encoding):
+    body = json.dumps(make_books(200), ensure_ascii=False).encode()
+    stream = StreamCompressor(encoding)
+    data = b"".join(stream.compress(body[i:i + 1000], i + 1000 >= len(body)) for i in range(0, len(body), 1000))
+    assert len(data) < len(body) // 3
+    if encoding == "gzip":
+        assert gzip.decompress(data) == body == gzip.decompress(compress(body, encoding))
+
+
+# большой ответ сжат, у него свой сильный ETag, 304 по нему работает
+@pytest.mark.asyncio
+async def test_compressed_read(client):
+    res = await client.get("/books", headers=HEADERS)
+    assert res.status_code == 200
+    assert res.headers["content-encoding"] == "gzip"
+    assert res.headers["vary"] == "Accept-Encoding"
+    assert int(res.headers["content-length"]) < len(res.content) // 3
+    assert res.json() == make_books(500)
+    etag = res.headers["etag"]
+    assert etag.startswith('"') and etag.endswith('-gzip"')
+    res = await client.get("/books", headers={**HEADERS, "If-None-Match": etag})
+    assert res.status_code == 304
+    assert res.headers["etag"] == etag
+    # без Accept-Encoding - как раньше
+    res = await client.get("/books", headers={**HEADERS, "Accept-Encoding": "identity"})
+    assert "content-encoding" not in res.headers
+    assert res.headers["vary"] == "Accept-Encoding"
+    assert res.headers["etag"] == etag.removesuffix('-gzip"') + '"'
+
+
+# маленькие ответы не сжимаем
+@pytest.mark.asyncio
+async def test_small_response(client):
+    res = await client.get("/books/1", headers=HEADERS)
+    assert res.status_code == 200
+    assert "content-encoding" not in res.headers
+
+
+# ответ из кэша сжимается один раз, сжатое тело лежит в записи кэша
+@pytest.mark.asyncio
+async def test_cached_variant(client, monkeypatch):
+    calls = []
+
+    def counted(body, encoding):
+        calls.append(encoding)
+        return gzip.compress(body)
+
+    monkeypatch.setattr(compression, "compress", counted)
+    for _ in range(3):
+        res = await client.get("/books/filter", params={"author": "Автор 1"}, headers=HEADERS)
+        assert res.status_code == 200 and res.headers["content-encoding"] == "gzip"
+        assert len(res.json()) == 50
+    assert calls == ["gzip"]
+    # после записи каталог сжимается заново
+    await client.post("/books", json={"title": "Новая", "author": "Автор 1"},
+                      headers={"Authorization": "Bearer admin_token"})
+    res = await client.get("/books/filter", params={"author": "Автор 1"}, headers=HEADERS)
+    assert len(res.json()) == 51
+    assert calls == ["gzip", "gzip"]
+
+
+# выгрузка сжимается потоком
+@pytest.mark.asyncio
+async def test_streamed_export(client):
+    res = await client.get("/books/export", headers=HEADERS)
+    assert res.status_code == 200
+    assert res.headers["content-encoding"] == "gzip"
+    assert "content-length" not in res.headers
+    assert [json.loads(line) for line in res.text.splitlines()] == make_books(500)
+
+
+# сжатые варианты входят в лимит кэша по байтам
+def test_variant_accounting():
+    cache = ResponseCache(max_bytes=20)
+    entry = cache.put("a", b"x" * 10, ["books"])
+    cache.put("b", b"y" * 5, ["books"])
+    entry.add_variant("gzip", b"z" * 4)
+    assert cache.get("a") is not None
+    # вариант не влез: вытесняем самую давнюю запись
+    cache.get("a").add_variant("br", b"z" * 4)
+    assert cache.get("b") is None
+    assert cache._bytes == 18
+    cache.invalidate(["books"])
+    assert cache._bytes == 0
+
+
+# сильный ETag сжатого ответа годится для If-Match при изменении книжки
+@pytest.mark.asyncio
+async def test_compressed_etag_if_match(client):
+    admin = {"Authorization": "Bearer admin_token"}
+    res = await client.post("/books", json={"title": "Длинная " * 200, "author": "Автор"}, headers=admin)
+    book_id = res.json()["id"]
+    res = await client.get(f"/books/{book_id}", headers=HEADERS)
+    assert res.headers["content-encoding"] == "gzip"
+    etag = res.headers["etag"]
+    assert etag == f'"{book_id}-1-gzip"'
+    # слабая форма того же тега для If-Match не годится
+    res = await client.patch(f"/books/{book_id}", params={"title": "Короткая"},
+                             headers={**admin, "If-Match": "W/" + etag})
+    assert res.status_code == 412
+    res = await client.patch(f"/books/{book_id}", params={"title": "Короткая"},
+                             headers={**admin, "If-Match": etag})
+    assert res.status_code == 200
+    res = await client.get(f"/books/{book_id}", headers=HEADERS)
+    assert res.json()["title"] == "Короткая"
+    assert res.headers["etag"] == f'"{book_id}-2"'
+    # старая версия не проходит
+    res = await client.patch(f"/books/{book_id}", params={"title": "Другая"},
+                             headers={**admin, "If-Match": etag})
+    assert res.status_code == 412
@@ -0,0 +1,49 @@
+import random
+
+from store import BookStore
+
+WORDS = ["Python", "python", "Асинхронность", "Backend", "ПИТОН", "Go", "разработка", "ёж", "Ёлка"]
+AUTHORS = ["Вася", "Петя", "Маша", "vasya", "ВАСЯ"]
+
+
+# старый фильтр из main.py - эталон
+def reference_filter(books, title=None, author=None, completed=None):
+    filtered = books
+    if title:
+        filtered = [b for b in filtered if title.lower() in b["title"].lower()]
+    if author:
+        filtered = [b for b in filtered if author.lower()
+                    in b["author"].lower()]
+    if completed is not None:
+        filtered = [b for b in filtered if b.get("completed") == completed]
+    return filtered
+
+
+def random_book(rng, book_id):
+    book = {
+        "id": book_id,
+        "title": " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))),
+        "author": rng.choice(AUTHORS),
+    }
+    # у книжек добавленных через POST поля completed нет
+    if rng.random() < 0.7:
+        book["completed"] = rng.random() < 0.5
+    return book
+
+
+# индексный фильтр совпадает со старым перебором, в том числе после записей
+def test_filter_matches_reference():
+    rng = random.Random(42)
+    store = BookStore([random_book(rng, i) for i in range(1, 200)])
+    queries = [None, "", "p", "py", "pyt", "python", "ПИТ", "он ", "ёж", "ЁЛК", "вас", "я", "нет такого"]
+    for step in range(5):
+        for book_id in rng.sample(range(1, 200), 20):
+            store.update(book_id, title=random_book(rng, book_id)["title"])
+        for book_id in rng.sample(range(1, 200), 5):
+            store.delete(book_id)
+        store.add(title=rng.choice(WORDS), author=rng.choice(AUTHORS))
+        for title in queries:
+            for author in [None, "вас", "ya", "МАША"]:
+                for completed in [None, True, False]:
+                    expected = reference_filter(store.all(), title, author, completed)
+                    assert store.filter(title, author, completed) == expected
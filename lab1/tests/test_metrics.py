@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from main import app
+from metrics import Histogram, Registry
+
+
+# квантили с точностью корзины (~12%)
+def test_histogram_quantiles():
+    histogram = Histogram()
+    for us in range(1, 10_001):
+        histogram.record(us / 1e6)
+    for q in (0.5, 0.95, 0.99):
+        expected = q * 10_000 / 1e6
+        assert expected <= histogram.quantile(q) <= expected * 1.13
+    assert histogram.count == 10_000
+    assert Histogram().quantile(0.5) == 0.0
+
+
+# у каждого потока свой слот, при чтении они складываются
+def test_registry_sums_threads():
+    registry = Registry()
+
+    def work():
+        for _ in range(1000):
+            registry.inc("calls_total", (("op", "get"),))
+        registry.observe("/books", "GET", "total", 0.001)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert registry.counters() == {("calls_total", (("op", "get"),)): 4000}
+    assert registry.histograms()[("/books", "GET", "total")].count == 4
+    assert 'calls_total{op="get",pid=' in registry.render()
+
+
+@pytest_asyncio.fixture
+async def client():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver") as ac:
+        yield ac
+
+
+# маршрут в метке - шаблон, фазы auth и handler считаются отдельно
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client):
+    res = await client.post("/token", data={"username": "user", "password": "user"})
+    headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+    await client.get("/books/1", headers=headers)
+    await client.get("/books/filter", params={"title": "python"}, headers=headers)
+    res = await client.get("/metrics")
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/plain")
+    text = res.text
+    assert 'route="/books/{book_id}",method="GET",phase="auth"' in text
+    assert 'route="/books/{book_id}",method="GET",phase="handler"' in text
+    assert 'books_index_lookups_total{index="title",result="hit"' in text
+    assert "books_store_calls_total" in text
@@ -0,0 +1,167 @@
+import asyncio
+
+import pytest
+
+from oplog import OpLog, read_log
+from snapshot import MappedSnapshot
+from store import BookStore
+
+
+def make_store(snapshot=None):
+    if snapshot is not None:
+        return BookStore(snapshot=snapshot)
+    return BookStore([{"id": 1, "title": "Первая", "author": "Вася", "completed": True}])
+
+
+# то же что books_changed в main.py
+def log_change(store, oplog, *ids):
+    for book_id in ids:
+        found = store.versioned(book_id)
+        oplog.append(book_id, *(found if found else (None,)))
+    return oplog.seq
+
+
+def reopen(tmp_path, **kwargs):
+    snap = tmp_path / "books.snap"
+    store = make_store(MappedSnapshot(snap) if snap.exists() else None)
+    oplog = OpLog.open(store, str(tmp_path / "books.log"), str(snap), **kwargs)
+    return store, oplog
+
+
+# после перезапуска журнал возвращает все записи вместе с версиями
+@pytest.mark.asyncio
+async def test_replay(tmp_path):
+    store, oplog = reopen(tmp_path)
+    book = store.add(title="Вторая", author="Петя")
+    log_change(store, oplog, book["id"])
+    store.update(1, title="Первая!")
+    log_change(store, oplog, 1)
+    store.update(book["id"], completed=False)
+    log_change(store, oplog, book["id"])
+    book = store.add(title="Третья", author="Маша")
+    log_change(store, oplog, book["id"])
+    store.delete(book["id"])
+    log_change(store, oplog, book["id"])
+    await oplog.commit()
+    oplog.close()
+
+    replayed, oplog = reopen(tmp_path)
+    assert replayed.all() == store.all()
+    assert replayed.versioned(1) == store.versioned(1)
+    assert oplog.seq == 5
+    # удалённый айдишник не выдаётся снова
+    assert replayed.add(title="Четвёртая", author="Маша")["id"] == 4
+    oplog.close()
+
+
+# оборванная последняя строка отрезается, дальше пишем после целых строк
+@pytest.mark.asyncio
+async def test_torn_tail(tmp_path):
+    store, oplog = reopen(tmp_path)
+    store.add(title="Вторая", author="Петя")
+    await oplog.commit(log_change(store, oplog, 2))
+    oplog.close()
+    path = tmp_path / "books.log"
+    good = path.read_bytes()
+    path.write_bytes(good + b"0badf00d {\"seq\": 2, \"op\"")
+
+    replayed, oplog = reopen(tmp_path)
+    assert len(replayed) == 2 and oplog.seq == 1
+    assert path.read_bytes() == good
+    replayed.update(2, title="Вторая!")
+    await oplog.commit(log_change(replayed, oplog, 2))
+    oplog.close()
+    assert [e["seq"] for e in read_log(path)[0]] == [1, 2]
+
+
+# одновременные записи ждут общий fsync
+@pytest.mark.asyncio
+async def test_group_commit(tmp_path):
+    store, oplog = reopen(tmp_path)
+
+    async def writer():
+        book = store.add(title="Книга", author="Автор")
+        await oplog.commit(log_change(store, oplog, book["id"]))
+
+    await asyncio.gather(*(writer() for _ in range(50)))
+    assert oplog.durable == 50
+    assert oplog.syncs < 50
+    oplog.close()
+    assert len(read_log(tmp_path / "books.log")[0]) == 50
+
+
+# interval: ответ не ждёт fsync, но он случается
+@pytest.mark.asyncio
+async def test_interval_sync(tmp_path):
+    store, oplog = reopen(tmp_path, fsync="interval", interval=0.01)
+    store.add(title="Вторая", author="Петя")
+    await oplog.commit(log_change(store, oplog, 2))
+    assert oplog.durable == 0
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if oplog.durable == 1:
+            break
+    assert oplog.durable == 1
+    oplog.close()
+
+
+# свёртка переносит всё в снимок, журнал начинается заново
+@pytest.mark.asyncio
+async def test_compaction(tmp_path):
+    store, oplog = reopen(tmp_path, compact_bytes=1)
+    for _ in range(20):
+        book = store.add(title="Книга", author="Автор")
+        await oplog.commit(log_change(store, oplog, book["id"]))
+        oplog.maybe_compact(store)
+    await oplog.compact(store)
+    store.delete(5)
+    await oplog.commit(log_change(store, oplog, 5))
+    oplog.close()
+    assert not (tmp_path / "books.log.old").exists()
+    assert [e["seq"] for e in read_log(tmp_path / "books.log")[0]] == [21]
+
+    replayed, oplog = reopen(tmp_path)
+    assert replayed.all() == store.all()
+    assert replayed.add(title="Ещё", author="Автор")["id"] == 22
+    oplog.close()
+
+
+# при свёртке fsync и сборка кортежей идут в потоке, а запись во время
+# свёртки считается на диске только после fsync старого файла
+@pytest.mark.asyncio
+async def test_compaction_off_event_loop(tmp_path, monkeypatch):
+    import threading
+
+    import oplog as oplog_module
+    from records import Book
+
+    store, oplog = reopen(tmp_path)
+    for _ in range(20):
+        book = store.add(title="Книга", author="Автор")
+        log_change(store, oplog, book["id"])
+    await oplog.commit()
+    threads = []
+    fsync, row = oplog_module.os.fsync, Book.row
+
+    def recording_fsync(fd):
+        threads.append(threading.current_thread())
+        fsync(fd)
+
+    def recording_row(self):
+        threads.append(threading.current_thread())
+        return row(self)
+
+    monkeypatch.setattr(oplog_module.os, "fsync", recording_fsync)
+    monkeypatch.setattr(Book, "row", recording_row)
+    task = asyncio.ensure_future(oplog.compact(store))
+    await asyncio.sleep(0)
+    store.update(1, title="Во время свёртки")
+    await oplog.commit(log_change(store, oplog, 1))
+    assert await task == 21
+    assert threads and threading.main_thread() not in threads
+    monkeypatch.undo()
+    oplog.close()
+
+    replayed, oplog = reopen(tmp_path)
+    assert replayed.all() == store.all()
+    oplog.close()
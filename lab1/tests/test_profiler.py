@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from main import app
+from profiler import StackSampler
+
+
+def busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+# сэмплер видит функцию, которая занимает поток
+def test_sampler_collapsed_stacks():
+    sampler = StackSampler(interval=0.001, thread_id=threading.get_ident()).start()
+    busy_loop(0.1)
+    profile = sampler.stop()
+    assert sampler.samples > 0
+    top, count = profile.splitlines()[0].rsplit(" ", 1)
+    assert top.startswith("MainThread;") and "busy_loop" in top
+    assert int(count) > 0
+
+
+@pytest_asyncio.fixture
+async def client():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver") as ac:
+        yield ac
+
+
+async def token(client, username):
+    res = await client.post("/token", data={"username": username, "password": username})
+    return {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+
+# профиль запроса по заголовку - только админу
+@pytest.mark.asyncio
+async def test_profile_header(client):
+    user = await token(client, "user")
+    res = await client.get("/books/filter", params={"title": "py"}, headers={**user, "X-Profile": "5"})
+    assert res.status_code == 403
+    admin = await token(client, "admin")
+    res = await client.get("/books/filter", params={"title": "py"}, headers={**admin, "X-Profile": "200"})
+    assert res.status_code == 200
+    assert res.headers["X-Profile-Status"] == "200"
+    assert res.headers["content-type"].startswith("text/plain")
+    # без заголовка - обычный ответ
+    res = await client.get("/books/filter", params={"title": "py"}, headers=admin)
+    assert res.json()
+
+
+# профиль воркера за время - только админу
+@pytest.mark.asyncio
+async def test_profile_endpoint(client):
+    user = await token(client, "user")
+    res = await client.post("/admin/profile", params={"seconds": 0.05}, headers=user)
+    assert res.status_code == 403
+    admin = await token(client, "admin")
+    res = await client.post("/admin/profile", params={"seconds": 0.1, "interval": 0.005}, headers=admin)
+    assert res.status_code == 200
+    assert int(res.headers["X-Profile-Samples"]) > 0
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in res.text.splitlines())
+
+
+# повторы под профилировщиком выполняют обработчик, а не берут ответ из кэша
+@pytest.mark.asyncio
+async def test_profile_bypasses_cache(client, monkeypatch):
+    import main
+
+    admin = await token(client, "admin")
+    calls = []
+    filter_books = main.books.filter
+
+    def counted(*args, **kwargs):
+        calls.append(1)
+        return filter_books(*args, **kwargs)
+
+    monkeypatch.setattr(main.books, "filter", counted)
+    params = {"title": "profiled"}
+    # ответ уже в кэше
+    await client.get("/books/filter", params=params, headers=admin)
+    assert len(calls) == 1
+    res = await client.get("/books/filter", params=params, headers={**admin, "X-Profile": "5"})
+    assert res.headers["X-Profile-Status"] == "200"
+    assert len(calls) == 6
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+import auth
+from admission import AdmissionMiddleware
+from main import app
+from ratelimit import SQLiteTokenBucketLimiter, TokenBucketLimiter, make_limiter
+
+
+# два воркера с общим файлом делят одно ведро
+def test_sqlite_limiter_shared(tmp_path):
+    path = str(tmp_path / "limits.db")
+    first = SQLiteTokenBucketLimiter(path, rate=1, burst=2)
+    second = SQLiteTokenBucketLimiter(path, rate=1, burst=2)
+    assert first.acquire("user", now=100.0) == 0
+    assert second.acquire("user", now=100.0) == 0
+    assert first.acquire("user", now=100.0) == pytest.approx(1.0)
+    assert second.retry_after("user", now=100.5) == pytest.approx(0.5)
+    assert first.acquire("other", now=100.0) == 0
+
+
+# лишние ключи выкидываются
+def test_sqlite_limiter_evicts(tmp_path):
+    limiter = SQLiteTokenBucketLimiter(str(tmp_path / "limits.db"), rate=1, burst=2, max_keys=10)
+    for i in range(1000):
+        limiter.acquire(f"user{i}", now=1000.0 + i / 1000)
+    assert len(limiter) <= 10
+
+
+def test_make_limiter_off():
+    assert make_limiter("memory", 0, 10) is None
+    with pytest.raises(ValueError):
+        make_limiter("redis", 1, 10)
+
+
+@pytest_asyncio.fixture
+async def client():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver") as ac:
+        yield ac
+
+
+# у пользователя кончились жетоны на чтение - 429, у админа свой бюджет
+@pytest.mark.asyncio
+async def test_read_limit(client, monkeypatch):
+    res = await client.post("/token", data={"username": "user", "password": "user"})
+    user = {"Authorization": f"Bearer {res.json()['access_token']}"}
+    res = await client.post("/token", data={"username": "admin", "password": "admin"})
+    admin = {"Authorization": f"Bearer {res.json()['access_token']}"}
+    monkeypatch.setattr(auth, "read_limiter", TokenBucketLimiter(rate=0.5, burst=2))
+    statuses = [(await client.get("/books/1", headers=user)).status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    res = await client.get("/books/1", headers=user)
+    assert res.headers["Retry-After"] == "2"
+    res = await client.patch("/books/1", params={"title": "Асинхронность на Python"}, headers=admin)
+    assert res.status_code == 200
+
+
+# сверх лимита одновременных запросов - сразу 503
+@pytest.mark.asyncio
+async def test_admission_sheds():
+    release = asyncio.Event()
+
+    async def slow_app(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    shed = AdmissionMiddleware(slow_app, max_concurrent=1, retry_after=3)
+    async with AsyncClient(transport=ASGITransport(app=shed), base_url="http://testserver") as ac:
+        first = asyncio.ensure_future(ac.get("/books"))
+        await asyncio.sleep(0.01)
+        res = await ac.get("/books")
+        assert res.status_code == 503
+        assert res.headers["Retry-After"] == "3"
+        release.set()
+        assert (await first).status_code == 200
+        assert shed.in_flight == 0
+
+
+# long-poll ленты изменений и профиль воркера слот не занимают
+@pytest.mark.asyncio
+async def test_admission_exempts_long_requests():
+    release = asyncio.Event()
+
+    async def slow_app(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    shed = AdmissionMiddleware(slow_app, max_concurrent=1)
+    async with AsyncClient(transport=ASGITransport(app=shed), base_url="http://testserver") as ac:
+        waiting = [
+            asyncio.ensure_future(ac.get("/books/changes", params={"since": 1, "wait": 30})),
+            asyncio.ensure_future(ac.post("/admin/profile", params={"seconds": 30})),
+        ]
+        await asyncio.sleep(0.01)
+        assert shed.in_flight == 0
+        # обычный запрос ленты (без wait) в лимите
+        first = asyncio.ensure_future(ac.get("/books/changes", params={"since": 1, "wait": 0}))
+        await asyncio.sleep(0.01)
+        assert shed.in_flight == 1
+        assert (await ac.get("/books")).status_code == 503
+        release.set()
+        assert (await first).status_code == 200
+        assert [(await res).status_code for res in waiting] == [200, 200]
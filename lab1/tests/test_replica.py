@@ -0,0 +1,218 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from httpx import ASGITransport, AsyncClient
+
+import replica
+from replica import ReplicaPublisher, ReplicaStore, WriteProxyMiddleware
+from serve import writer_url
+from snapshot import write_snapshot
+from store import BookStore
+
+
+def make_store():
+    return BookStore([
+        {"id": 1, "title": "Первая", "author": "Вася", "completed": True},
+        {"id": 2, "title": "Вторая", "author": "Петя"},
+        {"id": 5, "title": "Пятая", "author": "Вася", "completed": False},
+    ])
+
+
+# читатель отдаёт то же что и каталог писателя
+def test_reads_match(tmp_path):
+    store = make_store()
+    path = tmp_path / "books.replica"
+    ReplicaPublisher(path).publish_now(store)
+    replica = ReplicaStore(path)
+    assert len(replica) == 3 and 5 in replica and 3 not in replica
+    assert replica.page() == store.page()
+    assert replica.page(after=1, limit=1) == store.page(after=1, limit=1)
+    assert replica.filter(author="вася") == store.filter(author="вася")
+    assert replica.versioned(2) == store.versioned(2)
+    assert replica.get(7) is None
+
+
+# новая версия подхватывается не раньше check_interval, кэш сбрасывается
+def test_swap(tmp_path):
+    store = make_store()
+    path = tmp_path / "books.replica"
+    publisher = ReplicaPublisher(path)
+    publisher.publish_now(store)
+    swapped = []
+    replica = ReplicaStore(path, check_interval=3600, on_swap=lambda: swapped.append(1))
+    assert replica.version == 1
+    store.update(1, title="Новая")
+    store.delete(2)
+    publisher.publish_now(store)
+    # интервал не прошёл - старая версия
+    replica.poll()
+    assert replica.get(1)["title"] == "Первая"
+    replica.check_interval = 0
+    replica.poll()
+    assert replica.get(1)["title"] == "Новая"
+    assert 2 not in replica
+    assert (replica.version, replica.swaps, swapped) == (2, 1, [1])
+
+
+# без снимка читатель не отвечает книжками из ниоткуда
+def test_not_published(tmp_path):
+    replica = ReplicaStore(tmp_path / "books.replica")
+    with pytest.raises(RuntimeError):
+        len(replica)
+
+
+# частые изменения публикуются одним снимком после interval
+@pytest.mark.asyncio
+async def test_schedule(tmp_path):
+    store = make_store()
+    path = tmp_path / "books.replica"
+    publisher = ReplicaPublisher(path, interval=0.01)
+    publisher.publish_now(store)
+    replica = ReplicaStore(path, check_interval=0)
+    for i in range(10):
+        book = store.add(title=f"Книга {i}", author="Автор")
+        publisher.schedule(lambda: store, [book["id"]])
+    await publisher._task
+    assert publisher.version == 2
+    replica.poll()
+    assert len(replica) == 13
+    assert replica.page() == store.page()
+
+
+# книжки изменённые пока поток собирает снимок публикуются в новом виде
+@pytest.mark.asyncio
+async def test_publish_during_change(tmp_path, monkeypatch):
+    store = make_store()
+    path = tmp_path / "books.replica"
+    publisher = ReplicaPublisher(path, interval=0)
+    loop = asyncio.get_running_loop()
+    published = []
+
+    async def change():
+        store.update(1, title="Во время сборки")
+        store.delete(2)
+        store.add(title="Новая", author="Маша")
+        publisher.schedule(lambda: store, [1, 2, 6])
+
+    def racing(records):
+        result = rows(records)
+        # запись в цикле событий, пока поток ещё не вернул кортежи
+        if not published:
+            asyncio.run_coroutine_threadsafe(change(), loop).result()
+        return result
+
+    def recording(path, rows, next_id, seq):
+        rows = list(rows)
+        published.append(rows)
+        write_snapshot(path, rows, next_id, seq)
+
+    rows = replica._rows
+    monkeypatch.setattr(replica, "_rows", racing)
+    monkeypatch.setattr(replica, "write_snapshot", recording)
+    publisher.schedule(lambda: store, [1])
+    await publisher._task
+    assert published[0] == store.snapshot_rows()
+    assert [row[0] for row in published[0]] == [1, 5, 6]
+    assert ReplicaStore(path).page() == store.page()
+
+
+# записи и лента изменений уходят писателю через читателя, с тем же
+# Authorization и телом; чтение остаётся у читателя
+@pytest.mark.asyncio
+async def test_write_proxy():
+    writer = FastAPI()
+
+    @writer.api_route("/{path:path}", methods=["GET", "POST", "PATCH", "DELETE"])
+    async def echo(path: str, request: Request):
+        if request.headers.get("authorization") != "Bearer admin_token":
+            return JSONResponse({"detail": "Нет доступа"}, status_code=401)
+        return {
+            "method": request.method,
+            "path": "/" + path,
+            "query": request.url.query,
+            "body": (await request.body()).decode(),
+        }
+
+    reader = FastAPI()
+
+    @reader.get("/books")
+    async def read():
+        return []
+
+    reader.add_middleware(WriteProxyMiddleware, writer_url="http://writer:8001/",
+                          transport=ASGITransport(app=writer))
+    headers = {"Authorization": "Bearer admin_token"}
+    async with AsyncClient(transport=ASGITransport(app=reader), base_url="http://test",
+                           follow_redirects=True) as client:
+        assert (await client.get("/books")).status_code == 200
+        for method, url, query in (
+            ("POST", "/books", ""),
+            ("PATCH", "/books/3", "title=x"),
+            ("DELETE", "/books/bulk", ""),
+            ("GET", "/books/changes", "since=5"),
+            ("POST", "/admin/snapshot", ""),
+        ):
+            res = await client.request(method, url, params=query or None, content=b'{"a": 1}',
+                                       headers=headers)
+            assert res.status_code == 200
+            assert res.json() == {"method": method, "path": url, "query": query, "body": '{"a": 1}'}
+        # без токена писатель отвечает 401, и он доходит до клиента
+        assert (await client.post("/books")).status_code == 401
+        # вход - на любом процессе
+        assert (await client.post("/token")).status_code == 404
+
+
+# писатель недоступен - 502
+@pytest.mark.asyncio
+async def test_write_proxy_unavailable():
+    def refuse(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    reader = FastAPI()
+    reader.add_middleware(WriteProxyMiddleware, writer_url="http://writer:8001",
+                          transport=httpx.MockTransport(refuse))
+    async with AsyncClient(transport=ASGITransport(app=reader), base_url="http://test") as client:
+        assert (await client.post("/books")).status_code == 502
+
+
+# читатели ходят к писателю по адресу на который можно подключиться
+def test_writer_url():
+    assert writer_url("0.0.0.0", 8001) == "http://127.0.0.1:8001"
+    assert writer_url("10.0.0.5", 8001) == "http://10.0.0.5:8001"
+
+
+# читатель в приложении: фильтр идёт в пуле потоков, новую версию
+# подхватывает запрос (poll в цикле событий) и кэш ответов сбрасывается
+@pytest.mark.asyncio
+async def test_reader_app(tmp_path, monkeypatch):
+    import main
+    from settings import Settings
+
+    store = make_store()
+    path = tmp_path / "books.replica"
+    publisher = ReplicaPublisher(path)
+    publisher.publish_now(store)
+    offloaded = []
+    run = main.run_in_threadpool
+
+    async def recording(fn, *args, **kwargs):
+        offloaded.append(fn.__name__)
+        return await run(fn, *args, **kwargs)
+
+    monkeypatch.setattr(main, "run_in_threadpool", recording)
+    app = main.create_app(Settings(role="reader", replica_path=str(path), replica_check=0))
+    headers = {"Authorization": "Bearer user_token"}
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            res = await client.get("/books/filter", params={"author": "вася"}, headers=headers)
+            assert [b["id"] for b in res.json()] == [1, 5]
+            assert "filter" in offloaded
+            store.update(5, author="Петя")
+            publisher.publish_now(store)
+            res = await client.get("/books/filter", params={"author": "вася"}, headers=headers)
+            assert [b["id"] for b in res.json()] == [1]
+    finally:
+        main.create_app(Settings.from_env())
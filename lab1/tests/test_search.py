@@ -0,0 +1,67 @@
+import math
+import random
+
+from records import Book
+from search import B, K1, WEIGHTS, SearchIndex, tokenize, top_k
+from store import BookStore
+from tests.test_indexes import random_book
+
+
+def test_tokenize():
+    assert tokenize("Асинхронность на PYTHON-3, Ёлки!") == ["асинхронность", "на", "python", "3", "елки"]
+    assert tokenize("Straße") == ["strasse"]
+    assert tokenize("  ,. ") == []
+
+
+# BM25 перебором всех книжек
+def reference_scores(books, query):
+    words = list(dict.fromkeys(tokenize(query)))
+    scores = {}
+    for field, weight in WEIGHTS.items():
+        docs = {b["id"]: tokenize(b[field]) for b in books}
+        avg = sum(map(len, docs.values())) / len(docs)
+        for word in words:
+            df = sum(word in d for d in docs.values())
+            if not df:
+                continue
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            for book_id, d in docs.items():
+                tf = d.count(word)
+                if tf:
+                    part = weight * idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * len(d) / avg))
+                    scores[book_id] = scores.get(book_id, 0.0) + part
+    return scores
+
+
+# индекс совпадает с перебором, в том числе после записей
+def test_matches_reference():
+    rng = random.Random(3)
+    store = BookStore([random_book(rng, i) for i in range(1, 301)])
+    for i in range(300):
+        op = rng.random()
+        book_id = rng.randint(1, 320)
+        if op < 0.3:
+            store.add(**{k: v for k, v in random_book(rng, 0).items() if k != "id"})
+        elif op < 0.7:
+            store.update(book_id, title=random_book(rng, 0)["title"])
+        else:
+            store.delete(book_id)
+    books = store.all()
+    for query in ("python", "backend разработка", "вася", "на на", "нет-такого"):
+        expected = reference_scores(books, query)
+        found = store.search(query, limit=len(books))
+        assert {b["id"] for b in found} == set(expected)
+        for b in found:
+            assert math.isclose(b["score"], expected[b["id"]])
+        assert [b["score"] for b in found] == sorted((b["score"] for b in found), reverse=True)
+
+
+# top_k берёт лучших через кучу, при равном score - меньший айдишник
+def test_top_k_ties():
+    index = SearchIndex("title")
+    for i in range(1, 11):
+        index.add(Book(id=i, title="Python", author="Автор"))
+    assert [book_id for book_id, _ in top_k([index], "python", 3)] == [1, 2, 3]
+    index.remove(Book(id=1, title="Python", author="Автор"))
+    assert [book_id for book_id, _ in top_k([index], "python python", 2)] == [2, 3]
+    assert top_k([index], "java", 5) == []
@@ -0,0 +1,121 @@
+import random
+import threading
+
+import pytest
+
+from snapshot import MappedSnapshot, SnapshotError
+from store import BookStore
+from tests.test_indexes import random_book
+
+
+def make_store():
+    return BookStore([
+        {"id": 1, "title": "Первая", "author": "Вася", "completed": True},
+        {"id": 2, "title": "Вторая", "author": "Петя"},
+        {"id": 5, "title": "Пятая", "author": "Вася", "completed": False},
+    ])
+
+
+# снимок отдаёт те же книжки, версии и next_id
+def test_roundtrip(tmp_path):
+    store = make_store()
+    store.update(1, title="Первая!")
+    path = tmp_path / "books.snap"
+    store.save_snapshot(path, seq=7)
+    snapshot = MappedSnapshot(path)
+    assert (len(snapshot), snapshot.next_id, snapshot.seq) == (3, 6, 7)
+    assert [snapshot.record(i) for i in range(3)] == store.all()
+    assert snapshot.version(snapshot.find(1)) == 2
+    assert snapshot.find(3) == -1
+    snapshot.close()
+
+
+# испорченный или чужой файл не открывается
+def test_corrupted(tmp_path):
+    path = tmp_path / "books.snap"
+    make_store().save_snapshot(path)
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+    with pytest.raises(SnapshotError):
+        MappedSnapshot(path)
+    path.write_bytes(b"not a snapshot at all, just some text")
+    with pytest.raises(SnapshotError):
+        MappedSnapshot(path)
+
+
+# пока не было записи чтение идёт из снимка и совпадает с обычным хранилищем
+def test_reads_from_snapshot(tmp_path):
+    rng = random.Random(13)
+    source = BookStore([random_book(rng, i) for i in range(1, 300)])
+    for book_id in range(1, 300, 7):
+        source.delete(book_id)
+    path = tmp_path / "books.snap"
+    source.save_snapshot(path)
+    store = BookStore(snapshot=MappedSnapshot(path))
+    assert len(store) == len(source)
+    assert 8 not in store and 7 in store
+    assert store.versioned(7) == source.versioned(7)
+    assert store.page(after=100, offset=3, limit=10) == source.page(after=100, offset=3, limit=10)
+    for kwargs in ({"title": "pyt"}, {"author": "ВАС"}, {"completed": True, "title": "ё"}, {"title": "нет"}):
+        assert store.filter(**kwargs, limit=20) == source.filter(**kwargs, limit=20)
+    assert store._snapshot is not None
+
+
+# первая запись переносит книжки в память, айдишники не повторяются
+def test_write_materializes(tmp_path):
+    path = tmp_path / "books.snap"
+    source = make_store()
+    source.delete(5)
+    source.save_snapshot(path)
+    store = BookStore(snapshot=MappedSnapshot(path))
+    assert store.add(title="Новая", author="Маша")["id"] == 6
+    assert store._snapshot is None
+    assert store.filter(author="вас") == [source.get(1)]
+    assert store.versioned(2) == source.versioned(2)
+
+
+# пока книжки в снимке хранилище blocking, переезд в фоне его снимает
+def test_background_load(tmp_path):
+    path = tmp_path / "books.snap"
+    source = make_store()
+    source.save_snapshot(path)
+    store = BookStore(snapshot=MappedSnapshot(path))
+    assert store.blocking
+    store.load_in_background()
+    # запись ждёт конца переезда, а не начинает свой
+    assert store.add(title="Новая", author="Маша")["id"] == 6
+    assert not store.blocking
+    assert store.filter(author="вас") == [source.get(1), source.get(5)]
+
+
+# запрос к каталогу из снимка не переносит его в память в цикле событий
+@pytest.mark.asyncio
+async def test_load_off_event_loop(tmp_path, monkeypatch):
+    import main
+    from httpx import ASGITransport, AsyncClient
+    from settings import Settings
+
+    path = tmp_path / "books.snap"
+    make_store().save_snapshot(path)
+    threads = []
+    load = BookStore.load
+
+    # поток где книжки действительно переезжают (после переезда load - пустой вызов)
+    def recording(self):
+        if self._snapshot is not None:
+            threads.append(threading.current_thread())
+        load(self)
+
+    monkeypatch.setattr(BookStore, "load", recording)
+    app = main.create_app(Settings(snapshot_path=str(path)))
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver") as client:
+            admin = {"Authorization": "Bearer admin_token"}
+            res = await client.post("/books", json={"title": "Новая", "author": "Маша"}, headers=admin)
+            assert res.status_code == 200
+            res = await client.get("/books/search", params={"q": "новая"}, headers=admin)
+            assert [b["id"] for b in res.json()] == [6]
+    finally:
+        main.create_app(Settings.from_env())
+    assert threads and threading.main_thread() not in threads
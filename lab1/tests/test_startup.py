@@ -0,0 +1,86 @@
+import subprocess
+import sys
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+import main
+from oplog import read_log
+from benchmarks.bench_startup import LAB, first_response, import_times
+from settings import Settings
+
+# с запасом: ловим только загрузку каталога или numpy при импорте
+IMPORT_BUDGET = 2.0
+FIRST_RESPONSE_BUDGET = 10.0
+
+
+@pytest.fixture
+def fresh_app():
+    apps = []
+
+    def make(**kwargs):
+        apps.append(main.create_app(Settings(**kwargs)))
+        return apps[-1]
+
+    yield make
+    # остальные тесты работают с приложением из переменных окружения
+    main.create_app(Settings.from_env())
+
+
+# импорт ничего не печатает, не грузит каталог и numpy
+def test_import_is_lazy():
+    modules, stdout = import_times()
+    assert stdout == ""
+    assert "numpy" not in modules
+    assert "sqlite_store" not in modules
+    assert modules["main"][1] / 1e6 < IMPORT_BUDGET
+    result = subprocess.run(
+        [sys.executable, "-c", "import main; print(main.books is None, main.oplog is None)"],
+        cwd=LAB, capture_output=True, text=True, check=True,
+    )
+    assert result.stdout.split() == ["True", "True"]
+
+
+# компоненты поднимаются на первом запросе, если lifespan не запускали
+@pytest.mark.asyncio
+async def test_first_request_starts(fresh_app):
+    app = fresh_app()
+    assert main.books is None
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver") as client:
+        res = await client.get("/books/1", headers={"Authorization": "Bearer user_token"})
+    assert res.status_code == 200
+    assert main.books is not None and main.password_verifier is not None
+
+
+# lifespan грузит компоненты при старте и закрывает журнал при выключении
+@pytest.mark.asyncio
+async def test_lifespan(fresh_app, tmp_path):
+    log = tmp_path / "books.log"
+    app = fresh_app(log_path=str(log), snapshot_path=str(tmp_path / "books.snap"))
+    async with main.lifespan(app):
+        await main.ensure_started()
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver") as client:
+            res = await client.post("/books", json={"title": "Новая", "author": "Маша"},
+                                    headers={"Authorization": "Bearer admin_token"})
+            assert res.status_code == 200
+    assert main.books is None and main.oplog is None
+    # журнал закрыт целым и в нём новая книжка
+    entries, valid = read_log(str(log))
+    assert valid == log.stat().st_size
+    assert entries[-1]["book"]["title"] == "Новая"
+
+
+# в production нет схемы и документации, в остальных - есть
+@pytest.mark.asyncio
+async def test_openapi_disabled_in_production(fresh_app):
+    for environment, status in (("production", 404), ("development", 200)):
+        app = fresh_app(environment=environment)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver") as client:
+            assert (await client.get("/openapi.json")).status_code == status
+            assert (await client.get("/docs")).status_code == status
+
+
+# живой uvicorn отвечает вскоре после запуска
+def test_first_response():
+    pytest.importorskip("uvicorn")
+    assert first_response() < FIRST_RESPONSE_BUDGET
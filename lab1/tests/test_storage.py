@@ -0,0 +1,109 @@
+# общие проверки для всех хранилищ (memory и sqlite)
+import random
+
+import pytest
+
+from settings import Settings
+from store import MissingBooks, VersionConflict, open_store
+from tests.test_indexes import random_book, reference_filter
+
+SEED = [
+    {"id": 1, "title": "Асинхронность на Python", "author": "Вася", "completed": True},
+    {"id": 2, "title": "Backend разработка на Python", "author": "Петя", "completed": False},
+]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    settings = Settings(backend=request.param, db_path=str(tmp_path / "books.db"), db_pool_size=2)
+    store = open_store(settings, SEED)
+    yield store
+    if hasattr(store, "close"):
+        store.close()
+
+
+# чтение, запись и удаление
+def test_crud(store):
+    assert store.get(1) == SEED[0]
+    book = store.add(title="Новая", author="Маша")
+    assert book["id"] == 3
+    assert store.get(3) == {"id": 3, "title": "Новая", "author": "Маша"}
+    assert store.update(3, title="Новая (2 изд.)")["title"] == "Новая (2 изд.)"
+    assert store.update(99, title="X") is None
+    assert store.delete(3) is True
+    assert store.delete(3) is False
+    assert store.get(3) is None
+    # удалённый айдишник больше не выдаётся
+    assert store.add(title="Ещё", author="Коля")["id"] == 4
+    assert len(store) == 3
+    assert [b["id"] for b in store] == [1, 2, 4]
+
+
+# страницы и курсоры
+def test_page(store):
+    store.add_many([{"title": str(i), "author": "a"} for i in range(5)])
+    assert [b["id"] for b in store.page(limit=2)] == [1, 2]
+    assert [b["id"] for b in store.page(after=2, offset=1, limit=2)] == [4, 5]
+    assert store.all() == list(store)
+
+
+# фильтр совпадает со старым перебором списка
+def test_filter_matches_reference(store):
+    rng = random.Random(7)
+    store.add_many([
+        {k: v for k, v in random_book(rng, 0).items() if k != "id"}
+        for _ in range(100)
+    ])
+    books = store.all()
+    for title in [None, "py", "python", "ПИТ", "ёж"]:
+        for author in [None, "вас", "МАША"]:
+            for completed in [None, True, False]:
+                expected = reference_filter(books, title, author, completed)
+                assert store.filter(title, author, completed) == expected
+    assert store.filter(title="python", limit=1, after=1) == reference_filter(books, "python")[1:2]
+
+
+# пакет с отсутствующей книжкой не применяется
+def test_bulk_is_atomic(store):
+    with pytest.raises(MissingBooks) as e:
+        store.update_many([(1, {"title": "X"}), (42, {"title": "Y"})])
+    assert e.value.ids == [42]
+    with pytest.raises(MissingBooks):
+        store.delete_many([2, 43])
+    assert store.all() == SEED
+    store.delete_many([1, 2])
+    assert len(store) == 0
+
+
+# версии растут с каждым изменением, запись со старой версией отклоняется
+def test_versions(store):
+    assert store.versioned(1) == (SEED[0], 1)
+    assert store.versioned(99) is None
+    store.update(1, expected_version={1}, title="X")
+    assert store.versioned(1)[1] == 2
+    with pytest.raises(VersionConflict) as e:
+        store.update(1, expected_version={1}, title="Y")
+    assert e.value.version == 2
+    with pytest.raises(VersionConflict):
+        store.delete(1, expected_version=set())
+    assert store.get(1)["title"] == "X"
+    assert store.update(99, expected_version={1}, title="Z") is None
+    assert store.delete(1, expected_version={2}) is True
+
+
+# поиск по словам: без учёта регистра и ё, лучшие сначала, после записей
+def test_search(store):
+    store.add(title="Python python PYTHON", author="Маша")
+    store.add(title="Ёжик в тумане", author="Козлов")
+    assert [b["id"] for b in store.search("python")] == [3, 1, 2]
+    assert [b["id"] for b in store.search("python", limit=1)] == [3]
+    found = store.search("ЕЖИК")
+    assert [(b["id"], b["title"]) for b in found] == [(4, "Ёжик в тумане")]
+    assert found[0]["score"] > 0
+    # слово автора тоже находится
+    assert [b["id"] for b in store.search("вася")] == [1]
+    assert store.search("") == [] and store.search("!!!") == []
+    store.update(4, title="Туман")
+    assert store.search("ёжик") == []
+    store.delete(3)
+    assert [b["id"] for b in store.search("python")] == [1, 2]
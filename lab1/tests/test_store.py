@@ -0,0 +1,92 @@
+import json
+
+from export import iter_export
+from serialization import encode_records
+from records import Book
+from store import BookStore
+
+
+# хранилище с парой книжек для тестов
+def make_store():
+    return BookStore([
+        {"id": 1, "title": "Первая", "author": "Вася", "completed": True},
+        {"id": 2, "title": "Вторая", "author": "Петя", "completed": False},
+    ])
+
+
+# поиск по айдишнику
+def test_get():
+    store = make_store()
+    assert store.get(2)["title"] == "Вторая"
+    assert store.get(3) is None
+
+
+# новые айдишники не повторяются даже после удаления
+def test_add_after_delete_gets_fresh_id():
+    store = make_store()
+    assert store.delete(2)
+    book = store.add(title="Третья", author="Маша")
+    assert book["id"] == 3
+    assert store.get(1)["title"] == "Первая"
+
+
+# обновление и удаление несуществующей книжки
+def test_update_and_delete_missing():
+    store = make_store()
+    assert store.update(9, title="X") is None
+    assert store.delete(9) is False
+    assert len(store) == 2
+
+
+# порядок обхода совпадает с порядком добавления
+def test_iteration_order_is_stable():
+    store = make_store()
+    store.add(title="Третья", author="Маша")
+    store.update(1, title="Первая (2 изд.)")
+    store.delete(2)
+    store.add(title="Четвёртая", author="Коля")
+    assert [b["id"] for b in store] == [1, 3, 4]
+
+
+# страницы по курсору и смещению, в том числе после удалений
+def test_page():
+    store = BookStore([{"id": i, "title": str(i), "author": "a"} for i in range(1, 11)])
+    store.delete(3)
+    store.delete(4)
+    assert [b["id"] for b in store.page(limit=3)] == [1, 2, 5]
+    assert [b["id"] for b in store.page(after=2, limit=2)] == [5, 6]
+    assert [b["id"] for b in store.page(after=6, offset=1)] == [8, 9, 10]
+    assert store.page(after=10) == []
+    assert [b["id"] for b in store.filter(author="a", after=5, limit=2)] == [6, 7]
+
+
+# выгрузка кусками не теряет книжки на границах пачек
+def test_iter_export_batches():
+    store = BookStore([{"id": i, "title": str(i), "author": "a"} for i in range(1, 8)])
+    store.delete(4)
+    body = b"".join(iter_export(store, "json", batch=2))
+    assert json.loads(body) == store.all()
+    lines = b"".join(iter_export(store, "ndjson", batch=3)).decode().splitlines()
+    assert [json.loads(line) for line in lines] == store.all()
+    assert b"".join(iter_export(BookStore(), "json")) == b"[]"
+
+
+# склейка готовых байтов даёт тот же JSON, изменённая книжка перекодируется
+def test_encoded_records():
+    store = BookStore([{"id": 1, "title": "Первая", "author": "Вася", "completed": True},
+                       {"id": 2, "title": "Вторая", "author": "Петя"}])
+    assert json.loads(encode_records(store, store.all())) == store.all()
+    store.update(1, title="Новая")
+    assert json.loads(store.encoded(store.get(1)))["title"] == "Новая"
+    assert encode_records(store, []) == b"[]"
+
+
+# книжки хранятся компактно, а наружу уходят словарями как раньше
+def test_book_records():
+    store = BookStore([{"id": 1, "title": "Первая", "author": "Вася", "completed": True}])
+    store.add(title="Вторая", author="".join(["Ва", "ся"]))
+    assert isinstance(store._records[1], Book)
+    # одинаковые авторы - одна строка
+    assert store._records[1].author is store._records[2].author
+    # у добавленной книжки нет completed, как и раньше
+    assert store.get(2) == {"id": 2, "title": "Вторая", "author": "Вася"}
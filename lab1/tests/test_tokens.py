@@ -0,0 +1,74 @@
+from tokens import HMACTokenBackend, StaticTokenBackend
+
+ADMIN = {"username": "admin", "is_admin": True}
+
+
+# выданный токен проверяется, чужая подпись - нет
+def test_hmac_issue_and_verify():
+    backend = HMACTokenBackend("secret")
+    token = backend.issue(ADMIN)
+    assert backend.verify(token) == ADMIN
+    # второй раз из кэша
+    assert backend.verify(token) == ADMIN
+    assert HMACTokenBackend("other").verify(token) is None
+    payload, _, signature = token.partition(".")
+    assert backend.verify(payload + "x." + signature) is None
+    assert backend.verify("мусор") is None
+
+
+# токен с не-ASCII символами (заголовок декодируется как latin-1) - просто неверный
+def test_hmac_non_ascii():
+    backend = HMACTokenBackend("secret")
+    payload, _, signature = backend.issue(ADMIN).partition(".")
+    assert backend.verify(f"{payload}.подпись") is None
+    assert backend.verify(f"{payload}.{signature}\xe9") is None
+    assert backend.verify("ключ.подпись") is None
+    backend.revoke("ключ.подпись")
+
+
+# истёкший токен не принимается, даже если он уже в кэше
+def test_hmac_expiry():
+    backend = HMACTokenBackend("secret", ttl=10)
+    token = backend.issue(ADMIN, now=1000)
+    assert backend.verify(token, now=1005) == ADMIN
+    assert backend.verify(token, now=1010) is None
+    assert backend.verify(token, now=1005) == ADMIN
+
+
+# отозванный токен перестаёт работать, остальные - нет
+def test_hmac_revoke():
+    backend = HMACTokenBackend("secret")
+    token = backend.issue(ADMIN)
+    other = backend.issue(ADMIN)
+    assert backend.verify(token) == ADMIN
+    backend.revoke(token)
+    assert backend.verify(token) is None
+    assert backend.verify(other) == ADMIN
+
+
+# кэш проверенных токенов ограничен
+def test_hmac_cache_is_bounded():
+    backend = HMACTokenBackend("secret", cache_size=3)
+    tokens = [backend.issue(ADMIN) for _ in range(10)]
+    for token in tokens:
+        assert backend.verify(token) == ADMIN
+    assert len(backend._cache._entries) == 3
+
+
+def test_static_backend():
+    backend = StaticTokenBackend({"admin_token": ADMIN})
+    assert backend.issue(ADMIN) == "admin_token"
+    assert backend.verify("admin_token") == ADMIN
+    assert backend.verify("nope") is None
+
+
+# пользователю без фиксированного токена выдаётся новый
+def test_static_backend_new_user():
+    users = {"admin_token": ADMIN}
+    backend = StaticTokenBackend(users)
+    user = {"username": "маша", "is_admin": False, "password_hash": "..."}
+    token = backend.issue(user)
+    assert token != "admin_token" and backend.issue(user) == token
+    assert backend.verify(token) == {"username": "маша", "is_admin": False}
+    # общий словарь токенов не меняется
+    assert users == {"admin_token": ADMIN}
@@ -0,0 +1,47 @@
+import asyncio
+
+from ratelimit import TokenBucketLimiter
+from users import PasswordVerifier, UserStore, hash_password, verify_password
+
+# дешёвые параметры scrypt чтобы тесты не тормозили
+FAST = {"n": 2**10, "r": 8, "p": 1}
+
+
+def test_hash_and_verify():
+    password_hash = hash_password("секрет", **FAST)
+    assert verify_password("секрет", password_hash)
+    assert not verify_password("Секрет", password_hash)
+    assert not verify_password("секрет", "md5$abc")
+    assert not verify_password("секрет", "мусор")
+
+
+# вход через пул потоков и блокировка после неудачных попыток
+def test_authenticate_and_rate_limit():
+    users = UserStore([{"username": "admin", "is_admin": True,
+                        "password_hash": hash_password("admin", **FAST)}])
+    verifier = PasswordVerifier(users, attempts=2, window=60)
+
+    async def run():
+        assert await verifier.authenticate("admin", "admin") == {"username": "admin", "is_admin": True}
+        assert verifier.retry_after("admin") == 0
+        assert await verifier.authenticate("admin", "wrong") is None
+        assert await verifier.authenticate("admin", "wrong") is None
+        assert verifier.retry_after("admin") > 0
+        # у других имён свой счётчик
+        assert verifier.retry_after("other") == 0
+        assert await verifier.authenticate("nobody", "x") is None
+
+    asyncio.run(run())
+
+
+def test_token_bucket():
+    limiter = TokenBucketLimiter(rate=1, burst=2, max_keys=2)
+    assert limiter.acquire("a", now=0) == 0
+    assert limiter.acquire("a", now=0) == 0
+    assert limiter.acquire("a", now=0) == 1.0
+    # жетоны восстанавливаются со временем
+    assert limiter.acquire("a", now=1) == 0
+    # лишние ключи вытесняются
+    limiter.acquire("b", now=1)
+    limiter.acquire("c", now=1)
+    assert len(limiter) == 2
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from store import BookStore, VersionConflict
+from writer import WriteQueue
+
+
+def make_queue(**kwargs):
+    store = BookStore([{"id": i, "title": f"Книга {i}", "author": "Автор"} for i in range(1, 11)])
+    calls = []
+
+    async def on_batch(*ids):
+        calls.append(ids)
+
+    return store, WriteQueue(on_batch, **kwargs), calls
+
+
+# одновременные записи уходят пачками, on_batch - раз на пачку
+@pytest.mark.asyncio
+async def test_batches():
+    store, queue, calls = make_queue()
+    results = await asyncio.gather(*(
+        queue.submit(store.update, [i % 10 + 1], i % 10 + 1, title=f"Новая {i}") for i in range(100)
+    ))
+    assert all(r is not None for r in results)
+    assert queue.items == 100
+    assert queue.batches == len(calls) < 100
+    assert {i for ids in calls for i in ids} == set(range(1, 11))
+    assert store.versioned(1)[1] == 11
+
+
+# ошибка одной записи не мешает остальным, результат - каждой свой
+@pytest.mark.asyncio
+async def test_per_item_results():
+    store, queue, calls = make_queue()
+    added, conflict, missing = await asyncio.gather(
+        queue.submit(store.add, None, title="Новая", author="Маша"),
+        queue.submit(store.update, [1], 1, expected_version=frozenset({5}), title="X"),
+        queue.submit(store.delete, [99], 99),
+        return_exceptions=True,
+    )
+    assert added["id"] == 11
+    assert isinstance(conflict, VersionConflict)
+    assert missing is False
+    # изменилась только новая книжка
+    assert calls == [(11,)]
+
+
+# маленький max_batch и новый цикл событий
+def test_max_batch_and_new_loop():
+    store, queue, calls = make_queue(max_batch=3)
+
+    async def burst():
+        await asyncio.gather(*(queue.submit(store.update, [1], 1, title="Y") for _ in range(9)))
+
+    asyncio.run(burst())
+    assert all(len(ids) == 1 for ids in calls) and queue.batches >= 3
+    asyncio.run(burst())
+    assert queue.items == 18
+
+
+# on_batch упал: ошибку получают только записи на которых он падает,
+# остальные применённые записи - свой результат
+@pytest.mark.asyncio
+async def test_on_batch_failure_per_item():
+    store, _, _ = make_queue()
+    calls = []
+
+    async def on_batch(*ids):
+        calls.append(ids)
+        if 2 in ids:
+            raise OSError("журнал недоступен")
+
+    queue = WriteQueue(on_batch)
+    first, second, conflict = await asyncio.gather(
+        queue.submit(store.update, [1], 1, title="Первая"),
+        queue.submit(store.update, [2], 2, title="Вторая"),
+        queue.submit(store.update, [3], 3, expected_version=frozenset({5}), title="X"),
+        return_exceptions=True,
+    )
+    assert first["title"] == "Первая"
+    assert isinstance(second, OSError)
+    assert isinstance(conflict, VersionConflict)
+    assert calls == [(1, 2), (1,), (2,)]
+
+
+# close дописывает всё что в очереди и останавливает задачу
+@pytest.mark.asyncio
+async def test_close_drains():
+    store, queue, calls = make_queue()
+    pending = [asyncio.ensure_future(queue.submit(store.update, [1], 1, title=f"Z{i}")) for i in range(20)]
+    await asyncio.sleep(0)
+    await queue.close()
+    assert all(task.done() and task.result() is not None for task in pending)
+    assert store.versioned(1)[1] == 21
+    assert queue._task.done()
+    with pytest.raises(RuntimeError):
+        await queue.submit(store.update, [1], 1, title="После")
@@ -0,0 +1,141 @@
+# выдача и проверка токенов для auth.py
+#
+# StaticTokenBackend - старое поведение: фиксированные токены из словаря.
+# HMACTokenBackend - подписанные токены со сроком жизни:
+#   base64(json с пользователем, сроком и jti).base64(hmac-sha256)
+# проверка подписи и разбор json на каждый запрос заметно дороже поиска в
+# словаре, поэтому уже проверенные токены лежат в небольшом LRU кэше. кэш
+# сам следит за сроком жизни, а отозванные токены (по jti) из него убираются
+
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from collections import OrderedDict
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+# фиксированные токены: токен -> пользователь
+# пользователям которых нет в словаре (есть только в users.json) при первом
+# входе выдаём новый случайный токен и запоминаем его до перезапуска
+class StaticTokenBackend:
+    def __init__(self, users):
+        self._users = dict(users)
+        self._tokens = {user["username"]: token for token, user in users.items()}
+
+    def issue(self, user):
+        token = self._tokens.get(user["username"])
+        if token is None:
+            token = secrets.token_urlsafe(24)
+            self._users[token] = {"username": user["username"], "is_admin": bool(user.get("is_admin"))}
+            self._tokens[user["username"]] = token
+        return token
+
+    def verify(self, token):
+        return self._users.get(token)
+
+    def revoke(self, token):
+        pass
+
+
+# проверенные токены: токен -> (пользователь, срок, jti)
+class VerifiedTokenCache:
+    def __init__(self, max_size=10_000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def get(self, token, now):
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            del self._entries[token]
+            return None
+        self._entries.move_to_end(token)
+        return entry
+
+    def put(self, token, entry):
+        self._entries[token] = entry
+        self._entries.move_to_end(token)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, token):
+        self._entries.pop(token, None)
+
+
+# подписанные токены со сроком жизни
+class HMACTokenBackend:
+    def __init__(self, secret, ttl=3600, cache_size=10_000):
+        self._key = secret.encode() if isinstance(secret, str) else secret
+        self.ttl = ttl
+        self._cache = VerifiedTokenCache(cache_size)
+        # отозванные jti -> до какого времени помнить (потом токен и так истёк)
+        self._revoked = {}
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self._key, payload.encode(), hashlib.sha256).digest())
+
+    def issue(self, user, now=None):
+        now = time.time() if now is None else now
+        payload = _b64encode(json.dumps({
+            "sub": user["username"],
+            "adm": bool(user.get("is_admin")),
+            "exp": int(now + self.ttl),
+            "jti": secrets.token_hex(8),
+        }).encode())
+        return f"{payload}.{self._sign(payload)}"
+
+    # полная проверка: подпись, формат и срок
+    def _decode(self, token, now):
+        payload, _, signature = token.partition(".")
+        # сравниваем байты: compare_digest на str с не-ASCII символами (а
+        # заголовок может их содержать) бросает TypeError вместо False
+        if not hmac.compare_digest(signature.encode(), self._sign(payload).encode()):
+            return None
+        try:
+            claims = json.loads(_b64decode(payload))
+            user = {"username": claims["sub"], "is_admin": claims["adm"]}
+            return user, claims["exp"], claims["jti"]
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def verify(self, token, now=None):
+        now = time.time() if now is None else now
+        entry = self._cache.get(token, now)
+        if entry is None:
+            entry = self._decode(token, now)
+            if entry is None or entry[1] <= now or entry[2] in self._revoked:
+                return None
+            self._cache.put(token, entry)
+        return entry[0]
+
+    def revoke(self, token, now=None):
+        now = time.time() if now is None else now
+        entry = self._decode(token, now)
+        self._cache.discard(token)
+        if entry is None:
+            return
+        self._revoked[entry[2]] = entry[1]
+        # забываем отзывы по уже истёкшим токенам
+        self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+
+
+# бэкенд токенов по настройкам
+def make_token_backend(settings, users):
+    if settings.auth_backend == "static":
+        return StaticTokenBackend(users)
+    if settings.auth_backend == "hmac":
+        # без общего ключа токены работают только в этом процессе
+        secret = settings.auth_secret or secrets.token_hex(32)
+        return HMACTokenBackend(secret, settings.auth_token_ttl, settings.auth_cache_size)
+    raise ValueError(f"Неизвестный бэкенд токенов: {settings.auth_backend}")
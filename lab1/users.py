@@ -0,0 +1,114 @@
+# пользователи и проверка паролей для POST /token
+#
+# пользователи с хэшами паролей лежат в users.json, а не в коде. пароли
+# хэшируются scrypt: это специально медленно (десятки миллисекунд), и если
+# считать хэш прямо в async обработчике, весь цикл событий стоит и чтение
+# книжек ждёт. поэтому проверка идёт в отдельном пуле потоков (scrypt
+# отпускает GIL), одновременно не больше login_concurrency проверок, а
+# неудачные попытки по одному имени ограничены TokenBucketLimiter
+#
+# формат хэша: scrypt$n$r$p$соль$хэш (соль и хэш в base64)
+#
+# добавить пользователя:
+#   python -c "from users import hash_password; print(hash_password('пароль'))"
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+
+from ratelimit import TokenBucketLimiter
+
+SCRYPT_N = 2**14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+
+def hash_password(password, salt=None, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    salt = os.urandom(16) if salt is None else salt
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p)
+    return "$".join([
+        "scrypt", str(n), str(r), str(p),
+        base64.b64encode(salt).decode(), base64.b64encode(digest).decode(),
+    ])
+
+
+def verify_password(password, password_hash):
+    try:
+        scheme, n, r, p, salt, digest = password_hash.split("$")
+        if scheme != "scrypt":
+            return False
+        expected = base64.b64decode(digest)
+        actual = hashlib.scrypt(
+            password.encode(), salt=base64.b64decode(salt),
+            n=int(n), r=int(r), p=int(p), dklen=len(expected),
+        )
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+# хэш для несуществующих имён: проверяем его, чтобы по времени ответа
+# нельзя было понять есть такой пользователь или нет
+@cache
+def _dummy_hash():
+    return hash_password("", salt=b"\0" * 16)
+
+
+# пользователи из json файла: [{"username", "is_admin", "password_hash"}, ...]
+class UserStore:
+    def __init__(self, users):
+        self._users = {user["username"]: user for user in users}
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def get(self, username):
+        return self._users.get(username)
+
+
+# проверка логина и пароля вне цикла событий
+class PasswordVerifier:
+    def __init__(self, users, workers=2, concurrency=4, attempts=5, window=60.0):
+        self.users = users
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="login")
+        self.concurrency = concurrency
+        self._semaphores = {}
+        # неудачные попытки по имени: attempts штук за window секунд
+        self.limiter = TokenBucketLimiter(rate=attempts / window, burst=attempts)
+
+    # семафор привязан к циклу событий, а в тестах циклы меняются
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            self._semaphores = {loop: asyncio.Semaphore(self.concurrency)}
+            semaphore = self._semaphores[loop]
+        return semaphore
+
+    # проверки которые уже идут доработают, новых пул не примет
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    # сколько секунд имени надо подождать перед следующей попыткой
+    def retry_after(self, username):
+        return self.limiter.retry_after(username)
+
+    # пользователь (без хэша) если пароль верный, иначе None
+    async def authenticate(self, username, password):
+        user = self.users.get(username)
+        password_hash = user["password_hash"] if user else _dummy_hash()
+        async with self._semaphore():
+            ok = await asyncio.get_running_loop().run_in_executor(
+                self._executor, verify_password, password, password_hash
+            )
+        if not ok or user is None:
+            self.limiter.acquire(username)
+            return None
+        return {"username": user["username"], "is_admin": user["is_admin"]}
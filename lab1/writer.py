@@ -0,0 +1,156 @@
+# очередь записи: одиночные записи админа применяются пачками
+#
+# раньше каждый POST/PUT/PATCH/DELETE сам сбрасывал кэш ответов и ждал
+# свой commit журнала. теперь обработчик кладёт запись в asyncio очередь и
+# ждёт future, а одна фоновая задача забирает из очереди всё что накопилось
+# (до max_batch штук), применяет к хранилищу подряд и один раз на пачку
+# вызывает on_batch (сброс кэша и журнал, см. books_changed в main.py).
+# future каждой записи получает свой результат или исключение
+# (VersionConflict и т.п.) только после on_batch, поэтому следующий запрос
+# того же клиента уже видит запись (read-your-writes), а при fsync=always
+# она уже на диске
+#
+# если хранилище ходит на диск (blocking), пачка целиком уходит в пул
+# потоков одним вызовом, а не по вызову на запись
+#
+# по умолчанию очередь выключена (settings.write_batch = 0): в
+# benchmarks/bench_writes.py записи сразу быстрее и по пропускной
+# способности, и по задержке - лишний переход через очередь и future
+# стоит больше, чем экономит общий сброс кэша на пачку
+#
+# задача писателя привязана к циклу событий и перезапускается, если
+# submit вызвали из другого цикла (так бывает в тестах)
+
+import asyncio
+
+from fastapi.concurrency import run_in_threadpool
+
+
+# какие книжки поменяла запись: ids если известны заранее, иначе книжка
+# из результата (добавление). None / False - ничего не поменялось
+def changed_ids(result, ids):
+    if not result:
+        return []
+    if ids is None:
+        return [result["id"]]
+    return list(ids)
+
+
+class WriteQueue:
+    # on_batch(*ids) - async, вызывается раз на пачку со всеми изменёнными
+    # книжками; is_blocking() - надо ли уводить пачку в пул потоков
+    def __init__(self, on_batch, is_blocking=lambda: False, max_batch=256):
+        self.on_batch = on_batch
+        self.is_blocking = is_blocking
+        self.max_batch = max_batch
+        self.batches = 0
+        self.items = 0
+        self._loop = None
+        self._queue = None
+        self._task = None
+        self._closed = False
+
+    def _ensure_running(self):
+        if self._closed:
+            raise RuntimeError("Очередь записи остановлена")
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    # ставим fn(*args, **kwargs) в очередь и ждём её результат
+    # ids - книжки которые она меняет (None - айдишник из результата)
+    async def submit(self, fn, ids, *args, **kwargs):
+        self._ensure_running()
+        future = self._loop.create_future()
+        self._queue.put_nowait((fn, ids, args, kwargs, future))
+        return await future
+
+    # при выключении: ждём записи из очереди, потом останавливаем задачу
+    # (после этого main.py закрывает журнал и хранилище)
+    async def close(self):
+        self._closed = True
+        if self._task is None or self._task.done():
+            return
+        if self._loop is not asyncio.get_running_loop():
+            return self.cancel()
+        await self._queue.join()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    # остановить задачу не дожидаясь очереди (можно звать из любого потока)
+    def cancel(self):
+        self._closed = True
+        if self._task is not None and not self._task.done() and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._task.cancel)
+
+    async def _run(self):
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await self._process(batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _process(self, batch):
+        # клиент ушёл не дождавшись - запись не применяем
+        batch = [item for item in batch if not item[4].cancelled()]
+        if not batch:
+            return
+        if self.is_blocking():
+            outcomes = await run_in_threadpool(self._apply, batch)
+        else:
+            outcomes = self._apply(batch)
+        await self._finish(outcomes)
+        self.batches += 1
+        self.items += len(batch)
+        for (*_, future), (ok, value, _) in zip(batch, outcomes):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    # on_batch раз на пачку. если он упал, записи в хранилище уже
+    # применены, поэтому ошибку пачки не раздаём всем: повторяем on_batch
+    # по записи, и каждая получает свой исход, как при записи сразу
+    async def _finish(self, outcomes):
+        # записи которые что-то поменяли (удаление несуществующей - нет)
+        applied = [i for i, (ok, _, ids) in enumerate(outcomes) if ok and ids]
+        # dict вместо set - чтобы сохранить порядок для журнала
+        changed = {}
+        for i in applied:
+            changed.update(dict.fromkeys(outcomes[i][2]))
+        try:
+            await self.on_batch(*changed)
+            return
+        except Exception as e:
+            if len(applied) <= 1:
+                if applied:
+                    outcomes[applied[0]] = (False, e, outcomes[applied[0]][2])
+                return
+        for i in applied:
+            ids = outcomes[i][2]
+            try:
+                await self.on_batch(*ids)
+            except Exception as e:
+                outcomes[i] = (False, e, ids)
+
+    # исходы записей: (успех, результат или исключение, изменённые книжки)
+    @staticmethod
+    def _apply(batch):
+        outcomes = []
+        for fn, ids, args, kwargs, _ in batch:
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                outcomes.append((False, e, ()))
+                continue
+            outcomes.append((True, result, changed_ids(result, ids)))
+        return outcomes